@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import sys
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -70,6 +71,7 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
                 'core.context_processors.unread_notifications_count',
+                'core.context_processors.realtime',
             ],
         },
     },
@@ -85,6 +87,22 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # Background imports write while web requests read/write; wait for
+            # the lock instead of failing immediately with "database is locked".
+            'timeout': 20,
+        },
+    }
+}
+
+
+# Shared by every worker process on the host (the default LocMemCache is per
+# process): pre-rendered conveniência comandas and the import template.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
     }
 }
 
@@ -129,6 +147,52 @@ STATICFILES_DIRS = [
     BASE_DIR / 'backend',
 ]
 
+MEDIA_URL = 'media/'
+MEDIA_ROOT = BASE_DIR / 'media'
+
+# Background spreadsheet imports (core.import_jobs).
+# When True, uploads are processed by an in-process thread pool; set to False
+# when running the dedicated worker (python manage.py run_import_worker).
+IMPORT_JOBS_USE_THREAD_POOL = True
+IMPORT_JOBS_MAX_WORKERS = 2
+# Seconds without progress after which a pending or processing import is
+# considered lost (its process was restarted): it is marked as failed and
+# re-uploads no longer reuse it.
+IMPORT_JOB_TIMEOUT = 60 * 30
+# Rows read, validated and committed per chunk while importing.
+IMPORT_CHUNK_SIZE = 2000
+
+# Comment notifications are written to an outbox and delivered in batches by an
+# in-process thread; set to False when running python manage.py run_notification_worker.
+NOTIFICATIONS_USE_THREAD_POOL = True
+NOTIFICATIONS_BATCH_SIZE = 200
+
+# Under the test runner nothing runs in background threads: the test client's
+# first request would otherwise start the pools against the test database, and
+# tests call notifications.deliver / import_jobs.process_job directly.
+if sys.argv[1:2] == ['test']:
+    IMPORT_JOBS_USE_THREAD_POOL = False
+    NOTIFICATIONS_USE_THREAD_POOL = False
+# Open SSE connections (notifications/stream/) also check the database this often,
+# for notifications delivered by another process. None disables polling.
+NOTIFICATIONS_SSE_POLL_INTERVAL = 10
+# Read notifications older than this are removed by python manage.py purge_notifications.
+NOTIFICATIONS_RETENTION_DAYS = 90
+
+# Open live agenda connections (agendamentos/stream/) also check the database this
+# often, for changes saved by another process. None disables polling.
+AGENDA_SSE_POLL_INTERVAL = 10
+# Agenda sync tokens never go past now minus this many seconds, so a change
+# stamped before waiting for the SQLite lock (up to the 'timeout' above) and
+# committed late is still sent. Keep it above that timeout.
+AGENDA_SYNC_MARGIN_SECONDS = 30
+
+# Live updates over Server-Sent Events (notifications/stream/ and agendamentos/stream/).
+# Each stream keeps its connection open, so it needs the ASGI application
+# (e.g. uvicorn backend.asgi:application). Under WSGI leave it False: the streams
+# answer 204 and the pages poll instead.
+REALTIME_SSE_ENABLED = False
+
 CORS_ALLOWED_ORIGINS = [
     'http://localhost:3000',
 ]
@@ -1,5 +1,7 @@
-from django.contrib import admin
-from .models import User, Cliente, Especificador, Orcamento, JornadaClienteHistorico
+from django.contrib import admin, messages
+from django.utils import timezone
+from .merge import merge_clientes, merge_especificadores, MergeError
+from .models import User, Cliente, Especificador, Orcamento, JornadaClienteHistorico, DuplicateCandidate, DuplicateScanRun, NotificationEvent, SerieAgendamento
 
 # Register your models here.
 admin.site.register(User)
@@ -8,7 +10,81 @@ admin.site.register(User)
 class ClienteAdmin(admin.ModelAdmin):
     list_display = ('nome_completo', 'cpf_cnpj', 'telefone', 'email')
     search_fields = ('nome_completo', 'cpf_cnpj', 'telefone', 'email')
+    actions = ['mesclar_selecionados']
+
+    @admin.action(description='Mesclar selecionados (mantém o mais antigo)')
+    def mesclar_selecionados(self, request, queryset):
+        _merge_selected(self, request, queryset, merge_clientes)
+
+@admin.register(Especificador)
+class EspecificadorAdmin(admin.ModelAdmin):
+    search_fields = ('nome_completo',)
+    actions = ['mesclar_selecionados']
+
+    @admin.action(description='Mesclar selecionados (mantém o mais antigo)')
+    def mesclar_selecionados(self, request, queryset):
+        _merge_selected(self, request, queryset, merge_especificadores)
+
+def _merge_selected(model_admin, request, queryset, merge):
+    ids = sorted(queryset.values_list('pk', flat=True))
+    if len(ids) < 2:
+        model_admin.message_user(request, 'Selecione ao menos dois registros para mesclar.', messages.WARNING)
+        return
+    try:
+        result = merge([(ids[0], loser) for loser in ids[1:]])
+    except MergeError as e:
+        model_admin.message_user(request, str(e), messages.ERROR)
+        return
+    model_admin.message_user(request, f'{result["mesclados"]} registros mesclados em #{ids[0]}.')
 
-admin.site.register(Especificador)
 admin.site.register(Orcamento)
-admin.site.register(JornadaClienteHistorico)
\ No newline at end of file
+admin.site.register(JornadaClienteHistorico)
+
+@admin.register(DuplicateCandidate)
+class DuplicateCandidateAdmin(admin.ModelAdmin):
+    list_display = ('cliente_a', 'cliente_b', 'score', 'motivos', 'status', 'criado_em')
+    list_filter = ('status', 'motivos')
+    search_fields = ('cliente_a__nome_completo', 'cliente_b__nome_completo')
+    list_select_related = ('cliente_a', 'cliente_b')
+    raw_id_fields = ('cliente_a', 'cliente_b')
+    actions = ['marcar_confirmado', 'marcar_descartado', 'mesclar_pares']
+
+    @admin.action(description='Marcar como duplicado confirmado')
+    def marcar_confirmado(self, request, queryset):
+        updated = queryset.update(status='confirmado')
+        self.message_user(request, f'{updated} pares marcados como confirmados.')
+
+    @admin.action(description='Descartar (não são duplicados)')
+    def marcar_descartado(self, request, queryset):
+        updated = queryset.update(status='descartado')
+        self.message_user(request, f'{updated} pares descartados.')
+
+    @admin.action(description='Mesclar pares selecionados (mantém o cliente A)')
+    def mesclar_pares(self, request, queryset):
+        pairs = list(queryset.exclude(status='descartado').values_list('cliente_a_id', 'cliente_b_id'))
+        try:
+            result = merge_clientes(pairs)
+        except MergeError as e:
+            self.message_user(request, str(e), messages.ERROR)
+            return
+        self.message_user(request, f'{result["mesclados"]} clientes mesclados.')
+
+@admin.register(DuplicateScanRun)
+class DuplicateScanRunAdmin(admin.ModelAdmin):
+    list_display = ('iniciado_em', 'finalizado_em', 'completo', 'clientes_analisados', 'comparacoes', 'candidatos_encontrados')
+
+@admin.register(NotificationEvent)
+class NotificationEventAdmin(admin.ModelAdmin):
+    list_display = ('comment', 'status', 'tentativas', 'criado_em', 'processado_em', 'ultimo_erro')
+    list_filter = ('status',)
+    actions = ['reenfileirar']
+
+    @admin.action(description='Reenfileirar eventos selecionados')
+    def reenfileirar(self, request, queryset):
+        count = queryset.update(status='pendente', tentativas=0, disponivel_em=timezone.now())
+        self.message_user(request, f'{count} eventos reenfileirados.')
+
+@admin.register(SerieAgendamento)
+class SerieAgendamentoAdmin(admin.ModelAdmin):
+    list_display = ('sala', 'motivo', 'inicio', 'duracao_minutos', 'intervalo_semanas', 'repetir_ate', 'responsavel')
+    list_filter = ('sala',)
@@ -0,0 +1,207 @@
+"""
+Feed da agenda e sincronização incremental.
+
+Cada agendamento guarda `atualizado_em` e cada exclusão deixa um registro em
+AgendamentoExcluido. O token de sincronização é um instante (em microssegundos
+desde a época) até o qual o cliente já recebeu tudo: quem tem um token recebe
+apenas os agendamentos criados, alterados ou excluídos depois dele, e nada se
+nenhuma alteração for posterior ao token.
+
+`atualizado_em` é carimbado antes de a escrita obter o lock do SQLite, então
+uma alteração pode ser gravada segundos depois de outra com carimbo maior. Por
+isso o token nunca passa de agora menos AGENDA_SYNC_MARGIN_SECONDS: alterações
+recentes são relidas na sincronização seguinte (o cliente as substitui pelo id)
+em vez de se perderem.
+
+O mesmo token serve de cursor para o fluxo em tempo real (core.realtime): cada
+alteração publica no canal AGENDA_CHANNEL do broker após o commit.
+
+Ocorrências de séries recorrentes entram no feed como eventos calculados (id
+'serie-<id da série>-<início em segundos>'); quando uma série muda, o cliente
+recarrega a janela em vez de receber as ocorrências uma a uma.
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db.models import Case, Max, Value, When
+from django.db.models.functions import Coalesce, Concat, Trim
+from django.utils import timezone
+
+from .models import Agendamento, AgendamentoExcluido, SerieAgendamento
+from . import recurrence
+from .notifications import Broker
+
+AGENDA_CHANNEL = 'agenda'
+
+broker = Broker()
+
+
+def publish_change():
+    """Acorda as conexões abertas do fluxo da agenda. Chamar após o commit."""
+    broker.publish([AGENDA_CHANNEL])
+
+
+MOTIVO_DISPLAY = dict(Agendamento.MOTIVO_CHOICES)
+STATUS_DISPLAY = dict(Agendamento.STATUS_CHOICES)
+CONVENIENCIA_STATUS_DISPLAY = dict(Agendamento.CONVENIENCIA_STATUS_CHOICES)
+
+EVENT_FIELDS = (
+    'id', 'sala', 'horario_inicio', 'horario_fim', 'quantidade_convidados', 'conveniencia', 'motivo',
+    'status', 'conveniencia_status', 'sala_limpa', 'responsavel_id',
+)
+
+
+def _event_rows(queryset):
+    """Projeção com os nomes já montados no banco (sem instanciar modelos)."""
+    return queryset.annotate(
+        cliente_nome=Coalesce('cliente__nome_completo', Value('N/A')),
+        especificador_nome=Coalesce('especificador__nome_completo', Value('N/A')),
+        # Same result as User.get_full_name()
+        responsavel_nome=Case(
+            When(responsavel__isnull=True, then=Value('N/A')),
+            default=Trim(Concat('responsavel__first_name', Value(' '), 'responsavel__last_name')),
+        ),
+    ).values(*EVENT_FIELDS, 'cliente_nome', 'especificador_nome', 'responsavel_nome')
+
+
+def _event(row):
+    """Evento no formato usado pelo FullCalendar e pela planta das salas."""
+    return {
+        'title': f'{row["motivo"]} - {row["cliente_nome"]}',
+        'start': row['horario_inicio'].isoformat(),
+        'end': row['horario_fim'].isoformat(),
+        'id': row['id'],
+        'sala': row['sala'],
+        'responsavel': row['responsavel_nome'],
+        'responsavel_id': row['responsavel_id'],
+        'cliente': row['cliente_nome'],
+        'especificador': row['especificador_nome'],
+        'convidados': row['quantidade_convidados'],
+        'conveniencia': row['conveniencia'],
+        'motivo': MOTIVO_DISPLAY.get(row['motivo'], row['motivo']),
+        'status': row['status'],
+        'status_display': STATUS_DISPLAY.get(row['status'], row['status']),
+        'conveniencia_status': row['conveniencia_status'],
+        'conveniencia_status_display': CONVENIENCIA_STATUS_DISPLAY.get(
+            row['conveniencia_status'], row['conveniencia_status']
+        ),
+        'sala_limpa': row['sala_limpa'],
+    }
+
+
+def events(queryset):
+    """Serializa um queryset de Agendamento em eventos."""
+    return [_event(row) for row in _event_rows(queryset)]
+
+
+def occurrence_id(serie_id, inicio):
+    return f'serie-{serie_id}-{int(inicio.timestamp())}'
+
+
+def series_events(start, end):
+    """Ocorrências calculadas das séries que tocam [start, end), no formato de evento."""
+    result = []
+    for serie, inicio, fim in recurrence.expand(start, end, select_related=True):
+        cliente_nome = serie.cliente.nome_completo if serie.cliente else 'N/A'
+        result.append({
+            'title': f'{serie.motivo} - {cliente_nome}',
+            'start': inicio.isoformat(),
+            'end': fim.isoformat(),
+            'id': occurrence_id(serie.pk, inicio),
+            'sala': serie.sala,
+            'responsavel': serie.responsavel.get_full_name() if serie.responsavel else 'N/A',
+            'responsavel_id': serie.responsavel_id,
+            'cliente': cliente_nome,
+            'especificador': serie.especificador.nome_completo if serie.especificador else 'N/A',
+            'convidados': serie.quantidade_convidados,
+            'conveniencia': False,
+            'motivo': MOTIVO_DISPLAY.get(serie.motivo, serie.motivo),
+            'status': 'agendado',
+            'status_display': STATUS_DISPLAY['agendado'],
+            'conveniencia_status': 'pendente',
+            'conveniencia_status_display': CONVENIENCIA_STATUS_DISPLAY['pendente'],
+            'sala_limpa': False,
+            'serie': serie.pk,
+            'ocorrencia': inicio.isoformat(),
+        })
+    return result
+
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+MICROSECOND = timedelta(microseconds=1)
+
+
+def _to_token(moment):
+    # Integer arithmetic: the token must compare exactly with the stored timestamps
+    return str((moment - EPOCH) // MICROSECOND) if moment else '0'
+
+
+def parse_token(token):
+    """Converte o token recebido do cliente em datetime. Retorna None se for inválido."""
+    try:
+        return EPOCH + int(token) * MICROSECOND
+    except (TypeError, ValueError, OverflowError):
+        return None
+
+
+def latest_change():
+    """Instante da última alteração ou exclusão (None se não houver): leituras de MAX sobre colunas indexadas."""
+    changed = Agendamento.objects.aggregate(ultimo=Max('atualizado_em'))['ultimo']
+    series = SerieAgendamento.objects.aggregate(ultimo=Max('atualizado_em'))['ultimo']
+    deleted = AgendamentoExcluido.objects.aggregate(ultimo=Max('excluido_em'))['ultimo']
+    return max(filter(None, [changed, series, deleted]), default=None)
+
+
+def sync_token():
+    """
+    Token atual. Tirado antes da leitura dos dados; alterações com carimbo dentro
+    da margem podem ainda não estar gravadas, então o token não passa dela.
+    """
+    latest = latest_change()
+    if latest is None:
+        return _to_token(None)
+    margin = timedelta(seconds=getattr(settings, 'AGENDA_SYNC_MARGIN_SECONDS', 30))
+    return _to_token(min(latest, timezone.now() - margin))
+
+
+def changed_since(since):
+    """Se há alguma alteração ou exclusão gravada depois de `since`."""
+    latest = latest_change()
+    return latest is not None and latest > since
+
+
+def _window(queryset, start, end):
+    return queryset.filter(horario_inicio__lt=end, horario_fim__gt=start)
+
+
+def snapshot(start, end):
+    """Todos os eventos que tocam a janela [start, end), inclusive ocorrências de séries."""
+    return events(_window(Agendamento.objects.all(), start, end)) + series_events(start, end)
+
+
+def changes_since(since, start=None, end=None):
+    """
+    Alterações depois de `since` para a janela [start, end) (sem janela, todas).
+    Retorna (alterados, removidos): eventos criados/alterados que tocam a janela e
+    ids que devem sair da tela (excluídos ou movidos para fora da janela).
+    """
+    alterados, removidos = [], []
+    for row in _event_rows(Agendamento.objects.filter(atualizado_em__gt=since)):
+        if start is None or (row['horario_inicio'] < end and row['horario_fim'] > start):
+            alterados.append(_event(row))
+        else:
+            removidos.append(row['id'])
+    removidos.extend(
+        AgendamentoExcluido.objects.filter(excluido_em__gt=since, agendamento_id__isnull=False).values_list(
+            'agendamento_id', flat=True
+        )
+    )
+    return alterados, removidos
+
+
+def series_changed_since(since):
+    """Se alguma série foi criada, alterada ou excluída depois de `since`."""
+    return (
+        SerieAgendamento.objects.filter(atualizado_em__gt=since).exists()
+        or AgendamentoExcluido.objects.filter(excluido_em__gt=since, serie_id__isnull=False).exists()
+    )
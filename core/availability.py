@@ -0,0 +1,281 @@
+"""
+Disponibilidade das salas de agendamento.
+
+Os agendamentos que ocupam sala (BLOCKING_STATUSES) de uma janela são lidos
+com uma única consulta por intervalo, agrupados por sala e ordenados por
+início. Sobre essas listas ordenadas, conflitos, horários livres e reservas
+sobrepostas são calculados com uma varredura linear (sweep), sem uma consulta
+por sala ou por horário. A grade de ocupação usa a mesma consulta e distribui
+os intervalos em faixas de tempo com NumPy.
+
+As ocorrências calculadas de séries recorrentes (core.recurrence) também
+ocupam sala; nelas o id é negativo (-id da série).
+"""
+import base64
+from bisect import bisect_left
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Agendamento
+from . import recurrence
+
+BLOCKING_STATUSES = ('agendado', 'realizado')
+
+# Business hours used by the free-slot finder (local time).
+DEFAULT_OPENING = time(8, 0)
+DEFAULT_CLOSING = time(20, 0)
+
+
+def salas():
+    return [value for value, _ in Agendamento.SALA_CHOICES]
+
+
+def business_hours():
+    return (
+        getattr(settings, 'AGENDA_HORARIO_ABERTURA', DEFAULT_OPENING),
+        getattr(settings, 'AGENDA_HORARIO_FECHAMENTO', DEFAULT_CLOSING),
+    )
+
+
+def _blocking(start, end):
+    return Agendamento.objects.filter(
+        status__in=BLOCKING_STATUSES, horario_inicio__lt=end, horario_fim__gt=start
+    )
+
+
+def load_intervals(start, end, salas=None, exclude_id=None):
+    """
+    Retorna {sala: [(inicio, fim, id), ...]} com os agendamentos que ocupam a
+    sala e tocam a janela [start, end), ordenados por início.
+    """
+    queryset = _blocking(start, end)
+    if salas is not None:
+        queryset = queryset.filter(sala__in=list(salas))
+    if exclude_id is not None:
+        queryset = queryset.exclude(pk=exclude_id)
+    intervals = defaultdict(list)
+    for sala, inicio, fim, pk in queryset.order_by('sala', 'horario_inicio').values_list(
+        'sala', 'horario_inicio', 'horario_fim', 'id'
+    ):
+        intervals[sala].append((inicio, fim, pk))
+    ocorrencias = recurrence.expand(start, end, salas=salas)
+    for ocorrencia in ocorrencias:
+        intervals[ocorrencia.serie.sala].append((ocorrencia.inicio, ocorrencia.fim, -ocorrencia.serie.pk))
+    if ocorrencias:
+        for items in intervals.values():
+            items.sort(key=lambda item: item[0])
+    return intervals
+
+
+def overlapping(intervals, inicio, fim):
+    """Intervalos (ordenados por início) que se sobrepõem a [inicio, fim)."""
+    # Only intervals starting before `fim` can overlap; a long booking that started
+    # earlier may still be open, so every one of them is checked for its end.
+    stop = bisect_left([item[0] for item in intervals], fim)
+    return [item for item in intervals[:stop] if item[1] > inicio]
+
+
+def find_conflicts(sala, inicio, fim, exclude_id=None):
+    """Agendamentos que impedem reservar `sala` em [inicio, fim). Retorna [(inicio, fim, id)]."""
+    intervals = load_intervals(inicio, fim, salas=[sala], exclude_id=exclude_id)
+    return overlapping(intervals.get(sala, []), inicio, fim)
+
+
+def _epoch_us(moments):
+    return np.array([int(moment.timestamp() * 1_000_000) for moment in moments], dtype=np.int64)
+
+
+def series_conflicts(sala, ocorrencias):
+    """
+    Ocorrências [(inicio, fim)] de uma nova série que colidem com o que já ocupa
+    `sala`. Uma única consulta cobre o período inteiro; a checagem de todas as
+    ocorrências é feita de uma vez sobre os intervalos ordenados.
+    Retorna [(inicio, fim, [(inicio, fim, id) conflitantes])].
+    """
+    if not ocorrencias:
+        return []
+    busy = load_intervals(ocorrencias[0][0], ocorrencias[-1][1], salas=[sala]).get(sala, [])
+    if not busy:
+        return []
+    busy_starts = _epoch_us(item[0] for item in busy)
+    # Latest end among the bookings that start at or before each position
+    busy_ends = np.maximum.accumulate(_epoch_us(item[1] for item in busy))
+    occ_starts = _epoch_us(inicio for inicio, _ in ocorrencias)
+    occ_ends = _epoch_us(fim for _, fim in ocorrencias)
+    candidates = np.searchsorted(busy_starts, occ_ends, side='left')
+    clashes = np.flatnonzero((candidates > 0) & (busy_ends[np.maximum(candidates - 1, 0)] > occ_starts))
+    return [
+        (ocorrencias[index][0], ocorrencias[index][1], overlapping(busy, *ocorrencias[index]))
+        for index in clashes
+    ]
+
+
+def conflict_message(conflicts):
+    horarios = ', '.join(
+        f'{timezone.localtime(inicio):%d/%m %H:%M}–{timezone.localtime(fim):%H:%M}' for inicio, fim, _ in conflicts
+    )
+    return f'Conflito de horário! A sala já está reservada neste período ({horarios}).'
+
+
+def double_bookings(intervals):
+    """
+    Varre os intervalos ordenados de cada sala e retorna os pares de
+    agendamentos sobrepostos: [(sala, id_a, id_b)].
+    """
+    found = []
+    for sala, items in intervals.items():
+        active = []  # (fim, id) of bookings still open at the sweep position
+        for inicio, fim, pk in items:
+            active = [(active_fim, active_pk) for active_fim, active_pk in active if active_fim > inicio]
+            found.extend((sala, active_pk, pk) for _, active_pk in active)
+            active.append((fim, pk))
+    return found
+
+
+def _day_window(day):
+    abertura, fechamento = business_hours()
+    tz = timezone.get_current_timezone()
+    return (
+        timezone.make_aware(datetime.combine(day, abertura), tz),
+        timezone.make_aware(datetime.combine(day, fechamento), tz),
+    )
+
+
+def free_slots(first_day, days, duracao, salas_filter=None):
+    """
+    Horários livres de pelo menos `duracao` (timedelta) em cada sala, dentro do
+    horário de funcionamento, de `first_day` por `days` dias.
+    Retorna ({sala: [(inicio, fim), ...]}, reservas sobrepostas já existentes
+    no período, no formato de double_bookings).
+    """
+    target = list(salas_filter) if salas_filter else salas()
+    windows = [_day_window(first_day + timedelta(days=offset)) for offset in range(days)]
+    intervals = load_intervals(windows[0][0], windows[-1][1], salas=target)
+
+    result = {}
+    for sala in target:
+        busy = intervals.get(sala, [])
+        position = 0
+        slots = []
+        for day_start, day_end in windows:
+            cursor = day_start
+            # Skip bookings that ended before this day opened
+            while position < len(busy) and busy[position][1] <= day_start:
+                position += 1
+            index = position
+            while index < len(busy) and busy[index][0] < day_end:
+                inicio, fim, _ = busy[index]
+                if inicio - cursor >= duracao:
+                    slots.append((cursor, inicio))
+                cursor = max(cursor, fim)
+                index += 1
+            if day_end - cursor >= duracao:
+                slots.append((cursor, day_end))
+        result[sala] = slots
+    return result, double_bookings(intervals)
+
+
+# Grid resolutions (minutes) must divide a day evenly.
+GRID_RESOLUTIONS = (5, 10, 15, 20, 30, 60, 120, 240, 1440)
+MAX_GRID_DAYS = 62
+
+
+def _run_lengths(row):
+    """Codifica uma linha de ids ocupantes (0 = livre) como [[início, tamanho, id], ...] só com trechos ocupados."""
+    if not row.any():
+        return []
+    boundaries = np.flatnonzero(np.diff(row)) + 1
+    starts = np.concatenate(([0], boundaries))
+    lengths = np.diff(np.concatenate((starts, [row.size])))
+    values = row[starts]
+    occupied = values != 0
+    return [[int(a), int(b), int(c)] for a, b, c in zip(starts[occupied], lengths[occupied], values[occupied])]
+
+
+def occupancy_grid(first_day, days, resolucao, formato='rle'):
+    """
+    Grade de ocupação das salas de `first_day` por `days` dias em faixas de
+    `resolucao` minutos (a partir de 00:00 local).
+
+    Cada sala é descrita por trechos ocupados [faixa inicial, nº de faixas, id do
+    agendamento] (formato 'rle') ou por um bitmap compactado em base64, um bit
+    por faixa (formato 'bitmap'). No formato 'rle', status e título de cada id
+    referenciado. Inclui também o número de agendamentos por dia.
+    """
+    tz = timezone.get_current_timezone()
+    start = timezone.make_aware(datetime.combine(first_day, time.min), tz)
+    end = timezone.make_aware(datetime.combine(first_day + timedelta(days=days), time.min), tz)
+    slots_per_day = 1440 // resolucao
+    total_slots = slots_per_day * days
+    sala_list = salas()
+    sala_index = {sala: position for position, sala in enumerate(sala_list)}
+
+    rows = list(
+        _blocking(start, end).filter(sala__in=sala_list)
+        .annotate(cliente_nome=Coalesce('cliente__nome_completo', Value('N/A')))
+        .values_list('sala', 'horario_inicio', 'horario_fim', 'id', 'status', 'motivo', 'cliente_nome')
+    )
+    rows.extend(
+        (
+            ocorrencia.serie.sala, ocorrencia.inicio, ocorrencia.fim, -ocorrencia.serie.pk, 'agendado',
+            ocorrencia.serie.motivo, ocorrencia.serie.cliente.nome_completo if ocorrencia.serie.cliente else 'N/A',
+        )
+        for ocorrencia in recurrence.expand(start, end, salas=sala_list, select_related=True)
+    )
+    # Ids are painted into the grid; 0 marks a free slot and series occurrences are negative
+    grid = np.zeros((len(sala_list), total_slots), dtype=np.int64)
+    per_day = np.zeros(days, dtype=np.int64)
+    status, titulos = {}, {}
+    if rows:
+        salas_idx = np.array([sala_index[row[0]] for row in rows])
+        offsets = np.array(
+            [[(row[1] - start).total_seconds(), (row[2] - start).total_seconds()] for row in rows]
+        ) / 60.0
+        ids = np.array([row[3] for row in rows], dtype=np.int64)
+        # Bucket every booking into the slots it touches, clipped to the grid
+        first_slot = np.clip(np.floor(offsets[:, 0] / resolucao), 0, total_slots).astype(np.int64)
+        last_slot = np.clip(np.ceil(offsets[:, 1] / resolucao), 0, total_slots).astype(np.int64)
+        order = np.argsort(first_slot, kind='stable')
+        for row_position in order:
+            grid[salas_idx[row_position], first_slot[row_position]:last_slot[row_position]] = ids[row_position]
+
+        # Bookings per day: every day each booking touches
+        first_day_idx = first_slot // slots_per_day
+        last_day_idx = np.maximum(last_slot - 1, first_slot) // slots_per_day
+        coverage = np.zeros(days + 1, dtype=np.int64)
+        np.add.at(coverage, first_day_idx, 1)
+        np.add.at(coverage, np.minimum(last_day_idx + 1, days), -1)
+        per_day = np.cumsum(coverage)[:days]
+        status = {row[3]: row[4] for row in rows}
+        # Same title as the agenda feed (core.agenda)
+        titulos = {row[3]: f'{row[5]} - {row[6]}' for row in rows}
+
+    salas_payload = []
+    for sala, row in zip(sala_list, grid):
+        if formato == 'bitmap':
+            packed = np.packbits(row != 0)
+            salas_payload.append({'sala': sala, 'bitmap': base64.b64encode(packed.tobytes()).decode('ascii')})
+        else:
+            salas_payload.append({'sala': sala, 'rle': _run_lengths(row)})
+
+    return {
+        'inicio': start.isoformat(),
+        'dias': days,
+        'resolucao': resolucao,
+        'faixas_por_dia': slots_per_day,
+        'formato': formato,
+        'salas': salas_payload,
+        # Status of the bookings referenced by the runs (bitmaps carry no ids)
+        'status': {} if formato == 'bitmap' else {str(pk): value for pk, value in status.items()},
+        'titulos': {} if formato == 'bitmap' else {str(pk): value for pk, value in titulos.items()},
+        'agendamentos_por_dia': [
+            {'data': (first_day + timedelta(days=offset)).isoformat(), 'total': int(total)}
+            for offset, total in enumerate(per_day)
+        ],
+    }
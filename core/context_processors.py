@@ -1,7 +1,13 @@
-from .models import Notification
+from django.conf import settings
+
+from . import notifications
 
 def unread_notifications_count(request):
     if request.user.is_authenticated:
-        count = Notification.objects.filter(recipient=request.user, is_read=False).count()
+        count = notifications.unread_count(request.user.pk)
         return {'unread_notifications_count': count}
     return {'unread_notifications_count': 0}
+
+def realtime(request):
+    # Pages open the SSE streams only when served by ASGI; otherwise they poll
+    return {'realtime_sse_enabled': getattr(settings, 'REALTIME_SSE_ENABLED', False)}
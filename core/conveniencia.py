@@ -0,0 +1,182 @@
+"""
+Pedidos de conveniência dos agendamentos.
+
+O pedido continua salvo em Agendamento.conveniencia_pedido (o JSON usado pela
+interface), mas a cada gravação é normalizado em linhas de
+ItemPedidoConveniencia, uma por item com sua quantidade. Assim os totais de
+produção da copa saem de um único GROUP BY, sem ler e interpretar o JSON de
+cada pedido. Pedidos antigos são convertidos pelo comando
+backfill_conveniencia_items.
+
+A comanda exibida no painel da copa também é montada uma única vez por versão
+do pedido (Agendamento.pedido_versao) e guardada em cache; cada renderização
+do painel é só uma leitura do cache.
+"""
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate, TruncHour, TruncWeek
+from django.utils import timezone
+from django.utils.html import format_html
+
+from .models import Agendamento, ItemPedidoConveniencia
+
+BACKFILL_BATCH_SIZE = 500
+COMANDA_CACHE_TIMEOUT = 60 * 60 * 24 * 7
+
+COMANDA_ITEM = (
+    '<li class="list-group-item d-flex justify-content-between align-items-center bg-transparent border-bottom px-0">'
+    '{} <span class="badge bg-secondary rounded-pill">{}</span></li>'
+)
+
+# Period used to group the production summary.
+AGRUPAMENTOS = {
+    'dia': TruncDate,
+    'semana': TruncWeek,
+    'horario': TruncHour,
+}
+
+
+def _quantity(value):
+    try:
+        return max(int(value), 1)
+    except (TypeError, ValueError):
+        return 1
+
+
+def normalize_pedido(data):
+    """
+    Converte um pedido em qualquer dos formatos já gravados para
+    [{'item': nome, 'quantity': n}], somando itens repetidos:
+
+    - lista de dicionários: [{'item' ou 'name': ..., 'quantity': n}];
+    - dicionário de categorias (formato antigo): {'Bebidas': ['Água', {'name': ..., 'quantity': n}]}.
+    """
+    if isinstance(data, dict):
+        entries = [entry for items in data.values() if isinstance(items, list) for entry in items]
+    elif isinstance(data, list):
+        entries = data
+    else:
+        return []
+
+    totals = {}
+    for entry in entries:
+        if isinstance(entry, dict):
+            name, quantity = entry.get('item') or entry.get('name'), _quantity(entry.get('quantity', 1))
+        else:
+            name, quantity = entry, 1
+        name = str(name).strip() if name else ''
+        if name:
+            totals[name] = totals.get(name, 0) + quantity
+    return [{'item': name, 'quantity': quantity} for name, quantity in totals.items()]
+
+
+def _build_items(agendamento_id, pedido):
+    return [
+        ItemPedidoConveniencia(agendamento_id=agendamento_id, item=entry['item'][:100], quantidade=entry['quantity'])
+        for entry in normalize_pedido(pedido)
+    ]
+
+
+def sync_items(agendamento):
+    """Regrava os itens normalizados do pedido do agendamento."""
+    with transaction.atomic():
+        ItemPedidoConveniencia.objects.filter(agendamento=agendamento).delete()
+        ItemPedidoConveniencia.objects.bulk_create(_build_items(agendamento.pk, agendamento.conveniencia_pedido))
+
+
+def backfill_items(batch_size=BACKFILL_BATCH_SIZE):
+    """
+    Normaliza os pedidos de todos os agendamentos, em lotes por id.
+    Retorna (pedidos, itens) gravados.
+    """
+    pedidos = itens = 0
+    last_id = 0
+    while True:
+        rows = list(
+            Agendamento.objects.filter(pk__gt=last_id, conveniencia_pedido__isnull=False)
+            .order_by('pk').values_list('pk', 'conveniencia_pedido')[:batch_size]
+        )
+        if not rows:
+            break
+        items = [item for pk, pedido in rows for item in _build_items(pk, pedido)]
+        with transaction.atomic():
+            ItemPedidoConveniencia.objects.filter(agendamento_id__in=[pk for pk, _ in rows]).delete()
+            ItemPedidoConveniencia.objects.bulk_create(items, batch_size=batch_size)
+        pedidos += len(rows)
+        itens += len(items)
+        last_id = rows[-1][0]
+    return pedidos, itens
+
+
+def production_summary(start, end, agrupamento='dia'):
+    """
+    Quantidade de cada item a preparar por período (dia, semana ou horário) para
+    os agendamentos com conveniência que começam em [start, end) e não foram
+    cancelados. Retorna [{'periodo', 'item', 'quantidade', 'pedidos'}] ordenado.
+    """
+    trunc = AGRUPAMENTOS[agrupamento]
+    return list(
+        ItemPedidoConveniencia.objects.filter(
+            agendamento__horario_inicio__gte=start,
+            agendamento__horario_inicio__lt=end,
+            agendamento__conveniencia=True,
+        )
+        .exclude(agendamento__status='cancelado')
+        .annotate(periodo=trunc('agendamento__horario_inicio', tzinfo=timezone.get_current_timezone()))
+        .values('periodo', 'item')
+        .annotate(quantidade=Sum('quantidade'), pedidos=Count('agendamento_id'))
+        .order_by('periodo', 'item')
+    )
+
+
+def compile_comanda(pedido):
+    """HTML da comanda (lista de itens com quantidade) de um pedido em qualquer formato."""
+    items = normalize_pedido(pedido)
+    if not items:
+        return ''
+    return ''.join([
+        '<ul class="list-group list-group-flush comanda-list">',
+        *(format_html(COMANDA_ITEM, entry['item'], entry['quantity']) for entry in items),
+        '</ul>',
+    ])
+
+
+def _comanda_key(agendamento_id, versao):
+    return f'conveniencia:comanda:{agendamento_id}:{versao}'
+
+
+def comanda_html(agendamento):
+    """
+    Comanda do agendamento, do cache da versão atual do pedido. O pedido só é
+    lido (e o HTML montado) quando a versão ainda não está em cache.
+    """
+    key = _comanda_key(agendamento.pk, agendamento.pedido_versao)
+    html = cache.get(key)
+    if html is None:
+        html = compile_comanda(agendamento.conveniencia_pedido)
+        cache.set(key, html, COMANDA_CACHE_TIMEOUT)
+    return html
+
+
+def attach_comandas(agendamentos):
+    """
+    Preenche `agendamento.comanda` (HTML) para uma lista de agendamentos com
+    uma leitura do cache e, para as versões que ainda não estão nele, uma única
+    consulta aos pedidos. Os agendamentos podem vir com conveniencia_pedido adiado.
+    """
+    keys = {agendamento.pk: _comanda_key(agendamento.pk, agendamento.pedido_versao) for agendamento in agendamentos}
+    cached = cache.get_many(keys.values())
+    missing = [pk for pk, key in keys.items() if key not in cached]
+    if missing:
+        pedidos = dict(Agendamento.objects.filter(pk__in=missing).values_list('pk', 'conveniencia_pedido'))
+        compiled = {keys[pk]: compile_comanda(pedidos.get(pk)) for pk in missing}
+        cache.set_many(compiled, COMANDA_CACHE_TIMEOUT)
+        cached.update(compiled)
+    for agendamento in agendamentos:
+        agendamento.comanda = cached[keys[agendamento.pk]]
+    return agendamentos
+
+
+def forget_comanda(agendamento_id, versao):
+    cache.delete(_comanda_key(agendamento_id, versao))
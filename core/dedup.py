@@ -0,0 +1,176 @@
+"""
+Detecção de clientes duplicados por blocagem.
+
+Cada cliente recebe um conjunto de chaves de bloco (tokens normalizados do nome,
+dígitos do CPF/CNPJ, telefone e email). A pontuação de similaridade só é
+calculada entre clientes que compartilham ao menos um bloco, o que mantém o
+custo da varredura próximo de linear em vez de O(n²).
+"""
+import re
+import unicodedata
+from collections import defaultdict
+from difflib import SequenceMatcher
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Cliente, DuplicateCandidate, DuplicateScanRun
+
+DEFAULT_THRESHOLD = 0.82
+
+# Blocks bigger than this come from very common keys (e.g. "silva") and would
+# bring back quadratic behaviour, so they are skipped.
+MAX_BLOCK_SIZE = 200
+
+NAME_STOPWORDS = {'da', 'de', 'do', 'das', 'dos', 'e', 'ltda', 'me', 'sa', 'eireli'}
+
+
+def normalize_text(value):
+    """Remove acentos, pontuação e caixa de um texto livre."""
+    if not value:
+        return ''
+    value = unicodedata.normalize('NFKD', str(value))
+    value = ''.join(ch for ch in value if not unicodedata.combining(ch))
+    value = re.sub(r'[^a-z0-9]+', ' ', value.lower())
+    return value.strip()
+
+
+def name_tokens(nome):
+    return [t for t in normalize_text(nome).split() if t not in NAME_STOPWORDS]
+
+
+def only_digits(value):
+    return re.sub(r'\D', '', value or '')
+
+
+def blocking_keys(record):
+    """Retorna as chaves de bloco de um cliente (dict com os campos de Cliente)."""
+    keys = set()
+    tokens = record['tokens']
+    if tokens:
+        keys.add(f'nome:{tokens[0]}|{tokens[-1]}')
+        keys.add(f'nome_ordenado:{" ".join(sorted(tokens))}')
+        if len(tokens) > 1:
+            # Catches typos in the surname: "joao silva" vs "joao silvva"
+            keys.add(f'nome_prefixo:{tokens[0]}|{tokens[-1][:4]}')
+    if len(record['doc']) >= 11:
+        keys.add(f'doc:{record["doc"]}')
+    if len(record['telefone']) >= 8:
+        keys.add(f'tel:{record["telefone"][-8:]}')
+    if record['email']:
+        keys.add(f'email:{record["email"]}')
+    return keys
+
+
+def _prepare(row):
+    tokens = name_tokens(row['nome_completo'])
+    return {
+        'id': row['id'],
+        'tokens': tokens,
+        'nome': ' '.join(tokens),
+        'doc': only_digits(row['cpf_cnpj']),
+        'telefone': only_digits(row['telefone']),
+        'email': (row['email'] or '').strip().lower(),
+    }
+
+
+def score_pair(a, b):
+    """
+    Calcula a similaridade entre dois clientes preparados.
+    Retorna (score, motivos), com score entre 0 e 1.
+    """
+    motivos = []
+    tokens_a, tokens_b = set(a['tokens']), set(b['tokens'])
+    if tokens_a and tokens_b:
+        jaccard = len(tokens_a & tokens_b) / len(tokens_a | tokens_b)
+        ratio = SequenceMatcher(None, a['nome'], b['nome']).ratio()
+        score = 0.5 * jaccard + 0.5 * ratio
+    else:
+        score = 0.0
+    if score >= 0.8:
+        motivos.append('nome')
+
+    if a['doc'] and b['doc']:
+        if a['doc'] == b['doc']:
+            score = max(score, 0.97)
+            motivos.append('cpf_cnpj')
+        else:
+            # Different documents are strong evidence of different people
+            score *= 0.5
+    if a['email'] and a['email'] == b['email']:
+        score = min(1.0, score + 0.15)
+        motivos.append('email')
+    if len(a['telefone']) >= 8 and a['telefone'][-8:] == b['telefone'][-8:]:
+        score = min(1.0, score + 0.15)
+        motivos.append('telefone')
+    return score, motivos
+
+
+def find_duplicates(full=False, threshold=DEFAULT_THRESHOLD):
+    """
+    Executa uma varredura de duplicados e grava os candidatos em DuplicateCandidate.
+
+    Na varredura incremental apenas os clientes alterados desde a última execução
+    concluída são comparados (contra toda a base). Pares já revisados
+    (confirmados ou descartados) são preservados.
+    """
+    last_run = DuplicateScanRun.objects.filter(finalizado_em__isnull=False).first()
+    run = DuplicateScanRun.objects.create(completo=full or last_run is None)
+
+    records = {row['id']: _prepare(row) for row in Cliente.objects.values(
+        'id', 'nome_completo', 'cpf_cnpj', 'telefone', 'email'
+    )}
+
+    if run.completo:
+        changed_ids = set(records)
+    else:
+        changed = Cliente.objects.filter(atualizado_em__gte=last_run.iniciado_em)
+        changed_ids = set(changed.values_list('id', flat=True))
+
+    blocks = defaultdict(list)
+    for record in records.values():
+        for key in blocking_keys(record):
+            blocks[key].append(record['id'])
+
+    seen = set()
+    candidates = []
+    comparacoes = 0
+    for ids in blocks.values():
+        if len(ids) < 2 or len(ids) > MAX_BLOCK_SIZE:
+            continue
+        if not changed_ids.intersection(ids):
+            continue
+        ids = sorted(ids)
+        for i, id_a in enumerate(ids):
+            for id_b in ids[i + 1:]:
+                if id_a not in changed_ids and id_b not in changed_ids:
+                    continue
+                if (id_a, id_b) in seen:
+                    continue
+                seen.add((id_a, id_b))
+                comparacoes += 1
+                score, motivos = score_pair(records[id_a], records[id_b])
+                if score >= threshold:
+                    candidates.append(DuplicateCandidate(
+                        cliente_a_id=id_a,
+                        cliente_b_id=id_b,
+                        score=round(score, 4),
+                        motivos=', '.join(motivos),
+                        scan=run,
+                    ))
+
+    with transaction.atomic():
+        # Pending pairs touching a changed client are rescored; reviewed pairs stay.
+        stale = DuplicateCandidate.objects.filter(status='pendente')
+        if not run.completo:
+            stale = stale.filter(Q(cliente_a__in=changed) | Q(cliente_b__in=changed))
+        stale.delete()
+        DuplicateCandidate.objects.bulk_create(candidates, batch_size=500, ignore_conflicts=True)
+
+        run.clientes_analisados = len(changed_ids)
+        run.comparacoes = comparacoes
+        run.candidatos_encontrados = len(candidates)
+        run.finalizado_em = timezone.now()
+        run.save()
+    return run
@@ -0,0 +1,245 @@
+"""
+Importações de orçamentos em segundo plano.
+
+O upload apenas grava o arquivo e cria um ImportJob; o processamento acontece
+fora da requisição, em um pool de threads do próprio processo
+(IMPORT_JOBS_USE_THREAD_POOL) ou no worker dedicado `run_import_worker`.
+Progresso, contagens e erros por linha ficam persistidos no job.
+
+Cada job guarda o SHA-256 do arquivo: reenviar o mesmo conteúdo no mesmo modo
+devolve o job anterior (e seu resultado) sem reprocessar, a menos que o
+reprocessamento seja forçado. Só são reaproveitados jobs concluídos ou ainda em
+andamento com progresso nos últimos IMPORT_JOB_TIMEOUT (`atualizado_em`, renovado
+a cada bloco); um job parado há mais tempo foi perdido junto com o processo que
+o executava. Esses jobs são marcados como erro
+quando o worker inicia ou, no modo pool de threads, na primeira requisição de
+cada processo, que também reagenda os jobs ainda pendentes.
+"""
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import ImportJob
+from . import importer
+
+logger = logging.getLogger(__name__)
+
+# A job still pending or processing after this long is considered lost.
+IMPORT_JOB_TIMEOUT = 60 * 30
+
+_executor = None
+_started = False
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, 'IMPORT_JOBS_MAX_WORKERS', 2),
+            thread_name_prefix='import-job',
+        )
+    return _executor
+
+
+def file_sha256(uploaded_file):
+    """SHA-256 do conteúdo do arquivo, calculado em blocos (sem carregar o arquivo inteiro)."""
+    digest = hashlib.sha256()
+    for chunk in uploaded_file.chunks():
+        digest.update(chunk)
+    uploaded_file.seek(0)
+    return digest.hexdigest()
+
+
+def _stale_before():
+    return timezone.now() - timedelta(seconds=getattr(settings, 'IMPORT_JOB_TIMEOUT', IMPORT_JOB_TIMEOUT))
+
+
+def find_previous_import(sha256, modo):
+    """Último job do mesmo conteúdo e modo que terminou bem ou que está em andamento há pouco tempo."""
+    recent = _stale_before()
+    return ImportJob.objects.filter(sha256=sha256, modo=modo).filter(
+        Q(status='concluido')
+        | Q(status='pendente', criado_em__gte=recent)
+        | Q(status='processando', atualizado_em__gte=recent)
+    ).first()
+
+
+def enqueue_import(uploaded_file, user, modo='inserir', force=False):
+    """
+    Cria o ImportJob para o arquivo enviado e agenda seu processamento.
+    Retorna (job, reaproveitado): se o mesmo arquivo já foi processado nesse modo
+    e `force` é False, o job anterior é devolvido e nada é agendado.
+    """
+    sha256 = file_sha256(uploaded_file)
+    if not force:
+        previous = find_previous_import(sha256, modo)
+        if previous:
+            return previous, True
+    job = ImportJob.objects.create(
+        criado_por=user,
+        arquivo=uploaded_file,
+        nome_arquivo=uploaded_file.name,
+        sha256=sha256,
+        modo=modo,
+    )
+    if getattr(settings, 'IMPORT_JOBS_USE_THREAD_POOL', True):
+        transaction.on_commit(lambda: _get_executor().submit(_run_in_thread, job.pk))
+    return job, False
+
+
+def recover_stale_jobs():
+    """
+    Marca como erro os jobs em processamento sem progresso há mais de
+    IMPORT_JOB_TIMEOUT (o processo que os executava foi encerrado). Retorna quantos.
+    """
+    return ImportJob.objects.filter(status='processando', atualizado_em__lt=_stale_before()).update(
+        status='erro',
+        finalizado_em=timezone.now(),
+        atualizado_em=timezone.now(),
+        mensagem='A importação foi interrompida antes de terminar. Envie o arquivo novamente.',
+    )
+
+
+def start():
+    """No modo pool de threads, recupera os jobs perdidos num reinício (uma vez por processo)."""
+    global _started
+    if _started or not getattr(settings, 'IMPORT_JOBS_USE_THREAD_POOL', True):
+        return
+    _started = True
+    _get_executor().submit(_resume_jobs)
+
+
+def _resume_jobs():
+    close_old_connections()
+    try:
+        recover_stale_jobs()
+        # Jobs queued in a pool that died with its process; claim_job keeps each one running once
+        for job_id in ImportJob.objects.filter(status='pendente').order_by('criado_em').values_list('pk', flat=True):
+            _get_executor().submit(_run_in_thread, job_id)
+    except Exception:
+        logger.exception('Resuming import jobs failed')
+    finally:
+        close_old_connections()
+
+
+def _run_in_thread(job_id):
+    close_old_connections()
+    try:
+        process_job(job_id)
+    finally:
+        close_old_connections()
+
+
+def claim_job(job_id):
+    """Marca o job como 'processando' se ainda estiver pendente. Retorna True se conseguiu."""
+    now = timezone.now()
+    return ImportJob.objects.filter(pk=job_id, status='pendente').update(
+        status='processando', iniciado_em=now, atualizado_em=now
+    ) == 1
+
+
+def claim_next_job():
+    """Reserva o job pendente mais antigo (usado pelo worker dedicado)."""
+    for job_id in ImportJob.objects.filter(status='pendente').order_by('criado_em').values_list('pk', flat=True)[:5]:
+        if claim_job(job_id):
+            return job_id
+    return None
+
+
+def process_job(job_id, claimed=False):
+    if not claimed and not claim_job(job_id):
+        return
+    job = ImportJob.objects.get(pk=job_id)
+
+    def progress(result, processed, total):
+        ImportJob.objects.filter(pk=job_id).update(
+            atualizado_em=timezone.now(),
+            total_linhas=total,
+            linhas_processadas=processed,
+            criados=result.criados,
+            atualizados=result.atualizados,
+            inalterados=result.inalterados,
+            ignorados=result.ignorados,
+        )
+
+    chunk_size = getattr(settings, 'IMPORT_CHUNK_SIZE', importer.IMPORT_CHUNK_SIZE)
+    try:
+        with job.arquivo.open('rb') as f:
+            if job.modo == 'validar':
+                result, report = importer.validate_file(f, progress=progress, chunk_size=chunk_size)
+            else:
+                result = importer.import_file(
+                    f, progress=progress, chunk_size=chunk_size, upsert=job.modo == 'upsert'
+                )
+    except importer.ImportFormatError as e:
+        _finish(job_id, status='erro', mensagem=str(e))
+        return
+    except Exception as e:
+        logger.exception('Import job %s failed', job_id)
+        _finish(job_id, status='erro', mensagem=f'Ocorreu um erro ao processar o arquivo: {e}')
+        return
+
+    summary = result.as_dict()
+    erros = summary.pop('erros')
+    if job.modo == 'validar':
+        if result.erros:
+            job.relatorio.save(f'erros_{job.pk}.xlsx', ContentFile(report.getvalue()), save=False)
+            ImportJob.objects.filter(pk=job_id).update(relatorio=job.relatorio.name)
+        mensagem = f'Validação concluída: {result.validos} de {result.total} linhas válidas. Nada foi gravado.'
+    elif job.modo == 'upsert':
+        mensagem = (
+            f'{result.criados} orçamentos inseridos, {result.atualizados} atualizados e '
+            f'{result.inalterados} inalterados de {result.total} linhas.'
+        )
+    else:
+        mensagem = f'{result.criados} de {result.total} orçamentos importados.'
+
+    _finish(
+        job_id,
+        status='concluido',
+        total_linhas=result.total,
+        linhas_processadas=result.total,
+        criados=result.criados,
+        atualizados=result.atualizados,
+        inalterados=result.inalterados,
+        ignorados=result.ignorados,
+        erros=erros,
+        resumo=summary,
+        mensagem=mensagem,
+    )
+
+
+def _finish(job_id, **fields):
+    now = timezone.now()
+    ImportJob.objects.filter(pk=job_id).update(finalizado_em=now, atualizado_em=now, **fields)
+
+
+def job_status(job):
+    return {
+        'id': job.pk,
+        'nome_arquivo': job.nome_arquivo,
+        'modo': job.modo,
+        'status': job.status,
+        'status_display': job.get_status_display(),
+        'progresso': job.progresso,
+        'total_linhas': job.total_linhas,
+        'linhas_processadas': job.linhas_processadas,
+        'criados': job.criados,
+        'atualizados': job.atualizados,
+        'inalterados': job.inalterados,
+        'ignorados': job.ignorados,
+        'total_erros': len(job.erros),
+        'erros': job.erros[:importer.MAX_REPORTED_ERRORS],
+        'resumo_erros': job.resumo.get('resumo_erros', {}),
+        'relatorio_url': reverse('import_job_report', args=[job.pk]) if job.relatorio else None,
+        'mensagem': job.mensagem,
+        'finalizado': job.status in ('concluido', 'erro'),
+    }
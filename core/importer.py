@@ -0,0 +1,677 @@
+"""
+Motor de importação em lote de orçamentos a partir de planilhas.
+
+As colunas são validadas e convertidas de forma vetorizada com pandas; usuários,
+clientes e especificadores são resolvidos com consultas por conjunto (e os que
+faltam são criados com bulk_create); os orçamentos são inseridos em lotes
+dentro de uma única transação.
+
+A planilha é lida em modo streaming (openpyxl read_only) e processada em
+blocos, cada um confirmado em sua própria transação, de modo que o uso de
+memória não depende do tamanho do arquivo. Arquivos CSV (opcionalmente
+compactados com gzip) passam pelo mesmo fluxo, lidos em blocos pelo parser C
+do pandas; o formato é detectado pelo conteúdo do arquivo.
+"""
+import gzip
+import hashlib
+import io
+import json
+import re
+from collections import Counter
+from decimal import Decimal
+
+import pandas as pd
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from openpyxl import Workbook, load_workbook
+from openpyxl.utils import get_column_letter
+from openpyxl.worksheet.datavalidation import DataValidation
+
+from .models import Orcamento, User, Cliente, Especificador
+from . import search
+
+REQUIRED_COLUMNS = [
+    'data_solicitacao', 'especificador', 'categoria', 'nome_cliente',
+    'numero_orcamento', 'data_envio', 'valor_orcamento', 'termometro',
+    'data_previsao_fechamento', 'semana_previsao_fechamento', 'etapa', 'usuario'
+]
+
+# The downloadable template has always used this misspelled header.
+COLUMN_ALIASES = {'data_solicitracao': 'data_solicitacao'}
+
+DATE_COLUMNS = ['data_solicitacao', 'data_envio', 'data_previsao_fechamento']
+REQUIRED_DATE_COLUMNS = ['data_solicitacao']
+
+CHOICE_COLUMNS = {
+    'categoria': Orcamento.CATEGORY_CHOICES,
+    'termometro': Orcamento.THERMOMETER_CHOICES,
+    'etapa': Orcamento.STAGE_CHOICES,
+}
+
+# Orcamento fields written by the importer (FKs already resolved to ids).
+UPSERT_FIELDS = [
+    'numero_orcamento', 'usuario_id', 'data_solicitacao', 'especificador_id', 'categoria',
+    'nome_cliente_id', 'data_envio', 'valor_orcamento', 'termometro',
+    'data_previsao_fechamento', 'semana_previsao_fechamento', 'etapa',
+]
+
+BULK_BATCH_SIZE = 500
+
+# Rows validated and committed together; progress is reported per chunk.
+IMPORT_CHUNK_SIZE = 2000
+
+# CSV exports use Brazilian number formatting ("1.234,56") when ';' separates
+# the columns; comma-separated files fall back to the plain "1234.56" form.
+CSV_FORMATS = {
+    ';': {'decimal': ',', 'thousands': '.'},
+    ',': {'decimal': '.', 'thousands': None},
+}
+# Values in ';' files: '.' is only a thousands separator in well-formed groups,
+# so "1234.56" is rejected instead of being read as 123456.
+BR_NUMBER = re.compile(r'[-+]?(\d{1,3}(\.\d{3})+|\d+)(,\d+)?')
+CSV_ENCODING = 'utf-8-sig'
+CSV_TEXT_COLUMNS = [
+    'numero_orcamento', 'usuario', 'nome_cliente', 'especificador', 'semana_previsao_fechamento',
+    'categoria', 'termometro', 'etapa', 'valor_orcamento',
+]
+# Tried in order; ISO first so "2024-04-10" is never read day-first.
+CSV_DATE_FORMATS = ['ISO8601', '%d/%m/%Y', '%d/%m/%Y %H:%M:%S', '%d/%m/%y']
+
+XLSX_MAGIC = b'PK\x03\x04'
+GZIP_MAGIC = b'\x1f\x8b'
+
+# Header of the downloadable template (keeps the historical misspelling, which
+# COLUMN_ALIASES maps back on import).
+TEMPLATE_COLUMNS = [
+    'usuario', 'data_solicitracao', 'especificador', 'categoria', 'nome_cliente',
+    'numero_orcamento', 'data_envio', 'valor_orcamento', 'termometro',
+    'data_previsao_fechamento', 'semana_previsao_fechamento', 'etapa', 'jornada_cliente'
+]
+# Rows of the template covered by the dropdown validations.
+TEMPLATE_VALIDATION_ROWS = 5000
+TEMPLATE_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Flash messages shown per import; the remaining errors are only counted.
+MAX_REPORTED_ERRORS = 20
+
+
+class ImportResult:
+    """Resumo de uma importação: contagens e erros por linha da planilha."""
+
+    def __init__(self):
+        self.total = 0
+        self.validos = 0
+        self.criados = 0
+        self.atualizados = 0
+        self.inalterados = 0
+        self.ignorados = 0
+        self.erros = []  # list of (linha, mensagem)
+        self.resumo_erros = Counter()  # error category -> rows
+        # numero_orcamento values already seen in this file (across chunks)
+        self.numeros_vistos = set()
+
+    def add_error(self, linha, mensagem):
+        self.erros.append((linha, mensagem))
+
+    def record_validation(self, data):
+        """Contabiliza um bloco já validado (coluna 'erro') e retorna apenas as linhas válidas."""
+        invalid = data[data['erro'] != '']
+        for linha, erro in zip(invalid['linha'], invalid['erro']):
+            self.add_error(int(linha), erro)
+            self.resumo_erros.update(message.split(' (')[0] for message in erro.split('; '))
+        valid = data[data['erro'] == '']
+        self.total += len(data)
+        self.validos += len(valid)
+        self.ignorados += len(invalid)
+        return valid
+
+    def as_dict(self):
+        return {
+            'total': self.total,
+            'validos': self.validos,
+            'criados': self.criados,
+            'atualizados': self.atualizados,
+            'inalterados': self.inalterados,
+            'ignorados': self.ignorados,
+            'resumo_erros': dict(self.resumo_erros.most_common()),
+            'erros': [{'linha': linha, 'mensagem': mensagem} for linha, mensagem in self.erros],
+        }
+
+
+class ImportFormatError(Exception):
+    """A planilha não pode ser importada (colunas ausentes, formato inválido)."""
+
+
+def normalize_columns(df):
+    df = df.rename(columns=lambda col: str(col).strip())
+    df = df.rename(columns=COLUMN_ALIASES)
+    missing = [col for col in REQUIRED_COLUMNS if col not in df.columns]
+    if missing:
+        raise ImportFormatError(f'A planilha deve conter as seguintes colunas: {REQUIRED_COLUMNS}')
+    return df
+
+
+def _as_text(series):
+    """Converte uma coluna em texto limpo; vazios viram None e 12.0 vira '12'."""
+    def convert(value):
+        if value is None or (isinstance(value, float) and pd.isna(value)) or value is pd.NaT:
+            return None
+        if isinstance(value, float) and value.is_integer():
+            value = int(value)
+        text = str(value).strip()
+        return text or None
+    # map() infers a string dtype that turns None back into NaN
+    text = series.astype(object).map(convert).astype(object)
+    return text.where(text.notna(), None)
+
+
+def parse_dates(raw):
+    """
+    Converte uma coluna de datas em datetime64 (NaT quando inválida ou vazia).
+    Células de data já tipadas são usadas como estão; textos são lidos com
+    CSV_DATE_FORMATS, dia antes do mês.
+    """
+    raw = raw.astype(object)
+    text = raw.map(lambda value: isinstance(value, str)).astype(bool)
+    parsed = pd.to_datetime(raw.where(~text, None), errors='coerce')
+    stripped = raw[text].str.strip()
+    for fmt in CSV_DATE_FORMATS:
+        pending = text & parsed.isna()
+        if not pending.any():
+            break
+        parsed[pending] = pd.to_datetime(stripped[pending[text]], format=fmt, errors='coerce')
+    return parsed
+
+
+def parse_numbers(raw, number_format=None):
+    """
+    Converte a coluna de valores em float (NaN quando não numérica). Células já
+    numéricas são usadas como estão; textos seguem `number_format` (uma entrada
+    de CSV_FORMATS) e os que não estão no formato ficam NaN.
+    """
+    if number_format is None or number_format['thousands'] is None:
+        return pd.to_numeric(raw, errors='coerce')
+    raw = raw.astype(object)
+    text = raw.map(lambda value: isinstance(value, str)).astype(bool)
+    values = pd.to_numeric(raw.where(~text, None), errors='coerce').astype(float)
+    stripped = raw[text].astype(str).str.strip()
+    well_formed = stripped.map(lambda value: BR_NUMBER.fullmatch(value) is not None).astype(bool)
+    normalized = (
+        stripped[well_formed]
+        .str.replace(number_format['thousands'], '', regex=False)
+        .str.replace(number_format['decimal'], '.', regex=False)
+    )
+    values[normalized.index] = pd.to_numeric(normalized, errors='coerce')
+    return values
+
+
+def prepare_dataframe(df, first_row=2, seen_numbers=None, number_format=None):
+    """
+    Valida e converte as colunas de forma vetorizada.
+    Retorna um DataFrame com os valores tipados, a coluna 'linha' (número da
+    linha na planilha, ou o índice do DataFrame quando `first_row` é None) e a
+    coluna 'erro' (vazia quando a linha é válida).
+    `seen_numbers` contém os números de blocos anteriores do mesmo arquivo e
+    `number_format` o formato numérico dos textos (CSV_FORMATS; None para .xlsx).
+    """
+    df = normalize_columns(df)
+    if first_row is None:
+        linhas = list(df.index)
+    else:
+        linhas = list(range(first_row, first_row + len(df)))
+    df = df.reset_index(drop=True)
+    out = pd.DataFrame(index=df.index)
+    out['linha'] = linhas
+    errors = pd.Series('', index=df.index, dtype=object)
+
+    def flag(mask, message):
+        errors.loc[mask] = errors.loc[mask] + message + '; '
+
+    for col in ['numero_orcamento', 'usuario', 'nome_cliente', 'especificador', 'semana_previsao_fechamento',
+                'categoria', 'termometro', 'etapa']:
+        out[col] = _as_text(df[col])
+
+    for col in DATE_COLUMNS:
+        raw = df[col]
+        parsed = parse_dates(raw)
+        out[col] = parsed.dt.date.astype(object).where(parsed.notna(), None)
+        flag(raw.notna() & parsed.isna(), f'{col} inválida')
+    for col in REQUIRED_DATE_COLUMNS:
+        flag(df[col].isna(), f'{col} obrigatória')
+
+    valor = parse_numbers(df['valor_orcamento'], number_format)
+    flag(df['valor_orcamento'].notna() & valor.isna(), 'valor_orcamento não numérico')
+    out['valor_orcamento'] = valor.fillna(0).map(lambda v: Decimal(f'{v:.2f}'))
+
+    for col, choices in CHOICE_COLUMNS.items():
+        valid = {value for value, _ in choices}
+        flag(out[col].notna() & ~out[col].isin(valid), f'{col} inválido')
+        flag(out[col].isna(), f'{col} obrigatório')
+
+    flag(out['numero_orcamento'].isna(), 'numero_orcamento obrigatório')
+    flag(out['usuario'].isna(), 'usuario obrigatório')
+    duplicated = out['numero_orcamento'].duplicated(keep='first')
+    if seen_numbers:
+        duplicated |= out['numero_orcamento'].isin(seen_numbers)
+    flag(out['numero_orcamento'].notna() & duplicated, 'numero_orcamento duplicado na planilha')
+
+    out['erro'] = errors.str.rstrip('; ')
+    return out
+
+
+def _append_error(data, mask, message):
+    if not mask.any():
+        return
+    current = data.loc[mask, 'erro']
+    data.loc[mask, 'erro'] = current.where(current == '', current + '; ') + message
+
+
+def _lookup_users(usernames):
+    return dict(User.objects.filter(username__in=set(usernames)).values_list('username', 'id'))
+
+
+def check_references(data, users, existing_numbers):
+    """
+    Marca na coluna 'erro' as linhas com usuário inexistente ou com número de
+    orçamento já cadastrado. `users` é {username: id}.
+    """
+    unknown = data['usuario'].notna() & ~data['usuario'].isin(users.keys())
+    _append_error(data, unknown, "usuario não encontrado ('" + data['usuario'].astype(str) + "')")
+    already = data['numero_orcamento'].isin(existing_numbers)
+    _append_error(data, already, "numero_orcamento já cadastrado ('" + data['numero_orcamento'].astype(str) + "')")
+    return data
+
+
+def _resolve_names(model, names):
+    """Retorna {nome_completo: id}, criando em lote os registros que faltam."""
+    names = {name[:100] for name in names if name}
+    found = {}
+    name_list = list(names)
+    for start in range(0, len(name_list), BULK_BATCH_SIZE):
+        chunk = name_list[start:start + BULK_BATCH_SIZE]
+        found.update(model.objects.filter(nome_completo__in=chunk).values_list('nome_completo', 'id'))
+    missing = names - set(found)
+    if missing:
+        model.objects.bulk_create(
+            [model(nome_completo=name) for name in missing], batch_size=BULK_BATCH_SIZE, ignore_conflicts=True
+        )
+        missing_list = list(missing)
+        for start in range(0, len(missing_list), BULK_BATCH_SIZE):
+            chunk = missing_list[start:start + BULK_BATCH_SIZE]
+            created = dict(model.objects.filter(nome_completo__in=chunk).values_list('nome_completo', 'id'))
+            found.update(created)
+            search.reindex(model._meta.model_name, list(created.values()))
+    return found
+
+
+def _name_ids(names, ids):
+    """Ids de `ids` ({nome: id}) para a coluna de nomes; None para células vazias."""
+    # Built as object so missing ids stay None instead of turning the column into floats
+    return pd.Series(
+        [ids.get(name[:100]) if isinstance(name, str) else None for name in names], index=names.index, dtype=object
+    )
+
+
+def _existing_numbers(numbers):
+    existing = set()
+    numbers = list(numbers)
+    for start in range(0, len(numbers), BULK_BATCH_SIZE):
+        chunk = numbers[start:start + BULK_BATCH_SIZE]
+        existing.update(Orcamento.objects.filter(numero_orcamento__in=chunk).values_list('numero_orcamento', flat=True))
+    return existing
+
+
+def _existing_rows(numbers):
+    """Carrega os orçamentos já cadastrados para os números informados, indexados por número."""
+    rows = []
+    numbers = list(numbers)
+    for start in range(0, len(numbers), BULK_BATCH_SIZE):
+        chunk = numbers[start:start + BULK_BATCH_SIZE]
+        rows.extend(Orcamento.objects.filter(numero_orcamento__in=chunk).values('id', 'data_fechada_ganha', *UPSERT_FIELDS))
+    columns = ['id', 'data_fechada_ganha', *UPSERT_FIELDS]
+    return pd.DataFrame(rows, columns=columns, dtype=object).set_index('numero_orcamento', drop=False)
+
+
+def _normalized(series):
+    return series.astype(object).map(lambda v: '' if v is None or (isinstance(v, float) and pd.isna(v)) else str(v))
+
+
+def _row_hashes(df, fields):
+    """Hash por linha dos campos comparáveis, usado para detectar mudanças reais."""
+    combined = _normalized(df[fields[0]])
+    for field in fields[1:]:
+        combined = combined + '\x1f' + _normalized(df[field])
+    return pd.util.hash_pandas_object(combined, index=False)
+
+
+def _upsert_existing(data, result):
+    """
+    Atualiza, com bulk_update por blocos, apenas os orçamentos cujo conteúdo
+    mudou. Retorna as linhas de `data` que ainda não existem no banco.
+    """
+    existing = _existing_rows(data['numero_orcamento'])
+    if existing.empty:
+        return data
+    matched = data[data['numero_orcamento'].isin(existing.index)].set_index('numero_orcamento', drop=False)
+    current = existing.loc[matched.index]
+    compare_fields = [f for f in UPSERT_FIELDS if f != 'numero_orcamento']
+
+    changed = _row_hashes(matched, compare_fields).to_numpy() != _row_hashes(current, compare_fields).to_numpy()
+    result.inalterados += int((~changed).sum())
+    matched, current = matched[changed], current[changed]
+    if not matched.empty:
+        fields = [f for f in compare_fields if (_normalized(matched[f]) != _normalized(current[f])).any()]
+        today = timezone.now().date()
+        objs = []
+        for new, old_id, old_ganha in zip(matched.itertuples(index=False), current['id'], current['data_fechada_ganha']):
+            obj = Orcamento(pk=int(old_id), **{f: getattr(new, f) for f in fields})
+            if 'etapa' in fields:
+                # Same rule as marcar_como_ganho: record when the quote was won
+                obj.data_fechada_ganha = old_ganha or (today if new.etapa == 'Fechada e Ganha' else None)
+            objs.append(obj)
+        if 'etapa' in fields:
+            fields.append('data_fechada_ganha')
+        Orcamento.objects.bulk_update(objs, fields=fields, batch_size=BULK_BATCH_SIZE)
+        search.reindex('orcamento', [obj.pk for obj in objs])
+        result.atualizados += len(objs)
+    return data[~data['numero_orcamento'].isin(existing.index)]
+
+
+def import_dataframe(df, result=None, first_row=2, upsert=False, number_format=None):
+    """
+    Importa um DataFrame (já lido da planilha) em lote.
+    Linhas inválidas ou de usuários inexistentes são ignoradas e registradas em
+    `result`. Números já cadastrados são ignorados, ou atualizados quando
+    `upsert` é True (somente se algum campo realmente mudou).
+    """
+    result = result or ImportResult()
+    data = prepare_dataframe(
+        df, first_row=first_row, seen_numbers=result.numeros_vistos, number_format=number_format
+    )
+    result.numeros_vistos.update(data['numero_orcamento'].dropna())
+    users = _lookup_users(data['usuario'].dropna())
+    existing = set() if upsert else _existing_numbers(set(data['numero_orcamento'].dropna()))
+    check_references(data, users, existing)
+    data = result.record_validation(data)
+
+    if data.empty:
+        return result
+
+    with transaction.atomic():
+        clientes = _resolve_names(Cliente, data['nome_cliente'].dropna())
+        especificadores = _resolve_names(Especificador, data['especificador'].dropna())
+        data = data.assign(
+            usuario_id=data['usuario'].map(users.get),
+            nome_cliente_id=_name_ids(data['nome_cliente'], clientes),
+            especificador_id=_name_ids(data['especificador'], especificadores),
+        )
+
+        if upsert:
+            data = _upsert_existing(data, result)
+
+        orcamentos = [
+            Orcamento(**{field: getattr(row, field) for field in UPSERT_FIELDS})
+            for row in data.itertuples(index=False)
+        ]
+        created = Orcamento.objects.bulk_create(orcamentos, batch_size=BULK_BATCH_SIZE)
+        # bulk_create skips post_save, so the search index is refreshed here
+        search.reindex('orcamento', [o.pk for o in created if o.pk])
+    result.criados += len(created)
+    return result
+
+
+class SpreadsheetReader:
+    """
+    Lê um .xlsx em modo streaming e entrega DataFrames de até `batch_size`
+    linhas. Linhas totalmente vazias são descartadas.
+    """
+
+    # Numeric cells are typed by Excel; text values are read as plain numbers
+    number_format = None
+
+    def __init__(self, file, batch_size=IMPORT_CHUNK_SIZE):
+        self.batch_size = batch_size
+        self.workbook = load_workbook(file, read_only=True, data_only=True)
+        self.sheet = self.workbook.worksheets[0]
+        self.rows = self.sheet.iter_rows(values_only=True)
+        header = next(self.rows, None)
+        if header is None:
+            raise ImportFormatError('A planilha está vazia.')
+        self.columns = [str(col).strip() if col is not None else '' for col in header]
+        normalize_columns(pd.DataFrame(columns=self.columns))
+
+    @property
+    def estimated_rows(self):
+        """Número de linhas de dados declarado no arquivo (pode incluir linhas vazias)."""
+        max_row = self.sheet.max_row
+        return max(max_row - 1, 0) if max_row else 0
+
+    def __iter__(self):
+        """Gera DataFrames indexados pelo número da linha na planilha."""
+        width = len(self.columns)
+        batch, row_numbers = [], []
+        for row_number, values in enumerate(self.rows, start=2):
+            if all(value is None or value == '' for value in values):
+                continue
+            values = tuple(values[:width])
+            batch.append(values + (None,) * (width - len(values)))
+            row_numbers.append(row_number)
+            if len(batch) >= self.batch_size:
+                yield self._frame(batch, row_numbers)
+                batch, row_numbers = [], []
+        if batch:
+            yield self._frame(batch, row_numbers)
+
+    def _frame(self, rows, row_numbers):
+        return pd.DataFrame.from_records(rows, columns=self.columns, index=row_numbers).astype(object)
+
+    def close(self):
+        self.workbook.close()
+
+
+class CsvReader:
+    """
+    Lê um CSV (ou CSV.gz) em blocos de até `batch_size` linhas com o parser C
+    do pandas, com tipos explícitos para as colunas de texto, datas ISO ou
+    dia/mês/ano e separadores numéricos detectados pelo delimitador.
+    Expõe a mesma interface de SpreadsheetReader.
+    """
+
+    def __init__(self, file, batch_size=IMPORT_CHUNK_SIZE, compressed=False):
+        self.batch_size = batch_size
+        self.compressed = compressed
+        self.file = file
+        self.stream = gzip.GzipFile(fileobj=file, mode='rb') if compressed else file
+        header_line = self.stream.readline().decode(CSV_ENCODING, errors='replace')
+        if not header_line.strip():
+            raise ImportFormatError('O arquivo CSV está vazio.')
+        self.sep = ';' if header_line.count(';') >= header_line.count(',') else ','
+        self.number_format = CSV_FORMATS[self.sep]
+        self.columns = [col.strip().strip('"') for col in header_line.rstrip('\r\n').split(self.sep)]
+        normalize_columns(pd.DataFrame(columns=self.columns))
+        self.stream.seek(0)
+
+    @property
+    def estimated_rows(self):
+        """Linhas do arquivo sem o cabeçalho; desconhecido (0) para arquivos compactados."""
+        if self.compressed:
+            return 0
+        position = self.file.tell()
+        self.file.seek(0)
+        lines = sum(block.count(b'\n') for block in iter(lambda: self.file.read(1 << 20), b''))
+        self.file.seek(position)
+        return max(lines - 1, 0)
+
+    def __iter__(self):
+        """Gera DataFrames indexados pelo número da linha no arquivo."""
+        columns = normalize_columns(pd.DataFrame(columns=self.columns)).columns
+        chunks = pd.read_csv(
+            self.stream,
+            sep=self.sep,
+            engine='c',
+            encoding=CSV_ENCODING,
+            encoding_errors='replace',
+            header=0,
+            names=list(columns),
+            dtype={col: str for col in CSV_TEXT_COLUMNS + DATE_COLUMNS},
+            skipinitialspace=True,
+            chunksize=self.batch_size,
+        )
+        start = 2
+        for chunk in chunks:
+            chunk.index = range(start, start + len(chunk))
+            start += len(chunk)
+            yield self._frame(chunk)
+
+    def _frame(self, chunk):
+        # Values that match no format are kept as text so prepare_dataframe flags them.
+        for col in DATE_COLUMNS:
+            raw = chunk[col]
+            parsed = parse_dates(raw)
+            chunk[col] = parsed.astype(object).where(parsed.notna(), raw.astype(object))
+        # valor_orcamento stays as text; prepare_dataframe reads it with number_format
+        return chunk.astype(object)
+
+    def close(self):
+        if self.compressed:
+            self.stream.close()
+
+
+def open_spreadsheet(file, batch_size=IMPORT_CHUNK_SIZE):
+    """Detecta o formato do arquivo (.xlsx, .csv ou .csv.gz) pelo conteúdo e retorna o leitor adequado."""
+    magic = file.read(4)
+    file.seek(0)
+    if magic.startswith(XLSX_MAGIC):
+        return SpreadsheetReader(file, batch_size=batch_size)
+    if magic.startswith(GZIP_MAGIC):
+        return CsvReader(file, batch_size=batch_size, compressed=True)
+    return CsvReader(file, batch_size=batch_size)
+
+
+def validate_file(file, progress=None, chunk_size=IMPORT_CHUNK_SIZE):
+    """
+    Modo dry-run: valida a planilha inteira sem gravar nada no banco.
+    Retorna (ImportResult, relatorio), onde relatorio é um .xlsx (BytesIO) com
+    as linhas problemáticas, seus valores originais e a descrição dos erros.
+    """
+    reader = open_spreadsheet(file, batch_size=chunk_size)
+    result = ImportResult()
+    report = Workbook(write_only=True)
+    sheet = report.create_sheet('Erros')
+    sheet.append(['linha'] + reader.columns + ['erros'])
+    try:
+        total = reader.estimated_rows
+        for batch in reader:
+            data = prepare_dataframe(
+                batch, first_row=None, seen_numbers=result.numeros_vistos, number_format=reader.number_format
+            )
+            result.numeros_vistos.update(data['numero_orcamento'].dropna())
+            users = _lookup_users(data['usuario'].dropna())
+            existing = _existing_numbers(set(data['numero_orcamento'].dropna()))
+            check_references(data, users, existing)
+            result.record_validation(data)
+
+            invalid = data[data['erro'] != '']
+            raw = batch.loc[invalid['linha']]
+            for linha, values, erro in zip(invalid['linha'], raw.itertuples(index=False), invalid['erro']):
+                sheet.append([int(linha)] + [None if pd.isna(v) else v for v in values] + [erro])
+            if progress:
+                progress(result, result.total, max(total, result.total))
+    finally:
+        reader.close()
+
+    output = io.BytesIO()
+    report.save(output)
+    output.seek(0)
+    return result, output
+
+
+def import_file(file, progress=None, chunk_size=IMPORT_CHUNK_SIZE, upsert=False):
+    """
+    Lê e importa um arquivo .xlsx, .csv ou .csv.gz em blocos de `chunk_size` linhas, retornando
+    um ImportResult. Cada bloco é confirmado separadamente, então uma falha no
+    meio do arquivo preserva os blocos anteriores. Com `upsert`, orçamentos já
+    cadastrados são atualizados em vez de ignorados.
+    `progress(result, linhas_processadas, total_estimado)` é chamado após cada bloco.
+    """
+    reader = open_spreadsheet(file, batch_size=chunk_size)
+    result = ImportResult()
+    try:
+        total = reader.estimated_rows
+        for batch in reader:
+            import_dataframe(batch, result, first_row=None, upsert=upsert, number_format=reader.number_format)
+            if progress:
+                progress(result, result.total, max(total, result.total))
+    finally:
+        reader.close()
+    return result
+
+
+def _template_lists(usernames):
+    lists = {'usuario': usernames}
+    lists.update((col, [value for value, _ in choices]) for col, choices in CHOICE_COLUMNS.items())
+    return lists
+
+
+def build_template(usernames):
+    """
+    Gera o template de importação (.xlsx, openpyxl write-only) com uma linha por
+    usuário e listas suspensas para usuario e para as colunas de escolha. As
+    opções ficam em uma aba oculta referenciada pelas validações.
+    """
+    lists = _template_lists(usernames)
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('Sheet1')
+    options = workbook.create_sheet('Listas')
+    options.sheet_state = 'hidden'
+
+    last_row = TEMPLATE_VALIDATION_ROWS + 1
+    for position, (col, values) in enumerate(lists.items(), start=1):
+        if not values:
+            continue
+        letter = get_column_letter(position)
+        target = get_column_letter(TEMPLATE_COLUMNS.index(col) + 1)
+        validation = DataValidation(
+            type='list',
+            formula1=f'Listas!${letter}$2:${letter}${len(values) + 1}',
+            allow_blank=True,
+            showErrorMessage=True,
+            errorTitle=f'{col} inválido',
+            error=f'Escolha um valor da lista de {col}.',
+        )
+        validation.add(f'{target}2:{target}{last_row}')
+        sheet.data_validations.append(validation)
+
+    sheet.append(TEMPLATE_COLUMNS)
+    for username in usernames:
+        sheet.append([username])
+
+    options.append(list(lists))
+    for row in range(max(len(values) for values in lists.values())):
+        options.append([values[row] if row < len(values) else None for values in lists.values()])
+
+    output = io.BytesIO()
+    workbook.save(output)
+    return output.getvalue()
+
+
+def template_signature(usernames):
+    """Hash da lista de usuários e das opções de escolha; muda quando o template precisa ser refeito."""
+    payload = json.dumps([TEMPLATE_COLUMNS, _template_lists(list(usernames))], ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def get_template():
+    """
+    Retorna (conteúdo, assinatura) do template, servido do cache enquanto os
+    usuários e as opções não mudarem.
+    """
+    usernames = list(User.objects.order_by('username').values_list('username', flat=True))
+    signature = template_signature(usernames)
+    key = f'importer:template:{signature}'
+    content = cache.get(key)
+    if content is None:
+        content = build_template(usernames)
+        cache.set(key, content, TEMPLATE_CACHE_TIMEOUT)
+    return content, signature
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from core.conveniencia import BACKFILL_BATCH_SIZE, backfill_items
+
+class Command(BaseCommand):
+    help = 'Rebuilds the normalized conveniência order items from the JSON orders stored on agendamentos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BACKFILL_BATCH_SIZE, help='Agendamentos processed per batch')
+
+    def handle(self, *args, **options):
+        pedidos, itens = backfill_items(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'{itens} items written for {pedidos} conveniência orders.'))
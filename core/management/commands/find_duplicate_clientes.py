@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from core.dedup import find_duplicates, DEFAULT_THRESHOLD
+
+class Command(BaseCommand):
+    help = 'Finds likely duplicate Cliente rows using blocking keys and stores them for review'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Rescore every cliente instead of only those changed since the last run')
+        parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help='Minimum similarity score (0-1) to record a pair')
+
+    def handle(self, *args, **options):
+        run = find_duplicates(full=options['full'], threshold=options['threshold'])
+        mode = 'full' if run.completo else 'incremental'
+        self.stdout.write(f'{mode.capitalize()} scan: {run.clientes_analisados} clientes analysed, {run.comparacoes} comparisons.')
+        self.stdout.write(self.style.SUCCESS(f'Found {run.candidatos_encontrados} duplicate candidates.'))
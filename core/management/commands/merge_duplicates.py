@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+from core.merge import merge_clientes, merge_especificadores, merge_confirmed_duplicates, MergeError
+import csv
+
+class Command(BaseCommand):
+    help = 'Merges duplicate clientes or especificadores, repointing every orçamento and agendamento to the winner'
+
+    def add_arguments(self, parser):
+        parser.add_argument('pairs', nargs='*', help='Pairs in the form WINNER_ID:LOSER_ID')
+        parser.add_argument('--model', choices=['cliente', 'especificador'], default='cliente')
+        parser.add_argument('--file', help='CSV file with winner_id,loser_id rows')
+        parser.add_argument('--confirmed', action='store_true', help='Merge every confirmed DuplicateCandidate pair')
+
+    def handle(self, *args, **options):
+        try:
+            if options['confirmed']:
+                result = merge_confirmed_duplicates()
+            else:
+                pairs = [tuple(pair.split(':', 1)) for pair in options['pairs']]
+                if options['file']:
+                    with open(options['file'], newline='') as f:
+                        pairs.extend(tuple(row[:2]) for row in csv.reader(f) if len(row) >= 2 and row[0].strip().isdigit())
+                if not pairs:
+                    raise CommandError('No pairs given. Use WINNER_ID:LOSER_ID, --file or --confirmed.')
+                merge = merge_clientes if options['model'] == 'cliente' else merge_especificadores
+                result = merge(pairs)
+        except (MergeError, ValueError) as e:
+            raise CommandError(str(e))
+
+        for key, count in result.items():
+            if key != 'mesclados':
+                self.stdout.write(f'{key}: {count} rows repointed')
+        self.stdout.write(self.style.SUCCESS(f'Successfully merged {result["mesclados"]} records.'))
@@ -0,0 +1,25 @@
+import gzip
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from core.notifications import PURGE_CHUNK_SIZE, RETENTION_DAYS, purge_old_notifications
+
+class Command(BaseCommand):
+    help = 'Deletes read notifications (and delivered outbox events) older than the retention period, in chunks'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=getattr(settings, 'NOTIFICATIONS_RETENTION_DAYS', RETENTION_DAYS),
+            help='Retention period in days (default: NOTIFICATIONS_RETENTION_DAYS)',
+        )
+        parser.add_argument('--chunk-size', type=int, default=PURGE_CHUNK_SIZE, help='Rows deleted per statement')
+        parser.add_argument('--archive', metavar='PATH', help='Write the purged notifications to this .csv.gz file first')
+
+    def handle(self, *args, **options):
+        archive_path = options['archive']
+        if archive_path:
+            with gzip.open(archive_path, 'wt', newline='', encoding='utf-8') as archive:
+                purged, events = purge_old_notifications(options['days'], options['chunk_size'], archive=archive)
+            self.stdout.write(f'Archived to {archive_path}.')
+        else:
+            purged, events = purge_old_notifications(options['days'], options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f'{purged} notifications and {events} outbox events deleted.'))
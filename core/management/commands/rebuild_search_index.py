@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from core.search import rebuild_index, search_available
+
+class Command(BaseCommand):
+    help = 'Rebuilds the omnisearch FTS5 index from orçamentos, clientes, especificadores, comments and agendamentos'
+
+    def handle(self, *args, **options):
+        if not search_available():
+            self.stdout.write(self.style.WARNING('The search index requires SQLite FTS5; nothing to do.'))
+            return
+        rebuild_index()
+        self.stdout.write(self.style.SUCCESS('Search index rebuilt.'))
@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from core.notifications import reconcile_unread_counts
+
+class Command(BaseCommand):
+    help = 'Recomputes the unread-notification counters from the database (run periodically, e.g. from cron)'
+
+    def handle(self, *args, **options):
+        total = reconcile_unread_counts()
+        self.stdout.write(self.style.SUCCESS(f'Unread counters reconciled for {total} users.'))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from core.import_jobs import claim_next_job, process_job, recover_stale_jobs
+import time
+
+class Command(BaseCommand):
+    help = 'Processes pending ImportJob uploads in a loop (use with IMPORT_JOBS_USE_THREAD_POOL = False)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=2.0, help='Seconds to sleep when there is no pending job')
+        parser.add_argument('--once', action='store_true', help='Process the pending jobs and exit')
+
+    def handle(self, *args, **options):
+        self.stdout.write('Import worker started.')
+        recovered = recover_stale_jobs()
+        if recovered:
+            self.stdout.write(self.style.WARNING(f'{recovered} interrupted import jobs marked as failed.'))
+        while True:
+            close_old_connections()
+            job_id = claim_next_job()
+            if job_id is None:
+                if options['once']:
+                    break
+                time.sleep(options['interval'])
+                continue
+            self.stdout.write(f'Processing import job {job_id}...')
+            process_job(job_id, claimed=True)
+            self.stdout.write(self.style.SUCCESS(f'Import job {job_id} finished.'))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from core.notifications import NOTIFICATION_BATCH_SIZE, process_batch
+import time
+
+class Command(BaseCommand):
+    help = 'Delivers pending comment notification events in batches (use with NOTIFICATIONS_USE_THREAD_POOL = False)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=1.0, help='Seconds to sleep when there is no pending event')
+        parser.add_argument('--batch-size', type=int, default=NOTIFICATION_BATCH_SIZE, help='Events delivered per batch')
+        parser.add_argument('--once', action='store_true', help='Deliver the pending events and exit')
+
+    def handle(self, *args, **options):
+        self.stdout.write('Notification worker started.')
+        while True:
+            close_old_connections()
+            delivered = process_batch(options['batch_size'])
+            if delivered:
+                self.stdout.write(self.style.SUCCESS(f'{delivered} notification events delivered.'))
+                continue
+            if options['once']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,161 @@
+"""
+Mesclagem em lote de clientes e especificadores duplicados.
+
+Todas as chaves estrangeiras que apontam para os registros perdedores são
+redirecionadas para o vencedor com um único UPDATE ... CASE por tabela (por
+lote), dentro de uma transação, e os perdedores são apagados em seguida.
+"""
+from django.db import transaction
+from django.db.models import Case, When, Value
+from django.utils import timezone
+
+from .models import Cliente, Especificador, Orcamento, Agendamento, SerieAgendamento, DuplicateCandidate
+from . import search
+
+# Each pair costs ~3 query parameters in the CASE/IN clauses; this keeps every
+# statement well below SQLite's variable limit.
+MERGE_BATCH_SIZE = 300
+
+# Model -> list of (model, fk attname) that reference it.
+MERGE_REFERENCES = {
+    Cliente: [(Orcamento, 'nome_cliente_id'), (Agendamento, 'cliente_id'), (SerieAgendamento, 'cliente_id')],
+    Especificador: [
+        (Orcamento, 'especificador_id'), (Agendamento, 'especificador_id'), (SerieAgendamento, 'especificador_id'),
+    ],
+}
+
+# Search index documents that embed the merged model's name.
+MERGE_SEARCH_REFRESH = {
+    Cliente: [('cliente', 'id'), ('orcamento', 'nome_cliente_id'), ('agendamento', 'cliente_id')],
+    Especificador: [('especificador', 'id'), ('orcamento', 'especificador_id'), ('agendamento', 'especificador_id')],
+}
+
+# Optional fields copied from a loser when the winner has them empty.
+MERGE_FILL_FIELDS = {
+    Cliente: ['cpf_cnpj', 'telefone', 'email'],
+    Especificador: [],
+}
+
+
+class MergeError(Exception):
+    pass
+
+
+def resolve_merge_map(pairs):
+    """
+    Converte pares (vencedor, perdedor) em um dicionário perdedor -> vencedor final.
+    Cadeias (A <- B <- C) e grupos com mais de dois registros são resolvidos para
+    um único vencedor por grupo.
+    """
+    parent = {}
+
+    def find(node):
+        root = node
+        while parent.get(root, root) != root:
+            root = parent[root]
+        while node != root:
+            parent[node], node = root, parent[node]
+        return root
+
+    for winner_id, loser_id in pairs:
+        winner_root, loser_root = find(int(winner_id)), find(int(loser_id))
+        if winner_root != loser_root:
+            parent[loser_root] = winner_root
+
+    return {node: find(node) for node in list(parent) if find(node) != node}
+
+
+def _chunks(items):
+    items = list(items)
+    for start in range(0, len(items), MERGE_BATCH_SIZE):
+        yield items[start:start + MERGE_BATCH_SIZE]
+
+
+def _repoint(model, attname, merge_map):
+    total = 0
+    for chunk in _chunks(merge_map.items()):
+        chunk = dict(chunk)
+        fields = {attname: Case(*[When(**{attname: loser}, then=Value(winner)) for loser, winner in chunk.items()])}
+        if model in (Agendamento, SerieAgendamento):
+            # UPDATE skips auto_now; the agenda delta sync needs to see the new names
+            fields['atualizado_em'] = timezone.now()
+        total += model.objects.filter(**{f'{attname}__in': list(chunk)}).update(**fields)
+    return total
+
+
+def _fill_winner_fields(model, merge_map):
+    fields = MERGE_FILL_FIELDS[model]
+    if not fields:
+        return []
+    rows = {}
+    for chunk in _chunks(set(merge_map) | set(merge_map.values())):
+        rows.update((obj.pk, obj) for obj in model.objects.filter(pk__in=chunk))
+    changed = {}
+    for loser_id, winner_id in sorted(merge_map.items()):
+        winner, loser = rows.get(winner_id), rows.get(loser_id)
+        if not winner or not loser:
+            continue
+        for field in fields:
+            if not getattr(winner, field) and getattr(loser, field):
+                setattr(winner, field, getattr(loser, field))
+                changed[winner.pk] = winner
+    return list(changed.values())
+
+
+def merge_records(model, pairs):
+    """
+    Mescla registros de `model` (Cliente ou Especificador) a partir de pares
+    (vencedor_id, perdedor_id). Retorna um dicionário com as contagens por tabela.
+    """
+    if model not in MERGE_REFERENCES:
+        raise MergeError(f'Mesclagem não suportada para {model.__name__}.')
+    merge_map = resolve_merge_map(pairs)
+    result = {'mesclados': 0}
+    if not merge_map:
+        return result
+
+    with transaction.atomic():
+        existing = set()
+        for chunk in _chunks(set(merge_map) | set(merge_map.values())):
+            existing.update(model.objects.filter(pk__in=chunk).values_list('pk', flat=True))
+        missing_winners = set(merge_map.values()) - existing
+        if missing_winners:
+            raise MergeError(f'Registros vencedores inexistentes: {sorted(missing_winners)}')
+        merge_map = {loser: winner for loser, winner in merge_map.items() if loser in existing}
+
+        winners_to_fill = _fill_winner_fields(model, merge_map)
+
+        for ref_model, attname in MERGE_REFERENCES[model]:
+            key = f'{ref_model._meta.model_name}.{attname}'
+            result[key] = _repoint(ref_model, attname, merge_map)
+
+        for chunk in _chunks(merge_map):
+            model.objects.filter(pk__in=chunk).delete()
+        result['mesclados'] = len(merge_map)
+
+        if winners_to_fill:
+            model.objects.bulk_update(winners_to_fill, MERGE_FILL_FIELDS[model], batch_size=MERGE_BATCH_SIZE)
+        if model is Cliente:
+            # Touch the winners so the next incremental duplicate scan rescores them
+            for chunk in _chunks(set(merge_map.values())):
+                Cliente.objects.filter(pk__in=chunk).update(atualizado_em=timezone.now())
+
+        # Repointed rows were changed with UPDATE, which bypasses the search signals
+        winners = set(merge_map.values())
+        for tipo, column in MERGE_SEARCH_REFRESH[model]:
+            search.reindex(tipo, winners, column=column)
+    return result
+
+
+def merge_clientes(pairs):
+    return merge_records(Cliente, pairs)
+
+
+def merge_especificadores(pairs):
+    return merge_records(Especificador, pairs)
+
+
+def merge_confirmed_duplicates():
+    """Mescla todos os pares DuplicateCandidate confirmados, mantendo o cliente mais antigo."""
+    pairs = DuplicateCandidate.objects.filter(status='confirmado').values_list('cliente_a_id', 'cliente_b_id')
+    return merge_clientes(list(pairs))
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.6 on 2026-10-19 05:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0026_agendamento_sala_limpa'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DuplicateScanRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('iniciado_em', models.DateTimeField(auto_now_add=True)),
+                ('finalizado_em', models.DateTimeField(blank=True, null=True)),
+                ('completo', models.BooleanField(default=False)),
+                ('clientes_analisados', models.PositiveIntegerField(default=0)),
+                ('comparacoes', models.PositiveIntegerField(default=0)),
+                ('candidatos_encontrados', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['-iniciado_em'],
+            },
+        ),
+        migrations.AddField(
+            model_name='cliente',
+            name='atualizado_em',
+            field=models.DateTimeField(auto_now=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='DuplicateCandidate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('motivos', models.CharField(blank=True, max_length=200)),
+                ('status', models.CharField(choices=[('pendente', 'Pendente'), ('confirmado', 'Confirmado'), ('descartado', 'Descartado')], default='pendente', max_length=20)),
+                ('criado_em', models.DateTimeField(auto_now_add=True)),
+                ('cliente_a', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='duplicados_como_a', to='core.cliente')),
+                ('cliente_b', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='duplicados_como_b', to='core.cliente')),
+                ('scan', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='candidatos', to='core.duplicatescanrun')),
+            ],
+            options={
+                'ordering': ['-score'],
+                'indexes': [models.Index(fields=['status', '-score'], name='core_duplic_status_931df6_idx')],
+                'constraints': [models.UniqueConstraint(fields=('cliente_a', 'cliente_b'), name='unique_duplicate_pair')],
+            },
+        ),
+    ]
@@ -0,0 +1,71 @@
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS core_search_index USING fts5(
+            tipo UNINDEXED,
+            objeto_id UNINDEXED,
+            usuario_id UNINDEXED,
+            loja_id UNINDEXED,
+            titulo,
+            conteudo,
+            tokenize = 'unicode61 remove_diacritics 2'
+        )
+    """)
+    schema_editor.execute("""
+        INSERT INTO core_search_index (rowid, tipo, objeto_id, usuario_id, loja_id, titulo, conteudo)
+        SELECT o.id * 8 + 1, 'orcamento', o.id, o.usuario_id, u.loja_id,
+               COALESCE(o.numero_orcamento, ''),
+               COALESCE(c.nome_completo, '') || ' ' || COALESCE(e.nome_completo, '')
+        FROM core_orcamento o
+        JOIN core_user u ON u.id = o.usuario_id
+        LEFT JOIN core_cliente c ON c.id = o.nome_cliente_id
+        LEFT JOIN core_especificador e ON e.id = o.especificador_id
+    """)
+    schema_editor.execute("""
+        INSERT INTO core_search_index (rowid, tipo, objeto_id, usuario_id, loja_id, titulo, conteudo)
+        SELECT j.id * 8 + 2, 'comentario', j.id, o.usuario_id, u.loja_id,
+               COALESCE(o.numero_orcamento, ''), j.comentario
+        FROM core_jornadaclientehistorico j
+        JOIN core_orcamento o ON o.id = j.orcamento_id
+        JOIN core_user u ON u.id = o.usuario_id
+    """)
+    schema_editor.execute("""
+        INSERT INTO core_search_index (rowid, tipo, objeto_id, usuario_id, loja_id, titulo, conteudo)
+        SELECT c.id * 8 + 3, 'cliente', c.id, NULL, NULL, c.nome_completo,
+               COALESCE(c.cpf_cnpj, '') || ' ' || COALESCE(c.email, '') || ' ' || COALESCE(c.telefone, '')
+        FROM core_cliente c
+    """)
+    schema_editor.execute("""
+        INSERT INTO core_search_index (rowid, tipo, objeto_id, usuario_id, loja_id, titulo, conteudo)
+        SELECT e.id * 8 + 4, 'especificador', e.id, NULL, NULL, e.nome_completo, ''
+        FROM core_especificador e
+    """)
+    schema_editor.execute("""
+        INSERT INTO core_search_index (rowid, tipo, objeto_id, usuario_id, loja_id, titulo, conteudo)
+        SELECT a.id * 8 + 5, 'agendamento', a.id, a.responsavel_id, a.loja_id, a.sala,
+               a.motivo || ' ' || COALESCE(c.nome_completo, '') || ' ' || COALESCE(e.nome_completo, '')
+        FROM core_agendamento a
+        LEFT JOIN core_cliente c ON c.id = a.cliente_id
+        LEFT JOIN core_especificador e ON e.id = a.especificador_id
+    """)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute('DROP TABLE IF EXISTS core_search_index')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0027_duplicate_detection'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.6 on 2026-10-19 05:36
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0028_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('arquivo', models.FileField(upload_to='imports/')),
+                ('nome_arquivo', models.CharField(max_length=255)),
+                ('status', models.CharField(choices=[('pendente', 'Pendente'), ('processando', 'Processando'), ('concluido', 'Concluído'), ('erro', 'Erro')], default='pendente', max_length=20)),
+                ('total_linhas', models.PositiveIntegerField(default=0)),
+                ('linhas_processadas', models.PositiveIntegerField(default=0)),
+                ('criados', models.PositiveIntegerField(default=0)),
+                ('ignorados', models.PositiveIntegerField(default=0)),
+                ('erros', models.JSONField(blank=True, default=list)),
+                ('mensagem', models.TextField(blank=True)),
+                ('criado_em', models.DateTimeField(auto_now_add=True)),
+                ('iniciado_em', models.DateTimeField(blank=True, null=True)),
+                ('finalizado_em', models.DateTimeField(blank=True, null=True)),
+                ('criado_por', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='import_jobs', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-criado_em'],
+                'indexes': [models.Index(fields=['status', 'criado_em'], name='core_import_status_a24e78_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.6 on 2026-10-19 05:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0029_importjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='modo',
+            field=models.CharField(choices=[('inserir', 'Importar novos'), ('validar', 'Somente validar (dry-run)')], default='inserir', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='importjob',
+            name='relatorio',
+            field=models.FileField(blank=True, upload_to='imports/relatorios/'),
+        ),
+        migrations.AddField(
+            model_name='importjob',
+            name='resumo',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
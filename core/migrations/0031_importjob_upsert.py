@@ -0,0 +1,28 @@
+# Generated by Django 5.2.6 on 2026-10-19 05:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0030_importjob_dry_run'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='atualizados',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='importjob',
+            name='inalterados',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='importjob',
+            name='modo',
+            field=models.CharField(choices=[('inserir', 'Importar novos'), ('upsert', 'Importar e atualizar existentes'), ('validar', 'Somente validar (dry-run)')], default='inserir', max_length=20),
+        ),
+    ]
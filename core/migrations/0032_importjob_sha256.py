@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-19 05:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0031_importjob_upsert'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='sha256',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+    ]
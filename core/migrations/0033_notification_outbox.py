@@ -0,0 +1,48 @@
+# Generated by Django 5.2.6 on 2026-10-19 05:47
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0032_importjob_sha256'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pendente', 'Pendente'), ('processando', 'Processando'), ('concluido', 'Concluído'), ('erro', 'Erro')], default='pendente', max_length=20)),
+                ('disponivel_em', models.DateTimeField(default=django.utils.timezone.now)),
+                ('lote', models.CharField(blank=True, max_length=32)),
+                ('tentativas', models.PositiveSmallIntegerField(default=0)),
+                ('ultimo_erro', models.TextField(blank=True)),
+                ('criado_em', models.DateTimeField(auto_now_add=True)),
+                ('processado_em', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='notification',
+            constraint=models.UniqueConstraint(fields=('recipient', 'comment'), name='unique_notification_recipient_comment'),
+        ),
+        migrations.AddField(
+            model_name='notificationevent',
+            name='comment',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notification_events', to='core.jornadaclientehistorico'),
+        ),
+        migrations.AddIndex(
+            model_name='notificationevent',
+            index=models.Index(fields=['status', 'disponivel_em'], name='core_notifi_status_7161aa_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notificationevent',
+            index=models.Index(fields=['lote'], name='core_notifi_lote_c1273c_idx'),
+        ),
+    ]
@@ -0,0 +1,61 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def coalesce_existing(apps, schema_editor):
+    """Preenche o orçamento e agrupa as notificações não lidas por destinatário e orçamento."""
+    Notification = apps.get_model('core', 'Notification')
+    JornadaClienteHistorico = apps.get_model('core', 'JornadaClienteHistorico')
+    Notification.objects.update(
+        orcamento_id=models.Subquery(
+            JornadaClienteHistorico.objects.filter(pk=models.OuterRef('comment_id')).values('orcamento_id')[:1]
+        )
+    )
+
+    groups = {}
+    duplicates = []
+    unread = Notification.objects.filter(is_read=False).order_by('-comment_id')
+    for notification in unread.only('id', 'recipient_id', 'orcamento_id', 'comment_id', 'quantidade', 'created_at'):
+        key = (notification.recipient_id, notification.orcamento_id)
+        latest = groups.get(key)
+        if latest is None:
+            groups[key] = notification
+        else:
+            latest.quantidade += 1
+            latest.created_at = max(latest.created_at, notification.created_at)
+            duplicates.append(notification.pk)
+    Notification.objects.bulk_update(
+        [n for n in groups.values() if n.quantidade > 1], ['quantidade', 'created_at'], batch_size=500
+    )
+    for start in range(0, len(duplicates), 500):
+        Notification.objects.filter(pk__in=duplicates[start:start + 500]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0035_notification_inbox_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='orcamento',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='notifications', to='core.orcamento'),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='quantidade',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.RunPython(coalesce_existing, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='notification',
+            name='orcamento',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notifications', to='core.orcamento'),
+        ),
+        migrations.AddConstraint(
+            model_name='notification',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_read', False)), fields=('recipient', 'orcamento'), name='unique_unread_notification_per_orcamento'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.6 on 2026-10-19 05:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0036_notification_coalescing'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='agendamento',
+            index=models.Index(fields=['sala', 'horario_inicio', 'horario_fim'], name='core_agenda_sala_3c2ad6_idx'),
+        ),
+    ]
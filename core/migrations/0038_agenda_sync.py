@@ -0,0 +1,29 @@
+# Generated by Django 5.2.6 on 2026-10-19 05:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0037_agendamento_sala_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AgendamentoExcluido',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('agendamento_id', models.PositiveIntegerField()),
+                ('excluido_em', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                'ordering': ['excluido_em'],
+            },
+        ),
+        migrations.AddField(
+            model_name='agendamento',
+            name='atualizado_em',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.6 on 2026-10-19 06:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0038_agenda_sync'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='agendamento',
+            index=models.Index(fields=['horario_inicio', 'horario_fim'], name='core_agenda_horario_6d334e_idx'),
+        ),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 5.2.6 on 2026-10-19 06:04
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0039_agendamento_range_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='agendamento',
+            name='ocorrencia_original',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='agendamentoexcluido',
+            name='serie_id',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='agendamentoexcluido',
+            name='agendamento_id',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='SerieAgendamento',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sala', models.CharField(choices=[('Esperienza 1', 'Esperienza 1'), ('Esperienza 2', 'Esperienza 2'), ('Laccato', 'Laccato'), ('Lacca', 'Lacca'), ('Portobello Shop', 'Portobello Shop'), ('Recepção Artefacto', 'Recepção Artefacto'), ('Café IJP', 'Café IJP'), ('Office Artefacto', 'Office Artefacto'), ('Jantar Formal - Artefacto', 'Jantar Formal - Artefacto'), ('Sala de Reunião Smart', 'Sala de Reunião Smart'), ('Espaço Hunter Douglas', 'Espaço Hunter Douglas'), ('Sala Cultura', 'Sala Cultura')], max_length=50)),
+                ('motivo', models.CharField(choices=[('Especificação', 'Especificação'), ('Apresentação Showroom', 'Apresentação Showroom'), ('Apresentação Produtos', 'Apresentação Produtos'), ('Apresentação Orçamentos', 'Apresentação Orçamentos'), ('Pagamento', 'Pagamento'), ('Gravação', 'Gravação'), ('Negociação e Fechamento', 'Negociação e Fechamento'), ('Revisão de Projeto', 'Revisão de Projeto'), ('Relacionamento', 'Relacionamento')], max_length=50)),
+                ('quantidade_convidados', models.PositiveIntegerField(default=1)),
+                ('inicio', models.DateTimeField(help_text='Início da primeira ocorrência.')),
+                ('duracao_minutos', models.PositiveIntegerField()),
+                ('intervalo_semanas', models.PositiveSmallIntegerField(default=1)),
+                ('repetir_ate', models.DateField()),
+                ('data_criacao', models.DateTimeField(auto_now_add=True)),
+                ('atualizado_em', models.DateTimeField(auto_now=True, db_index=True)),
+                ('cliente', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='core.cliente')),
+                ('criado_por', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='series_criadas', to=settings.AUTH_USER_MODEL)),
+                ('especificador', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='core.especificador')),
+                ('loja', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='series_agendamento', to='core.loja')),
+                ('responsavel', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='series_responsaveis', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['inicio'],
+            },
+        ),
+        migrations.AddField(
+            model_name='agendamento',
+            name='serie',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='excecoes', to='core.serieagendamento'),
+        ),
+        migrations.AddConstraint(
+            model_name='agendamento',
+            constraint=models.UniqueConstraint(fields=('serie', 'ocorrencia_original'), name='unique_ocorrencia_por_serie'),
+        ),
+        migrations.AddIndex(
+            model_name='serieagendamento',
+            index=models.Index(fields=['sala', 'inicio', 'repetir_ate'], name='core_seriea_sala_e8d67f_idx'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.6 on 2026-10-19 06:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0040_agendamento_recorrente'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ItemPedidoConveniencia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('item', models.CharField(max_length=100)),
+                ('quantidade', models.PositiveIntegerField(default=1)),
+                ('agendamento', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='itens_conveniencia', to='core.agendamento')),
+            ],
+            options={
+                'ordering': ['agendamento', 'id'],
+                'constraints': [models.UniqueConstraint(fields=('agendamento', 'item'), name='unique_item_por_pedido')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-19 06:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0041_itens_conveniencia'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='agendamento',
+            name='pedido_versao',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
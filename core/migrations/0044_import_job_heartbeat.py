@@ -0,0 +1,27 @@
+# Generated by Django 5.2.6 on 2026-10-19 06:31
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def backfill_heartbeat(apps, schema_editor):
+    """Último sinal conhecido de cada job: término, início ou criação."""
+    ImportJob = apps.get_model('core', 'ImportJob')
+    ImportJob.objects.update(atualizado_em=Coalesce('finalizado_em', 'iniciado_em', 'criado_em'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0043_notification_counter'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='atualizado_em',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.RunPython(backfill_heartbeat, migrations.RunPython.noop),
+    ]
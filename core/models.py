@@ -23,6 +23,7 @@ class Cliente(models.Model):
     cpf_cnpj = models.CharField(max_length=20, blank=True, null=True)
     telefone = models.CharField(max_length=20, blank=True, null=True)
     email = models.EmailField(blank=True, null=True)
+    atualizado_em = models.DateTimeField(auto_now=True, null=True)
 
     def __str__(self):
         return self.nome_completo
@@ -117,18 +118,80 @@ class JornadaClienteHistorico(models.Model):
         return f'Comentário de {self.usuario.username if self.usuario else "Usuário Desconhecido"} em {self.data_edicao.strftime("%d/%m/%Y %H:%M")}'
 
 class Notification(models.Model):
+    """
+    Notificação de comentários em um orçamento. Enquanto não lida, novos
+    comentários no mesmo orçamento são agrupados nela: `comment` aponta para o
+    mais recente e `quantidade` conta os comentários agrupados.
+    """
     recipient = models.ForeignKey(User, on_delete=models.CASCADE, related_name='notifications')
+    orcamento = models.ForeignKey(Orcamento, on_delete=models.CASCADE, related_name='notifications')
     comment = models.ForeignKey(JornadaClienteHistorico, on_delete=models.CASCADE)
+    quantidade = models.PositiveIntegerField(default=1)
     is_read = models.BooleanField(default=False)
+    # Moved forward when a new comment is coalesced, so the row is ordered by its latest activity
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['recipient', 'is_read', 'created_at']),
+            models.Index(fields=['recipient', 'created_at']),
+        ]
+        constraints = [
+            # Outbox events are delivered at least once; redelivery must not duplicate rows
+            models.UniqueConstraint(fields=['recipient', 'comment'], name='unique_notification_recipient_comment'),
+            # Coalescing keeps at most one unread notification per recipient and orçamento
+            models.UniqueConstraint(
+                fields=['recipient', 'orcamento'],
+                condition=models.Q(is_read=False),
+                name='unique_unread_notification_per_orcamento',
+            ),
+        ]
 
     def __str__(self):
         return f'Notificação para {self.recipient.username} sobre o comentário {self.comment.id}'
 
 
+class NotificationEvent(models.Model):
+    """Outbox: um evento por comentário, expandido em Notification pelo worker (core.notifications)."""
+    STATUS_CHOICES = [
+        ('pendente', 'Pendente'),
+        ('processando', 'Processando'),
+        ('concluido', 'Concluído'),
+        ('erro', 'Erro'),
+    ]
+
+    comment = models.ForeignKey(JornadaClienteHistorico, on_delete=models.CASCADE, related_name='notification_events')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pendente')
+    # Next time the event may be picked up: retry backoff, or the lease of the worker holding it
+    disponivel_em = models.DateTimeField(default=timezone.now)
+    lote = models.CharField(max_length=32, blank=True)
+    tentativas = models.PositiveSmallIntegerField(default=0)
+    ultimo_erro = models.TextField(blank=True)
+    criado_em = models.DateTimeField(auto_now_add=True)
+    processado_em = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['status', 'disponivel_em']),
+            models.Index(fields=['lote']),
+        ]
+
+    def __str__(self):
+        return f'Evento de notificação do comentário {self.comment_id} ({self.get_status_display()})'
+
+
+class NotificationCounter(models.Model):
+    """Notificações não lidas de um usuário, mantidas pela entrega (core.notifications) para o badge."""
+    usuario = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='notification_counter')
+    nao_lidas = models.PositiveIntegerField(default=0)
+    atualizado_em = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.nao_lidas} notificações não lidas de {self.usuario_id}'
+
+
 class Agendamento(models.Model):
     SALA_CHOICES = [
         ('Esperienza 1', 'Esperienza 1'),
@@ -179,6 +242,8 @@ class Agendamento(models.Model):
     quantidade_convidados = models.PositiveIntegerField(default=1)
     conveniencia = models.BooleanField(default=False)
     conveniencia_pedido = models.JSONField(null=True, blank=True)
+    # Bumped whenever conveniencia_pedido changes; keys the cached comanda
+    pedido_versao = models.PositiveIntegerField(default=0)
     motivo = models.CharField(max_length=50, choices=MOTIVO_CHOICES)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='agendado')
     conveniencia_status = models.CharField(
@@ -187,13 +252,190 @@ class Agendamento(models.Model):
         default='pendente'
     )
     sala_limpa = models.BooleanField(default=False)
+    # Occurrence of a recurring series that was changed, moved or cancelled
+    serie = models.ForeignKey('SerieAgendamento', on_delete=models.SET_NULL, null=True, blank=True, related_name='excecoes')
+    ocorrencia_original = models.DateTimeField(null=True, blank=True)
     criado_por = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='agendamentos_criados')
     data_criacao = models.DateTimeField(auto_now_add=True)
+    atualizado_em = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         cliente_nome = self.cliente.nome_completo if self.cliente else "N/A"
         return f'Agendamento em {self.sala} para {cliente_nome} ({self.horario_inicio.strftime("%d/%m/%Y %H:%M")})'
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Lets the conveniência items be rebuilt only when the order actually changes
+        instance._pedido_carregado = instance.__dict__.get('conveniencia_pedido', models.DEFERRED)
+        return instance
+
     class Meta:
         ordering = ['horario_inicio']
+        indexes = [
+            models.Index(fields=['sala', 'horario_inicio', 'horario_fim']),
+            # Calendar feed: events overlapping [start, end) across all rooms
+            models.Index(fields=['horario_inicio', 'horario_fim']),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['serie', 'ocorrencia_original'], name='unique_ocorrencia_por_serie'),
+        ]
+
+
+class ItemPedidoConveniencia(models.Model):
+    """Item de um pedido de conveniência, normalizado a partir de Agendamento.conveniencia_pedido."""
+    agendamento = models.ForeignKey(Agendamento, on_delete=models.CASCADE, related_name='itens_conveniencia')
+    item = models.CharField(max_length=100)
+    quantidade = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        ordering = ['agendamento', 'id']
+        constraints = [
+            models.UniqueConstraint(fields=['agendamento', 'item'], name='unique_item_por_pedido'),
+        ]
+
+    def __str__(self):
+        return f'{self.quantidade}x {self.item}'
+
+
+class SerieAgendamento(models.Model):
+    """
+    Regra de um agendamento semanal recorrente. As ocorrências não são gravadas:
+    são calculadas para cada janela consultada (core.recurrence).
+    """
+    loja = models.ForeignKey(Loja, on_delete=models.CASCADE, related_name='series_agendamento')
+    responsavel = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='series_responsaveis')
+    cliente = models.ForeignKey(Cliente, on_delete=models.SET_NULL, null=True, blank=True)
+    especificador = models.ForeignKey(Especificador, on_delete=models.SET_NULL, null=True, blank=True)
+    sala = models.CharField(max_length=50, choices=Agendamento.SALA_CHOICES)
+    motivo = models.CharField(max_length=50, choices=Agendamento.MOTIVO_CHOICES)
+    quantidade_convidados = models.PositiveIntegerField(default=1)
+    inicio = models.DateTimeField(help_text='Início da primeira ocorrência.')
+    duracao_minutos = models.PositiveIntegerField()
+    intervalo_semanas = models.PositiveSmallIntegerField(default=1)
+    repetir_ate = models.DateField()
+    criado_por = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='series_criadas')
+    data_criacao = models.DateTimeField(auto_now_add=True)
+    atualizado_em = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        ordering = ['inicio']
+        indexes = [
+            models.Index(fields=['sala', 'inicio', 'repetir_ate']),
+        ]
+
+    def __str__(self):
+        return f'Série semanal em {self.sala} a partir de {self.inicio.strftime("%d/%m/%Y %H:%M")}'
+
+
+class AgendamentoExcluido(models.Model):
+    """
+    Registro (tombstone) de um agendamento ou série apagados, para a
+    sincronização incremental da agenda.
+    """
+    agendamento_id = models.PositiveIntegerField(null=True, blank=True)
+    serie_id = models.PositiveIntegerField(null=True, blank=True)
+    excluido_em = models.DateTimeField(auto_now_add=True, db_index=True)
 
+    class Meta:
+        ordering = ['excluido_em']
+
+    def __str__(self):
+        alvo = f'Série {self.serie_id}' if self.serie_id else f'Agendamento {self.agendamento_id}'
+        return f'{alvo} excluído em {self.excluido_em.strftime("%d/%m/%Y %H:%M")}'
+
+
+class DuplicateScanRun(models.Model):
+    iniciado_em = models.DateTimeField(auto_now_add=True)
+    finalizado_em = models.DateTimeField(null=True, blank=True)
+    completo = models.BooleanField(default=False)
+    clientes_analisados = models.PositiveIntegerField(default=0)
+    comparacoes = models.PositiveIntegerField(default=0)
+    candidatos_encontrados = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['-iniciado_em']
+
+    def __str__(self):
+        return f'Varredura de duplicados em {self.iniciado_em.strftime("%d/%m/%Y %H:%M")}'
+
+
+class DuplicateCandidate(models.Model):
+    STATUS_CHOICES = [
+        ('pendente', 'Pendente'),
+        ('confirmado', 'Confirmado'),
+        ('descartado', 'Descartado'),
+    ]
+
+    # cliente_a always holds the lower id so each pair is stored only once
+    cliente_a = models.ForeignKey(Cliente, on_delete=models.CASCADE, related_name='duplicados_como_a')
+    cliente_b = models.ForeignKey(Cliente, on_delete=models.CASCADE, related_name='duplicados_como_b')
+    score = models.FloatField()
+    motivos = models.CharField(max_length=200, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pendente')
+    scan = models.ForeignKey(DuplicateScanRun, on_delete=models.SET_NULL, null=True, blank=True, related_name='candidatos')
+    criado_em = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-score']
+        constraints = [
+            models.UniqueConstraint(fields=['cliente_a', 'cliente_b'], name='unique_duplicate_pair'),
+        ]
+        indexes = [
+            models.Index(fields=['status', '-score']),
+        ]
+
+    def __str__(self):
+        return f'{self.cliente_a} ~ {self.cliente_b} ({self.score:.2f})'
+
+
+class ImportJob(models.Model):
+    STATUS_CHOICES = [
+        ('pendente', 'Pendente'),
+        ('processando', 'Processando'),
+        ('concluido', 'Concluído'),
+        ('erro', 'Erro'),
+    ]
+
+    MODO_CHOICES = [
+        ('inserir', 'Importar novos'),
+        ('upsert', 'Importar e atualizar existentes'),
+        ('validar', 'Somente validar (dry-run)'),
+    ]
+
+    criado_por = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='import_jobs')
+    arquivo = models.FileField(upload_to='imports/')
+    nome_arquivo = models.CharField(max_length=255)
+    sha256 = models.CharField(max_length=64, blank=True, db_index=True)
+    modo = models.CharField(max_length=20, choices=MODO_CHOICES, default='inserir')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pendente')
+    total_linhas = models.PositiveIntegerField(default=0)
+    linhas_processadas = models.PositiveIntegerField(default=0)
+    criados = models.PositiveIntegerField(default=0)
+    atualizados = models.PositiveIntegerField(default=0)
+    inalterados = models.PositiveIntegerField(default=0)
+    ignorados = models.PositiveIntegerField(default=0)
+    erros = models.JSONField(default=list, blank=True)
+    resumo = models.JSONField(default=dict, blank=True)
+    relatorio = models.FileField(upload_to='imports/relatorios/', blank=True)
+    mensagem = models.TextField(blank=True)
+    criado_em = models.DateTimeField(auto_now_add=True)
+    iniciado_em = models.DateTimeField(null=True, blank=True)
+    # Heartbeat: bumped on every processed chunk, so a running job is never taken for a lost one
+    atualizado_em = models.DateTimeField(default=timezone.now)
+    finalizado_em = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-criado_em']
+        indexes = [
+            models.Index(fields=['status', 'criado_em']),
+        ]
+
+    def __str__(self):
+        return f'Importação {self.nome_arquivo} ({self.get_status_display()})'
+
+    @property
+    def progresso(self):
+        if not self.total_linhas:
+            return 100 if self.status == 'concluido' else 0
+        return min(100, round(100 * self.linhas_processadas / self.total_linhas))
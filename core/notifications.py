@@ -0,0 +1,406 @@
+"""
+Entrega assíncrona de notificações de comentários (transactional outbox).
+
+Criar um comentário grava apenas um NotificationEvent na mesma transação. Os
+eventos são expandidos em Notification, em lotes, por um pool de threads do
+próprio processo (NOTIFICATIONS_USE_THREAD_POOL) ou pelo worker dedicado
+`run_notification_worker`. A entrega é "pelo menos uma vez": um lote que falha
+volta para a fila com espera crescente, e a reentrega é inofensiva: comentários
+já notificados (a notificação lida ou não) são ignorados e não voltam a contar. No modo pool de threads,
+cada entrega agenda a próxima para quando o evento seguinte vencer (nova
+tentativa ou reserva expirada), e a primeira requisição do processo entrega o
+que ficou na fila antes de um reinício.
+
+O número de notificações não lidas de cada usuário fica em NotificationCounter,
+compartilhado por todos os processos: a entrega incrementa o contador na mesma
+transação em que grava as notificações, a página de notificações o zera e o
+comando `reconcile_notification_counters` o recalcula a partir do banco (um
+contador ausente é calculado na primeira leitura). Após cada entrega, `broker` acorda as conexões
+SSE abertas dos destinatários (core.realtime).
+"""
+import asyncio
+import csv
+import logging
+import threading
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Count, F, Max
+from django.utils import timezone
+
+from .models import JornadaClienteHistorico, Notification, NotificationCounter, NotificationEvent, Orcamento, User
+
+logger = logging.getLogger(__name__)
+
+NOTIFICATION_BATCH_SIZE = 200
+MAX_ATTEMPTS = 5
+RETRY_BASE_SECONDS = 10
+# A worker that dies mid-batch releases its events after this long.
+LEASE_SECONDS = 300
+
+RETENTION_DAYS = 90
+PURGE_CHUNK_SIZE = 1000
+ARCHIVE_FIELDS = ['id', 'recipient_id', 'orcamento_id', 'comment_id', 'quantidade', 'created_at']
+
+# Never wake up sooner than this to retry, even when an event is already due.
+MIN_RETRY_DELAY_SECONDS = 1
+
+_executor = None
+_timer = None
+_timer_due = None
+_timer_lock = threading.Lock()
+_started = False
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        # A single consumer: batches are serialized, so they never compete for the write lock
+        _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='notifications')
+    return _executor
+
+
+class Broker:
+    """Pub/sub em memória: user_id -> filas das conexões abertas, cada uma com seu event loop."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)
+
+    def subscribe(self, user_id):
+        queue = asyncio.Queue()
+        entry = (asyncio.get_running_loop(), queue)
+        with self._lock:
+            self._subscribers[user_id].add(entry)
+        return entry
+
+    def unsubscribe(self, user_id, entry):
+        with self._lock:
+            self._subscribers[user_id].discard(entry)
+            if not self._subscribers[user_id]:
+                del self._subscribers[user_id]
+
+    def publish(self, user_ids):
+        """Acorda as conexões dos usuários informados. Pode ser chamado de qualquer thread."""
+        with self._lock:
+            entries = [entry for user_id in user_ids for entry in self._subscribers.get(user_id, ())]
+        for loop, queue in entries:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, None)
+            except RuntimeError:
+                # The connection's event loop is already closed
+                pass
+
+
+broker = Broker()
+
+
+def unread_count(user_id):
+    """Número de notificações não lidas do usuário, lido do contador (calculado se ainda não existe)."""
+    count = NotificationCounter.objects.filter(pk=user_id).values_list('nao_lidas', flat=True).first()
+    if count is None:
+        reconcile_unread_counts([user_id])
+        count = NotificationCounter.objects.filter(pk=user_id).values_list('nao_lidas', flat=True).first() or 0
+    return count
+
+
+def increment_unread(counts):
+    """Soma `counts` ({user_id: novas}) aos contadores (os ausentes serão calculados na leitura)."""
+    for user_id, amount in counts.items():
+        if amount:
+            NotificationCounter.objects.filter(pk=user_id).update(nao_lidas=F('nao_lidas') + amount)
+
+
+def reset_unread(user_id):
+    NotificationCounter.objects.update_or_create(pk=user_id, defaults={'nao_lidas': 0})
+
+
+def reconcile_unread_counts(user_ids=None):
+    """Regrava os contadores a partir do banco (todos os usuários, ou apenas `user_ids`). Retorna quantos."""
+    users = User.objects.all() if user_ids is None else User.objects.filter(pk__in=user_ids)
+    user_ids = list(users.values_list('id', flat=True))
+    counts = dict.fromkeys(user_ids, 0)
+    counts.update(
+        Notification.objects.filter(recipient_id__in=user_ids, is_read=False)
+        .values('recipient_id').annotate(total=Count('id')).values_list('recipient_id', 'total')
+    )
+    NotificationCounter.objects.bulk_create(
+        [NotificationCounter(usuario_id=user_id, nao_lidas=count) for user_id, count in counts.items()],
+        update_conflicts=True, unique_fields=['usuario'], update_fields=['nao_lidas', 'atualizado_em'],
+        batch_size=500,
+    )
+    return len(counts)
+
+
+def enqueue_comment(comment):
+    """Grava o evento de outbox do comentário; a entrega acontece depois do commit."""
+    NotificationEvent.objects.create(comment=comment)
+    if getattr(settings, 'NOTIFICATIONS_USE_THREAD_POOL', True):
+        transaction.on_commit(lambda: _get_executor().submit(_drain_in_thread))
+
+
+def start():
+    """Entrega os eventos que ficaram na fila antes do reinício (uma vez por processo)."""
+    global _started
+    if _started or not getattr(settings, 'NOTIFICATIONS_USE_THREAD_POOL', True):
+        return
+    _started = True
+    _get_executor().submit(_drain_in_thread)
+
+
+def _schedule_drain(delay):
+    """Agenda uma entrega daqui a `delay` segundos; só o timer mais próximo é mantido."""
+    global _timer, _timer_due
+    due = time.monotonic() + delay
+    with _timer_lock:
+        if _timer is not None:
+            if _timer_due <= due:
+                return
+            _timer.cancel()
+        _timer = threading.Timer(delay, _submit_drain)
+        _timer.daemon = True
+        _timer_due = due
+        _timer.start()
+
+
+def _submit_drain():
+    global _timer
+    with _timer_lock:
+        _timer = None
+    _get_executor().submit(_drain_in_thread)
+
+
+def next_due():
+    """Quando vence o próximo evento ainda não entregue (nova tentativa ou reserva expirada), ou None."""
+    return NotificationEvent.objects.filter(status__in=['pendente', 'processando']).order_by(
+        'disponivel_em'
+    ).values_list('disponivel_em', flat=True).first()
+
+
+def _drain_in_thread():
+    close_old_connections()
+    try:
+        batch_size = getattr(settings, 'NOTIFICATIONS_BATCH_SIZE', NOTIFICATION_BATCH_SIZE)
+        while process_batch(batch_size):
+            pass
+        # Failed batches were pushed back with a backoff: come back when they are due
+        due = next_due()
+        if due is not None:
+            _schedule_drain(max((due - timezone.now()).total_seconds(), MIN_RETRY_DELAY_SECONDS))
+    except Exception:
+        logger.exception('Notification delivery failed')
+    finally:
+        close_old_connections()
+
+
+def claim_batch(batch_size=NOTIFICATION_BATCH_SIZE):
+    """
+    Reserva até `batch_size` eventos vencidos (pendentes, ou com a reserva de
+    outro worker expirada) e retorna o identificador do lote.
+    """
+    now = timezone.now()
+    due = NotificationEvent.objects.filter(status__in=['pendente', 'processando'], disponivel_em__lte=now)
+    ids = list(due.order_by('id').values_list('id', flat=True)[:batch_size])
+    if not ids:
+        return None
+    lote = uuid.uuid4().hex
+    claimed = due.filter(pk__in=ids).update(
+        status='processando', lote=lote, disponivel_em=now + timedelta(seconds=LEASE_SECONDS)
+    )
+    return lote if claimed else None
+
+
+def _recipients(comments):
+    """
+    Calcula os destinatários de cada comentário com um número fixo de consultas:
+    dono do orçamento, gerentes da loja do dono, inscritos e, a partir de uma
+    menção @admin, os administradores (que passam a ser inscritos do orçamento).
+    Retorna {comment_id: set(user_id)}.
+    """
+    orcamento_ids = {c['orcamento_id'] for c in comments}
+    owners = dict(Orcamento.objects.filter(pk__in=orcamento_ids).values_list('id', 'usuario_id'))
+    lojas = dict(User.objects.filter(pk__in=set(owners.values())).values_list('id', 'loja_id'))
+    gerentes = defaultdict(set)
+    for user_id, loja_id in User.objects.filter(
+        role='gerente', loja_id__in={l for l in lojas.values() if l}
+    ).values_list('id', 'loja_id'):
+        gerentes[loja_id].add(user_id)
+
+    Subscription = Orcamento.subscribers.through
+    subscribers = defaultdict(set)
+    for orcamento_id, user_id in Subscription.objects.filter(orcamento_id__in=orcamento_ids).values_list(
+        'orcamento_id', 'user_id'
+    ):
+        subscribers[orcamento_id].add(user_id)
+
+    # Comments are processed in order: a mention subscribes the admins to later comments too
+    first_mention = {}
+    for c in sorted(comments, key=lambda c: c['id']):
+        if '@admin' in str(c['comentario'] or '').lower():
+            first_mention.setdefault(c['orcamento_id'], c['id'])
+    admin_ids = set()
+    if first_mention:
+        admin_ids = set(User.objects.filter(role='administrador').values_list('id', flat=True))
+        Subscription.objects.bulk_create(
+            [Subscription(orcamento_id=o, user_id=a) for o in first_mention for a in admin_ids],
+            ignore_conflicts=True,
+        )
+
+    result = {}
+    for c in comments:
+        owner_id = owners.get(c['orcamento_id'])
+        recipients = {owner_id} if owner_id else set()
+        recipients |= gerentes.get(lojas.get(owner_id), set())
+        recipients |= subscribers[c['orcamento_id']]
+        if c['id'] >= first_mention.get(c['orcamento_id'], c['id'] + 1):
+            recipients |= admin_ids
+        # The author is not notified of their own comment
+        recipients.discard(c['usuario_id'])
+        result[c['id']] = recipients
+    return result
+
+
+def _coalesce(comments, recipients):
+    """
+    Agrupa os comentários do lote por (destinatário, orçamento) e grava uma
+    notificação por grupo: atualiza a notificação não lida existente (comentário
+    mais recente, quantidade, data) ou cria uma nova. Comentários já contados
+    numa notificação, lida ou não (reentrega), são ignorados.
+    Retorna {user_id: notificações não lidas novas}.
+    """
+    orcamento_of = {c['id']: c['orcamento_id'] for c in comments}
+    groups = defaultdict(list)  # (user_id, orcamento_id) -> comment ids
+    for comment_id in sorted(recipients):
+        for user_id in recipients[comment_id]:
+            groups[(user_id, orcamento_of[comment_id])].append(comment_id)
+    if not groups:
+        return {}
+
+    unread = {
+        (n.recipient_id, n.orcamento_id): n
+        for n in Notification.objects.filter(
+            is_read=False,
+            recipient_id__in={user_id for user_id, _ in groups},
+            orcamento_id__in={orcamento_id for _, orcamento_id in groups},
+        ).only('id', 'recipient_id', 'orcamento_id', 'comment_id', 'quantidade')
+    }
+    # Newest comment already notified per group, read notifications included: a redelivered
+    # comment must neither be re-counted nor recreate a notification the user already read
+    notified = {
+        (row['recipient_id'], row['orcamento_id']): row['ultimo']
+        for row in Notification.objects.filter(
+            recipient_id__in={user_id for user_id, _ in groups},
+            orcamento_id__in={orcamento_id for _, orcamento_id in groups},
+        ).values('recipient_id', 'orcamento_id').annotate(ultimo=Max('comment_id'))
+    }
+    now = timezone.now()
+    to_update, to_create = [], []
+    new_counts = defaultdict(int)
+    for (user_id, orcamento_id), comment_ids in groups.items():
+        last_notified = notified.get((user_id, orcamento_id)) or 0
+        fresh = [comment_id for comment_id in comment_ids if comment_id > last_notified]
+        if not fresh:
+            continue
+        current = unread.get((user_id, orcamento_id))
+        if current is None:
+            to_create.append(Notification(
+                recipient_id=user_id, orcamento_id=orcamento_id,
+                comment_id=fresh[-1], quantidade=len(fresh),
+            ))
+            new_counts[user_id] += 1
+        else:
+            current.comment_id = fresh[-1]
+            current.quantidade += len(fresh)
+            current.created_at = now
+            to_update.append(current)
+
+    Notification.objects.bulk_update(to_update, ['comment_id', 'quantidade', 'created_at'], batch_size=500)
+    Notification.objects.bulk_create(to_create, batch_size=500, ignore_conflicts=True)
+    # Coalesced notifications do not change the unread count but still wake the SSE streams
+    for notification in to_update:
+        new_counts.setdefault(notification.recipient_id, 0)
+    return new_counts
+
+
+def deliver(lote):
+    """Expande os eventos do lote em notificações (agrupadas por orçamento) e os marca como concluídos."""
+    events = list(NotificationEvent.objects.filter(lote=lote, status='processando').values_list('id', 'comment_id'))
+    comments = list(JornadaClienteHistorico.objects.filter(
+        pk__in={comment_id for _, comment_id in events}
+    ).values('id', 'orcamento_id', 'usuario_id', 'comentario'))
+    with transaction.atomic():
+        new_counts = _coalesce(comments, _recipients(comments))
+        # Same transaction as the notifications, so the counters cannot drift from them
+        increment_unread(new_counts)
+        NotificationEvent.objects.filter(lote=lote, status='processando').update(
+            status='concluido', processado_em=timezone.now(), ultimo_erro=''
+        )
+        # Wakes up the recipients' open SSE connections (core.realtime)
+        transaction.on_commit(lambda: broker.publish(new_counts.keys()))
+    return len(events)
+
+
+def _fail(lote, error):
+    """Devolve o lote para a fila com espera exponencial, ou o marca como erro após MAX_ATTEMPTS."""
+    now = timezone.now()
+    for event in NotificationEvent.objects.filter(lote=lote, status='processando'):
+        event.tentativas += 1
+        event.ultimo_erro = str(error)
+        if event.tentativas >= MAX_ATTEMPTS:
+            event.status = 'erro'
+        else:
+            event.status = 'pendente'
+            event.disponivel_em = now + timedelta(seconds=RETRY_BASE_SECONDS * 2 ** (event.tentativas - 1))
+        event.save(update_fields=['tentativas', 'ultimo_erro', 'status', 'disponivel_em'])
+
+
+def process_batch(batch_size=NOTIFICATION_BATCH_SIZE):
+    """Reserva e entrega um lote de eventos. Retorna quantos eventos foram entregues."""
+    lote = claim_batch(batch_size)
+    if lote is None:
+        return 0
+    try:
+        return deliver(lote)
+    except Exception as e:
+        logger.exception('Notification batch %s failed', lote)
+        _fail(lote, e)
+        return 0
+
+
+def purge_old_notifications(days=RETENTION_DAYS, chunk_size=PURGE_CHUNK_SIZE, archive=None):
+    """
+    Apaga, em blocos de `chunk_size`, as notificações lidas mais antigas que
+    `days` dias e os eventos de outbox já concluídos no mesmo período. Se
+    `archive` (arquivo texto) for informado, as notificações são gravadas nele
+    em CSV antes de serem apagadas. Retorna (notificações, eventos) apagados.
+    """
+    cutoff = timezone.now() - timedelta(days=days)
+    writer = None
+    if archive is not None:
+        writer = csv.writer(archive)
+        writer.writerow(ARCHIVE_FIELDS)
+
+    purged = 0
+    old = Notification.objects.filter(is_read=True, created_at__lt=cutoff).order_by('id')
+    while True:
+        rows = list(old.values_list(*ARCHIVE_FIELDS)[:chunk_size])
+        if not rows:
+            break
+        if writer:
+            writer.writerows(rows)
+        # Short transactions keep the write lock free for the rest of the app between chunks
+        purged += Notification.objects.filter(pk__in=[row[0] for row in rows]).delete()[0]
+
+    events = 0
+    done = NotificationEvent.objects.filter(status='concluido', processado_em__lt=cutoff).order_by('id')
+    while True:
+        ids = list(done.values_list('id', flat=True)[:chunk_size])
+        if not ids:
+            break
+        events += NotificationEvent.objects.filter(pk__in=ids).delete()[0]
+    return purged, events
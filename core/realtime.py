@@ -0,0 +1,157 @@
+"""
+Publicação em tempo real (Server-Sent Events) de notificações e da agenda.
+
+Cada conexão SSE registra uma fila asyncio no broker em memória do processo
+(core.notifications.broker). O worker de notificações publica os destinatários
+após o commit, acordando suas conexões, que então buscam no banco as
+notificações novas. Em implantações com vários processos o evento pode ter sido
+entregue em outro processo; por isso cada conexão também consulta o banco a
+cada NOTIFICATIONS_SSE_POLL_INTERVAL segundos.
+
+O fluxo da agenda segue o mesmo esquema no canal core.agenda.AGENDA_CHANNEL,
+usando o token de sincronização da agenda como id dos eventos.
+"""
+import asyncio
+import json
+from datetime import datetime, timezone as dt_timezone
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .models import Notification
+from . import agenda, notifications
+
+KEEPALIVE_SECONDS = 15
+# Streams are closed periodically; EventSource reconnects with Last-Event-ID.
+MAX_STREAM_SECONDS = 300
+RETRY_MILLISECONDS = 3000
+MAX_EVENTS_PER_WAKEUP = 20
+
+
+def _sse(event, data, event_id=None):
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'event: {event}')
+    lines.append(f'data: {json.dumps(data, ensure_ascii=False)}')
+    return '\n'.join(lines) + '\n\n'
+
+
+def _to_cursor(moment):
+    """Event ids are the notification's last activity in epoch microseconds."""
+    return int(moment.timestamp() * 1_000_000)
+
+
+def _from_cursor(cursor):
+    return datetime.fromtimestamp(cursor / 1_000_000, tz=dt_timezone.utc)
+
+
+def _latest_cursor(user_id):
+    latest = Notification.objects.filter(recipient_id=user_id).order_by('-created_at').values_list(
+        'created_at', flat=True
+    ).first()
+    return _to_cursor(latest) if latest else 0
+
+
+def _new_notifications(user_id, cursor):
+    """Notificações criadas ou agrupadas (created_at avançado) depois do cursor."""
+    rows = (
+        Notification.objects.filter(recipient_id=user_id, created_at__gt=_from_cursor(cursor))
+        .order_by('created_at')
+        .values('id', 'created_at', 'quantidade', 'comment__comentario', 'comment__usuario__username',
+                'orcamento_id', 'orcamento__numero_orcamento')[:MAX_EVENTS_PER_WAKEUP]
+    )
+    return [
+        {
+            'id': row['id'],
+            'cursor': _to_cursor(row['created_at']),
+            'orcamento_id': row['orcamento_id'],
+            'numero_orcamento': row['orcamento__numero_orcamento'],
+            'quantidade': row['quantidade'],
+            'autor': row['comment__usuario__username'],
+            'comentario': (row['comment__comentario'] or '')[:140],
+        }
+        for row in rows
+    ]
+
+
+async def event_stream(user_id, last_event_id=None):
+    """
+    Gera o fluxo SSE do usuário: a contagem de não lidas ao conectar e, a cada
+    notificação nova ou agrupada, um evento 'notification' seguido da contagem
+    atualizada. `last_event_id` é o cursor do último evento recebido.
+    """
+    poll_interval = getattr(settings, 'NOTIFICATIONS_SSE_POLL_INTERVAL', 10)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + MAX_STREAM_SECONDS
+    broker = notifications.broker
+    entry = broker.subscribe(user_id)
+    try:
+        if last_event_id is None:
+            last_event_id = await sync_to_async(_latest_cursor)(user_id)
+        yield f'retry: {RETRY_MILLISECONDS}\n\n'
+        yield _sse('unread', {'count': await sync_to_async(notifications.unread_count)(user_id)})
+        # Catch up on anything delivered while the client was reconnecting
+        woken = True
+        while loop.time() < deadline:
+            if woken:
+                new = await sync_to_async(_new_notifications)(user_id, last_event_id)
+                for item in new:
+                    last_event_id = item['cursor']
+                    yield _sse('notification', item, event_id=item['cursor'])
+                if new:
+                    yield _sse('unread', {'count': await sync_to_async(notifications.unread_count)(user_id)})
+            timeout = min(KEEPALIVE_SECONDS, poll_interval or KEEPALIVE_SECONDS, max(deadline - loop.time(), 0))
+            try:
+                await asyncio.wait_for(entry[1].get(), timeout=timeout)
+                woken = True
+            except asyncio.TimeoutError:
+                woken = bool(poll_interval)
+                yield ': keepalive\n\n'
+    finally:
+        broker.unsubscribe(user_id, entry)
+
+
+async def agenda_stream(last_event_id=None):
+    """
+    Gera o fluxo SSE da agenda: a cada alteração, um evento 'agendamento' por
+    agendamento criado ou alterado, um 'removido' por exclusão, um 'series' se
+    alguma série recorrente mudou e um 'sync' com o novo token (id do evento,
+    usado na reconexão).
+    """
+    poll_interval = getattr(settings, 'AGENDA_SSE_POLL_INTERVAL', 10)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + MAX_STREAM_SECONDS
+    entry = agenda.broker.subscribe(agenda.AGENDA_CHANNEL)
+    try:
+        yield f'retry: {RETRY_MILLISECONDS}\n\n'
+        # `token` is the instant up to which the client has every change; a reconnecting
+        # client first receives what changed since its last event
+        token = last_event_id if last_event_id and agenda.parse_token(last_event_id) else None
+        if token is None:
+            token = await sync_to_async(agenda.sync_token)()
+            yield _sse('sync', {'token': token}, event_id=token)
+        woken = True
+        while loop.time() < deadline:
+            if woken:
+                # Changes stamped inside the sync margin are read again (clients replace them by id)
+                if await sync_to_async(agenda.changed_since)(agenda.parse_token(token)):
+                    current = await sync_to_async(agenda.sync_token)()
+                    alterados, removidos = await sync_to_async(agenda.changes_since)(agenda.parse_token(token))
+                    for event in alterados:
+                        yield _sse('agendamento', event)
+                    for pk in removidos:
+                        yield _sse('removido', {'id': pk})
+                    if await sync_to_async(agenda.series_changed_since)(agenda.parse_token(token)):
+                        yield _sse('series', {})
+                    token = current
+                    yield _sse('sync', {'token': token}, event_id=token)
+            timeout = min(KEEPALIVE_SECONDS, poll_interval or KEEPALIVE_SECONDS, max(deadline - loop.time(), 0))
+            try:
+                await asyncio.wait_for(entry[1].get(), timeout=timeout)
+                woken = True
+            except asyncio.TimeoutError:
+                woken = bool(poll_interval)
+                yield ': keepalive\n\n'
+    finally:
+        agenda.broker.unsubscribe(agenda.AGENDA_CHANNEL, entry)
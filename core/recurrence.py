@@ -0,0 +1,151 @@
+"""
+Agendamentos recorrentes.
+
+Uma SerieAgendamento guarda apenas a regra (primeira ocorrência, duração,
+intervalo em semanas e data final). As ocorrências são calculadas sob demanda,
+só para a janela consultada, com aritmética vetorizada sobre os índices das
+ocorrências. Uma ocorrência alterada, movida ou cancelada é materializada como
+um Agendamento comum ligado à série (serie + ocorrencia_original), que passa a
+substituir a ocorrência calculada.
+"""
+from collections import namedtuple
+from datetime import datetime, time, timedelta
+
+import numpy as np
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Agendamento, SerieAgendamento
+
+# Upper bound on the occurrences of a single series (five years, weekly).
+MAX_OCORRENCIAS = 260
+INTERVALOS_SEMANAS = (1, 2, 3, 4)
+
+Ocorrencia = namedtuple('Ocorrencia', 'serie inicio fim')
+
+
+def _local(moment):
+    """Horário local sem fuso: ocorrências repetem o mesmo horário de parede."""
+    return np.datetime64(timezone.localtime(moment).replace(tzinfo=None), 'us')
+
+
+def occurrence_count(inicio, intervalo_semanas, repetir_ate):
+    """Quantas ocorrências a regra gera até `repetir_ate`, sem o limite MAX_OCORRENCIAS."""
+    first = _local(inicio)
+    last_start = np.datetime64(datetime.combine(repetir_ate, time.max), 'us')
+    if last_start < first:
+        return 0
+    return int((last_start - first) // np.timedelta64(7 * intervalo_semanas, 'D')) + 1
+
+
+def last_allowed_date(inicio, intervalo_semanas):
+    """Última data final que mantém a série dentro de MAX_OCORRENCIAS."""
+    return timezone.localtime(inicio).date() + timedelta(weeks=intervalo_semanas * (MAX_OCORRENCIAS - 1))
+
+
+def occurrence_starts(inicio, duracao, intervalo_semanas, repetir_ate, start=None, end=None):
+    """
+    Inícios (horário local, datetime64) das ocorrências da regra que tocam a
+    janela [start, end); sem janela, todas as ocorrências.
+    """
+    first = _local(inicio)
+    step = np.timedelta64(7 * intervalo_semanas, 'D')
+    dur = np.timedelta64(int(duracao.total_seconds() * 1_000_000), 'us')
+    total = min(occurrence_count(inicio, intervalo_semanas, repetir_ate), MAX_OCORRENCIAS)
+    if not total:
+        return np.array([], dtype='datetime64[us]')
+
+    k_first, k_last = 0, total - 1
+    if start is not None:
+        # First occurrence still open at `start`
+        k_first = max(k_first, int(-((first + dur - _local(start)) // step)))
+    if end is not None:
+        k_last = min(k_last, int((_local(end) - first - np.timedelta64(1, 'us')) // step))
+    if k_first > k_last:
+        return np.array([], dtype='datetime64[us]')
+    starts = first + np.arange(k_first, k_last + 1) * step
+    if start is not None:
+        starts = starts[starts + dur > _local(start)]
+    return starts
+
+
+def _aware(starts):
+    tz = timezone.get_current_timezone()
+    return [timezone.make_aware(value, tz) for value in starts.astype(datetime).tolist()]
+
+
+def series_occurrences(serie, start=None, end=None):
+    """Ocorrências calculadas de uma série (sem descontar exceções): [(inicio, fim)]."""
+    duracao = timedelta(minutes=serie.duracao_minutos)
+    starts = occurrence_starts(serie.inicio, duracao, serie.intervalo_semanas, serie.repetir_ate, start, end)
+    return [(inicio, inicio + duracao) for inicio in _aware(starts)]
+
+
+def expand(start, end, salas=None, select_related=False):
+    """
+    Ocorrências de todas as séries que tocam [start, end), já sem as que foram
+    materializadas como exceção. Retorna [Ocorrencia(serie, inicio, fim)] por início.
+    """
+    series = SerieAgendamento.objects.filter(inicio__lt=end, repetir_ate__gte=timezone.localtime(start).date())
+    if salas is not None:
+        series = series.filter(sala__in=list(salas))
+    if select_related:
+        series = series.select_related('cliente', 'responsavel', 'especificador')
+    series = list(series)
+    if not series:
+        return []
+
+    materialized = set(
+        Agendamento.objects.filter(
+            serie__in=series, ocorrencia_original__lt=end,
+            ocorrencia_original__gte=start - max(timedelta(minutes=serie.duracao_minutos) for serie in series),
+        ).values_list('serie_id', 'ocorrencia_original')
+    )
+    ocorrencias = [
+        Ocorrencia(serie, inicio, fim)
+        for serie in series
+        for inicio, fim in series_occurrences(serie, start, end)
+        if (serie.pk, inicio) not in materialized
+    ]
+    ocorrencias.sort(key=lambda ocorrencia: ocorrencia.inicio)
+    return ocorrencias
+
+
+def parse_occurrence(serie, value):
+    """Valida que `value` (ISO 8601) é uma ocorrência da série. Retorna (inicio, fim) ou None."""
+    try:
+        moment = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except (AttributeError, ValueError):
+        return None
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    for inicio, fim in series_occurrences(serie, moment, moment + timedelta(microseconds=1)):
+        if inicio == moment:
+            return inicio, fim
+    return None
+
+
+def materialize(serie, inicio, fim, **fields):
+    """
+    Grava a ocorrência como Agendamento ligado à série (ou devolve a já gravada).
+    `fields` sobrescreve os valores copiados da série, ex.: status='cancelado'.
+    """
+    with transaction.atomic():
+        agendamento, _ = Agendamento.objects.get_or_create(
+            serie=serie,
+            ocorrencia_original=inicio,
+            defaults={
+                'loja_id': serie.loja_id,
+                'responsavel_id': serie.responsavel_id,
+                'cliente_id': serie.cliente_id,
+                'especificador_id': serie.especificador_id,
+                'sala': serie.sala,
+                'motivo': serie.motivo,
+                'quantidade_convidados': serie.quantidade_convidados,
+                'horario_inicio': inicio,
+                'horario_fim': fim,
+                'criado_por_id': serie.criado_por_id,
+                **fields,
+            },
+        )
+    return agendamento
@@ -0,0 +1,191 @@
+"""
+Busca global (omnisearch) sobre orçamentos, clientes, especificadores,
+comentários da jornada e agendamentos.
+
+O índice é uma tabela virtual FTS5 do SQLite (core_search_index), mantida
+incrementalmente pelos signals em core/signals.py. Cada documento guarda o
+usuário e a loja donos do registro para que a busca respeite o papel de quem
+pesquisa.
+"""
+import html
+import re
+
+from django.db import connection
+
+SEARCH_TABLE = 'core_search_index'
+
+# The FTS rowid is derived from the object id so a document can be replaced or
+# removed by primary key without scanning the index.
+TIPO_CODES = {
+    'orcamento': 1,
+    'comentario': 2,
+    'cliente': 3,
+    'especificador': 4,
+    'agendamento': 5,
+}
+ROWID_STRIDE = 8
+
+# Columns selected by every SOURCE_SQL statement, in index column order.
+INDEX_COLUMNS = 'rowid, tipo, objeto_id, usuario_id, loja_id, titulo, conteudo'
+
+SOURCE_SQL = {
+    'orcamento': """
+        SELECT o.id * 8 + 1, 'orcamento', o.id, o.usuario_id, u.loja_id,
+               COALESCE(o.numero_orcamento, ''),
+               COALESCE(c.nome_completo, '') || ' ' || COALESCE(e.nome_completo, '')
+        FROM core_orcamento o
+        JOIN core_user u ON u.id = o.usuario_id
+        LEFT JOIN core_cliente c ON c.id = o.nome_cliente_id
+        LEFT JOIN core_especificador e ON e.id = o.especificador_id
+    """,
+    'comentario': """
+        SELECT j.id * 8 + 2, 'comentario', j.id, o.usuario_id, u.loja_id,
+               COALESCE(o.numero_orcamento, ''), j.comentario
+        FROM core_jornadaclientehistorico j
+        JOIN core_orcamento o ON o.id = j.orcamento_id
+        JOIN core_user u ON u.id = o.usuario_id
+    """,
+    'cliente': """
+        SELECT c.id * 8 + 3, 'cliente', c.id, NULL, NULL, c.nome_completo,
+               COALESCE(c.cpf_cnpj, '') || ' ' || COALESCE(c.email, '') || ' ' || COALESCE(c.telefone, '')
+        FROM core_cliente c
+    """,
+    'especificador': """
+        SELECT e.id * 8 + 4, 'especificador', e.id, NULL, NULL, e.nome_completo, ''
+        FROM core_especificador e
+    """,
+    'agendamento': """
+        SELECT a.id * 8 + 5, 'agendamento', a.id, a.responsavel_id, a.loja_id, a.sala,
+               a.motivo || ' ' || COALESCE(c.nome_completo, '') || ' ' || COALESCE(e.nome_completo, '')
+        FROM core_agendamento a
+        LEFT JOIN core_cliente c ON c.id = a.cliente_id
+        LEFT JOIN core_especificador e ON e.id = a.especificador_id
+    """,
+}
+
+# Main table and its alias in each SOURCE_SQL statement.
+SOURCE_TABLES = {
+    'orcamento': ('core_orcamento', 'o'),
+    'comentario': ('core_jornadaclientehistorico', 'j'),
+    'cliente': ('core_cliente', 'c'),
+    'especificador': ('core_especificador', 'e'),
+    'agendamento': ('core_agendamento', 'a'),
+}
+
+CHUNK_SIZE = 500
+DEFAULT_LIMIT = 20
+
+
+def search_available():
+    return connection.vendor == 'sqlite'
+
+
+def _chunks(ids):
+    ids = list(ids)
+    for start in range(0, len(ids), CHUNK_SIZE):
+        yield ids[start:start + CHUNK_SIZE]
+
+
+def reindex(tipo, ids, column='id'):
+    """
+    Reindexa os documentos `tipo` cujo `column` (na tabela de origem) está em `ids`.
+    Ex.: reindex('orcamento', [cliente.pk], column='nome_cliente_id').
+    """
+    if not search_available() or not ids:
+        return
+    table, alias = SOURCE_TABLES[tipo]
+    with connection.cursor() as cursor:
+        if column != 'id':
+            related_ids = []
+            for chunk in _chunks(ids):
+                placeholders = ', '.join(['%s'] * len(chunk))
+                cursor.execute(f'SELECT id FROM {table} WHERE {column} IN ({placeholders})', chunk)
+                related_ids.extend(row[0] for row in cursor.fetchall())
+            ids = related_ids
+        remove(tipo, ids)
+        for chunk in _chunks(ids):
+            placeholders = ', '.join(['%s'] * len(chunk))
+            cursor.execute(
+                f'INSERT INTO {SEARCH_TABLE} ({INDEX_COLUMNS}) {SOURCE_SQL[tipo]} WHERE {alias}.id IN ({placeholders})',
+                chunk,
+            )
+
+
+def remove(tipo, ids):
+    if not search_available() or not ids:
+        return
+    code = TIPO_CODES[tipo]
+    with connection.cursor() as cursor:
+        for chunk in _chunks(ids):
+            placeholders = ', '.join(['%s'] * len(chunk))
+            cursor.execute(
+                f'DELETE FROM {SEARCH_TABLE} WHERE rowid IN ({placeholders})',
+                [pk * ROWID_STRIDE + code for pk in chunk],
+            )
+
+
+def rebuild_index():
+    """Reconstrói o índice inteiro com um INSERT ... SELECT por tipo."""
+    if not search_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+        for sql in SOURCE_SQL.values():
+            cursor.execute(f'INSERT INTO {SEARCH_TABLE} ({INDEX_COLUMNS}) {sql}')
+        cursor.execute(f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}) VALUES ('optimize')")
+
+
+def build_match_query(text):
+    """Converte o texto digitado em uma expressão MATCH segura (prefixo em cada termo)."""
+    terms = re.findall(r'\w+', text or '')
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def _scope_sql(user):
+    """Restringe os resultados ao que o papel do usuário pode ver."""
+    if user.role == 'administrador':
+        return '', []
+    if user.role == 'gerente':
+        return "AND (tipo IN ('cliente', 'especificador') OR loja_id = %s)", [user.loja_id]
+    if user.role == 'consultor':
+        return "AND (tipo IN ('cliente', 'especificador') OR usuario_id = %s)", [user.pk]
+    if user.role == 'facilitis':
+        return "AND tipo IN ('cliente', 'especificador', 'agendamento')", []
+    return 'AND 0', []
+
+
+def _format_snippet(snippet):
+    return html.escape(snippet).replace('\x02', '<mark>').replace('\x03', '</mark>')
+
+
+def search(user, text, limit=DEFAULT_LIMIT):
+    """
+    Retorna uma lista de resultados ordenados por relevância (bm25), cada um com
+    tipo, objeto_id, titulo, trecho destacado e score.
+    """
+    match = build_match_query(text)
+    if not match or not search_available():
+        return []
+    scope, params = _scope_sql(user)
+    sql = f"""
+        SELECT tipo, objeto_id, titulo,
+               snippet({SEARCH_TABLE}, 5, char(2), char(3), '…', 12),
+               bm25({SEARCH_TABLE}, 0, 0, 0, 0, 10.0, 1.0) AS score
+        FROM {SEARCH_TABLE}
+        WHERE {SEARCH_TABLE} MATCH %s {scope}
+        ORDER BY score
+        LIMIT %s
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [match, *params, limit])
+        rows = cursor.fetchall()
+    return [
+        {
+            'tipo': tipo,
+            'id': objeto_id,
+            'titulo': titulo,
+            'trecho': _format_snippet(snippet),
+            'score': round(-score, 4),
+        }
+        for tipo, objeto_id, titulo, snippet, score in rows
+    ]
@@ -1,45 +1,117 @@
-from django.db.models.signals import post_save
+from django.conf import settings
+from django.db import models, transaction
+from django.core.signals import request_started
+from django.db.models.signals import post_save, post_delete, pre_save
 from django.dispatch import receiver
-from .models import JornadaClienteHistorico, Notification, User
+from .models import (
+    JornadaClienteHistorico, Orcamento, Cliente, Especificador, Agendamento, AgendamentoExcluido, SerieAgendamento,
+)
+from . import agenda, conveniencia, import_jobs, notifications, search
 
 @receiver(post_save, sender=JornadaClienteHistorico)
 def create_notification_on_comment(sender, instance, created, **kwargs):
     if created:
-        comment = instance
-        orcamento = comment.orcamento
-        comment_author = comment.usuario
-
-        # Use a set to ensure each user is notified only once
-        recipients = set()
-
-        # 1. Add the budget owner (consultor)
-        recipients.add(orcamento.usuario)
-
-        # 2. Add the store manager (gerente)
-        if orcamento.usuario.loja:
-            managers = User.objects.filter(role='gerente', loja=orcamento.usuario.loja)
-            for manager in managers:
-                recipients.add(manager)
-
-        # 3. Handle @admin mentions and add them to subscribers
-        comentario_text = str(comment.comentario or '').lower()
-        if '@admin' in comentario_text:
-            admins = User.objects.filter(role='administrador')
-            for admin in admins:
-                recipients.add(admin)
-                orcamento.subscribers.add(admin) # Subscribe admin to future comments
-
-        # 4. Add all other existing subscribers for this budget
-        for subscriber in orcamento.subscribers.all():
-            recipients.add(subscriber)
-
-        # 5. Remove the person who wrote the comment, so they don't get a notification for their own action
-        if comment_author in recipients:
-            recipients.remove(comment_author)
-
-        # 6. Create notifications for all unique recipients
-        for user in recipients:
-            Notification.objects.create(
-                recipient=user,
-                comment=comment
-            )
+        # Recipients are resolved and notified asynchronously by core.notifications
+        notifications.enqueue_comment(instance)
+
+
+@receiver(request_started)
+def start_background_work(sender, **kwargs):
+    # Picks up outbox events and import jobs left behind by a previous process,
+    # only where this process runs the thread pools (not with the dedicated workers or in tests)
+    if getattr(settings, 'NOTIFICATIONS_USE_THREAD_POOL', True):
+        notifications.start()
+    if getattr(settings, 'IMPORT_JOBS_USE_THREAD_POOL', True):
+        import_jobs.start()
+
+
+# --- Omnisearch index maintenance ---
+
+@receiver(post_save, sender=Orcamento)
+def index_orcamento(sender, instance, **kwargs):
+    search.reindex('orcamento', [instance.pk])
+    # Comments show the orçamento number and inherit its owner scope
+    search.reindex('comentario', [instance.pk], column='orcamento_id')
+
+@receiver(post_save, sender=JornadaClienteHistorico)
+def index_comentario(sender, instance, **kwargs):
+    search.reindex('comentario', [instance.pk])
+
+@receiver(post_save, sender=Cliente)
+def index_cliente(sender, instance, **kwargs):
+    search.reindex('cliente', [instance.pk])
+    search.reindex('orcamento', [instance.pk], column='nome_cliente_id')
+    search.reindex('agendamento', [instance.pk], column='cliente_id')
+
+@receiver(post_save, sender=Especificador)
+def index_especificador(sender, instance, **kwargs):
+    search.reindex('especificador', [instance.pk])
+    search.reindex('orcamento', [instance.pk], column='especificador_id')
+    search.reindex('agendamento', [instance.pk], column='especificador_id')
+
+@receiver(post_save, sender=Agendamento)
+def index_agendamento(sender, instance, **kwargs):
+    search.reindex('agendamento', [instance.pk])
+
+@receiver(post_delete, sender=Agendamento)
+def record_agendamento_tombstone(sender, instance, **kwargs):
+    # Lets the agenda delta sync tell clients which events disappeared
+    AgendamentoExcluido.objects.create(agendamento_id=instance.pk)
+
+
+@receiver(post_delete, sender=SerieAgendamento)
+def record_serie_tombstone(sender, instance, **kwargs):
+    AgendamentoExcluido.objects.create(serie_id=instance.pk)
+
+
+# --- Normalized conveniência items ---
+
+@receiver(pre_save, sender=Agendamento)
+def bump_pedido_versao(sender, instance, update_fields=None, **kwargs):
+    instance._pedido_alterado = False
+    if update_fields is not None and 'conveniencia_pedido' not in update_fields:
+        return
+    pedido = instance.__dict__.get('conveniencia_pedido', models.DEFERRED)
+    if pedido is models.DEFERRED:
+        return
+    if instance._state.adding:
+        instance._pedido_alterado = True
+    elif getattr(instance, '_pedido_carregado', None) != pedido:
+        instance._pedido_alterado = True
+        # Saved in the same UPDATE; the old cached comanda is dropped after the save
+        instance._versao_anterior = instance.pedido_versao
+        instance.pedido_versao += 1
+
+@receiver(post_save, sender=Agendamento)
+def sync_conveniencia_items(sender, instance, created, **kwargs):
+    if not getattr(instance, '_pedido_alterado', False):
+        return
+    conveniencia.sync_items(instance)
+    if not created:
+        conveniencia.forget_comanda(instance.pk, instance._versao_anterior)
+    instance._pedido_carregado = instance.conveniencia_pedido
+    instance._pedido_alterado = False
+
+
+# --- Live agenda feed ---
+
+@receiver(post_save, sender=Agendamento)
+@receiver(post_delete, sender=Agendamento)
+@receiver(post_save, sender=SerieAgendamento)
+@receiver(post_delete, sender=SerieAgendamento)
+def publish_agenda_change(sender, instance, **kwargs):
+    transaction.on_commit(agenda.publish_change)
+
+SEARCH_TIPOS = {
+    Orcamento: 'orcamento',
+    JornadaClienteHistorico: 'comentario',
+    Cliente: 'cliente',
+    Especificador: 'especificador',
+    Agendamento: 'agendamento',
+}
+
+@receiver(post_delete)
+def remove_from_search_index(sender, instance, **kwargs):
+    tipo = SEARCH_TIPOS.get(sender)
+    if tipo:
+        search.remove(tipo, [instance.pk])
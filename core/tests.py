@@ -1,3 +1,250 @@
+import io
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
 from django.test import TestCase
+from django.utils import timezone
+from openpyxl import Workbook
+
+from .merge import MergeError, merge_records
+from .models import (
+    Agendamento, Cliente, JornadaClienteHistorico, Loja, Notification, NotificationCounter, NotificationEvent,
+    Orcamento, SerieAgendamento, User,
+)
+from . import availability, import_jobs, importer, notifications, recurrence
+
+HEADER = [
+    'usuario', 'data_solicitracao', 'especificador', 'categoria', 'nome_cliente',
+    'numero_orcamento', 'data_envio', 'valor_orcamento', 'termometro',
+    'data_previsao_fechamento', 'semana_previsao_fechamento', 'etapa',
+]
+
+
+def row(numero, **values):
+    data = {
+        'usuario': 'vendedor', 'data_solicitracao': '10/04/2024', 'especificador': 'Arquiteta',
+        'categoria': 'Novo', 'nome_cliente': 'Cliente', 'numero_orcamento': numero, 'data_envio': None,
+        'valor_orcamento': 1500, 'termometro': 'Frio', 'data_previsao_fechamento': None,
+        'semana_previsao_fechamento': 'Semana 1', 'etapa': 'Especificação',
+    }
+    data.update(values)
+    return [data[col] for col in HEADER]
+
+
+def xlsx(rows):
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.append(HEADER)
+    for values in rows:
+        sheet.append(values)
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    buffer.seek(0)
+    return buffer
+
+
+def csv(rows):
+    lines = [';'.join(HEADER)]
+    lines += [';'.join('' if value is None else str(value) for value in values) for values in rows]
+    return io.BytesIO('\n'.join(lines).encode('utf-8'))
+
+
+class ImporterTests(TestCase):
+    def setUp(self):
+        User.objects.create_user('vendedor', password='x')
+
+    def test_blank_optional_cells_are_stored_as_null(self):
+        rows = [row('A1', especificador=None, nome_cliente=None, semana_previsao_fechamento=None), row('A2')]
+        for name, build in (('xlsx', xlsx), ('csv', csv)):
+            with self.subTest(name):
+                Orcamento.objects.all().delete()
+                result = importer.import_file(build(rows))
+                self.assertEqual((result.criados, result.erros), (2, []))
+                orcamento = Orcamento.objects.get(numero_orcamento='A1')
+                self.assertIsNone(orcamento.especificador_id)
+                self.assertIsNone(orcamento.nome_cliente_id)
+                self.assertIsNone(orcamento.semana_previsao_fechamento)
+                self.assertEqual(Orcamento.objects.get(numero_orcamento='A2').nome_cliente.nome_completo, 'Cliente')
+
+    def test_text_dates_are_read_day_first(self):
+        rows = [
+            row('A1', data_solicitracao='10/04/2024', data_envio='25/04/2024'),
+            row('A2', data_solicitracao='2024-04-10', data_previsao_fechamento=' 01/05/24 '),
+        ]
+        for name, build in (('xlsx', xlsx), ('csv', csv)):
+            with self.subTest(name):
+                Orcamento.objects.all().delete()
+                result = importer.import_file(build(rows))
+                self.assertEqual((result.criados, result.erros), (2, []))
+                first = Orcamento.objects.get(numero_orcamento='A1')
+                self.assertEqual(first.data_solicitacao, date(2024, 4, 10))
+                self.assertEqual(first.data_envio, date(2024, 4, 25))
+                second = Orcamento.objects.get(numero_orcamento='A2')
+                self.assertEqual(second.data_solicitacao, date(2024, 4, 10))
+                self.assertEqual(second.data_previsao_fechamento, date(2024, 5, 1))
+
+    def test_date_cells_and_invalid_text_dates(self):
+        rows = [
+            row('A1', data_solicitracao=datetime(2024, 4, 10)),
+            row('A2', data_solicitracao='31/02/2024'),
+        ]
+        result = importer.import_file(xlsx(rows))
+        self.assertEqual(result.criados, 1)
+        self.assertEqual(Orcamento.objects.get(numero_orcamento='A1').data_solicitacao, date(2024, 4, 10))
+        self.assertEqual([linha for linha, _ in result.erros], [3])
+        self.assertIn('data_solicitacao inválida', result.erros[0][1])
+
+    def test_semicolon_csv_values_only_accept_thousands_groups(self):
+        rows = [
+            row('A1', valor_orcamento='1.234,56'),
+            row('A2', valor_orcamento='1234,5'),
+            row('A3', valor_orcamento='1234.56'),
+            row('A4', valor_orcamento='12.34'),
+        ]
+        result = importer.import_file(csv(rows))
+        self.assertEqual(Orcamento.objects.get(numero_orcamento='A1').valor_orcamento, Decimal('1234.56'))
+        self.assertEqual(Orcamento.objects.get(numero_orcamento='A2').valor_orcamento, Decimal('1234.50'))
+        self.assertEqual([linha for linha, _ in result.erros], [4, 5])
+        for _, erro in result.erros:
+            self.assertIn('valor_orcamento não numérico', erro)
+
+
+class BackgroundWorkTests(TestCase):
+    def test_requests_do_not_start_thread_pools_under_tests(self):
+        self.client.get('/')
+        self.assertFalse(notifications._started)
+        self.assertFalse(import_jobs._started)
+
+
+def moment(day, hour, minute=0):
+    return timezone.make_aware(datetime(2026, 3, day, hour, minute))
+
+
+class AvailabilityTests(TestCase):
+    def setUp(self):
+        self.loja = Loja.objects.create(nome='Loja')
+        self.user = User.objects.create_user('consultor', password='x')
+
+    def book(self, inicio, fim, sala='Laccato', status='agendado'):
+        return Agendamento.objects.create(
+            loja=self.loja, responsavel=self.user, sala=sala, motivo='Especificação',
+            horario_inicio=inicio, horario_fim=fim, status=status,
+        ).pk
+
+    def test_find_conflicts_sees_a_long_booking_that_started_earlier(self):
+        longo = self.book(moment(1, 20), moment(2, 18))
+        self.book(moment(2, 9), moment(2, 10))
+        self.book(moment(2, 15), moment(2, 16))
+        self.book(moment(2, 14), moment(2, 15), sala='Lacca')
+        self.book(moment(2, 14), moment(2, 15), status='cancelado')
+        conflicts = availability.find_conflicts('Laccato', moment(2, 14), moment(2, 15))
+        self.assertEqual([pk for _, _, pk in conflicts], [longo])
+        self.assertEqual(availability.find_conflicts('Laccato', moment(2, 14), moment(2, 15), exclude_id=longo), [])
+
+    def test_find_conflicts_includes_series_occurrences(self):
+        serie = SerieAgendamento.objects.create(
+            loja=self.loja, responsavel=self.user, sala='Laccato', motivo='Especificação',
+            inicio=moment(2, 10), duracao_minutos=60, intervalo_semanas=1, repetir_ate=date(2026, 3, 31),
+        )
+        conflicts = availability.find_conflicts('Laccato', moment(16, 10, 30), moment(16, 12))
+        self.assertEqual(conflicts, [(moment(16, 10), moment(16, 11), -serie.pk)])
+        self.assertEqual(availability.find_conflicts('Laccato', moment(17, 10), moment(17, 11)), [])
+
+    def test_series_conflicts_checks_every_occurrence(self):
+        longo = self.book(moment(8, 20), moment(9, 18))
+        self.book(moment(9, 9), moment(9, 10))
+        self.book(moment(16, 15), moment(16, 16))
+        curto = self.book(moment(23, 14, 30), moment(23, 14, 45))
+        ocorrencias = recurrence.series_occurrences(SerieAgendamento(
+            inicio=moment(2, 14), duracao_minutos=60, intervalo_semanas=1, repetir_ate=date(2026, 3, 30),
+        ))
+        self.assertEqual(len(ocorrencias), 5)
+        conflicts = availability.series_conflicts('Laccato', ocorrencias)
+        self.assertEqual([inicio for inicio, _, _ in conflicts], [moment(9, 14), moment(23, 14)])
+        self.assertEqual([[pk for _, _, pk in busy] for _, _, busy in conflicts], [[longo], [curto]])
+        self.assertEqual(availability.series_conflicts('Lacca', ocorrencias), [])
+
+
+class MergeTests(TestCase):
+    def setUp(self):
+        self.loja = Loja.objects.create(nome='Loja')
+        self.user = User.objects.create_user('consultor', password='x')
+
+    def test_merge_repoints_references_and_fills_empty_fields(self):
+        vencedor = Cliente.objects.create(nome_completo='Maria Silva')
+        duplicado = Cliente.objects.create(nome_completo='Maria  Silva', telefone='92999990000')
+        outro = Cliente.objects.create(nome_completo='Maria S.', email='maria@example.com')
+        orcamento = Orcamento.objects.create(usuario=self.user, numero_orcamento='M1', nome_cliente=duplicado)
+        agendamento = Agendamento.objects.create(
+            loja=self.loja, responsavel=self.user, cliente=outro, sala='Laccato', motivo='Especificação',
+            horario_inicio=moment(2, 10), horario_fim=moment(2, 11),
+        )
+        # A chain (vencedor <- duplicado <- outro) ends in a single winner
+        result = merge_records(Cliente, [(vencedor.pk, duplicado.pk), (duplicado.pk, outro.pk)])
+        self.assertEqual(result['mesclados'], 2)
+        self.assertEqual(list(Cliente.objects.values_list('pk', flat=True)), [vencedor.pk])
+        orcamento.refresh_from_db()
+        agendamento.refresh_from_db()
+        self.assertEqual(orcamento.nome_cliente_id, vencedor.pk)
+        self.assertEqual(agendamento.cliente_id, vencedor.pk)
+        vencedor.refresh_from_db()
+        self.assertEqual((vencedor.telefone, vencedor.email), ('92999990000', 'maria@example.com'))
+
+    def test_missing_winner_merges_nothing(self):
+        cliente = Cliente.objects.create(nome_completo='Maria Silva')
+        with self.assertRaises(MergeError):
+            merge_records(Cliente, [(cliente.pk + 1000, cliente.pk)])
+        self.assertTrue(Cliente.objects.filter(pk=cliente.pk).exists())
+        with self.assertRaises(MergeError):
+            merge_records(Orcamento, [(1, 2)])
+
+
+class NotificationDeliveryTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user('dono', password='x')
+        self.author = User.objects.create_user('autor', password='x')
+        self.orcamento = Orcamento.objects.create(usuario=self.owner, numero_orcamento='N1')
+        notifications.reset_unread(self.owner.pk)
+
+    def comment(self, texto):
+        # The post_save signal writes the outbox event
+        return JornadaClienteHistorico.objects.create(orcamento=self.orcamento, usuario=self.author, comentario=texto)
+
+    def deliver(self, *comments):
+        NotificationEvent.objects.filter(comment__in=comments).update(status='processando', lote='lote')
+        notifications.deliver('lote')
+        NotificationEvent.objects.filter(lote='lote').update(lote='')
+
+    def notified(self):
+        return list(Notification.objects.filter(recipient=self.owner).order_by('id').values_list(
+            'comment_id', 'quantidade', 'is_read'
+        ))
+
+    def test_comments_are_coalesced_per_orcamento(self):
+        first, second = self.comment('a'), self.comment('b')
+        self.deliver(first, second)
+        self.assertEqual(self.notified(), [(second.pk, 2, False)])
+        self.assertEqual(notifications.unread_count(self.owner.pk), 1)
+        third = self.comment('c')
+        self.deliver(third)
+        self.assertEqual(self.notified(), [(third.pk, 3, False)])
+        self.assertEqual(notifications.unread_count(self.owner.pk), 1)
+
+    def test_redelivery_neither_duplicates_nor_recounts(self):
+        first, second = self.comment('a'), self.comment('b')
+        self.deliver(first, second)
+        self.deliver(first, second)
+        self.assertEqual(self.notified(), [(second.pk, 2, False)])
+        self.assertEqual(notifications.unread_count(self.owner.pk), 1)
+
+        # Already read: redelivery must not bring it back nor bump the counter
+        Notification.objects.filter(recipient=self.owner).update(is_read=True)
+        notifications.reset_unread(self.owner.pk)
+        self.deliver(first, second)
+        self.assertEqual(self.notified(), [(second.pk, 2, True)])
+        self.assertEqual(NotificationCounter.objects.get(pk=self.owner.pk).nao_lidas, 0)
 
-# Create your tests here.
+        third = self.comment('c')
+        self.deliver(second, third)
+        self.assertEqual(self.notified(), [(second.pk, 2, True), (third.pk, 1, False)])
+        self.assertEqual(notifications.unread_count(self.owner.pk), 1)
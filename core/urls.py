@@ -7,16 +7,25 @@ from .views import (
     marcar_como_ganho, consultor_orcamentos_fechados_ganhos,
     reverter_orcamento_ganho, administrador_dashboard, administrador_criar_orcamento, add_jornada_cliente_comment,
     add_cliente_full, clientes_cadastrados, cliente_add_view, cliente_edit_view, importar_orcamentos, orcamentos_fechados_view,
-    download_template_view, search_clientes, search_especificadores, notifications_view,
+    download_template_view, search_clientes, search_especificadores, notifications_view, mark_all_notifications_read, notifications_stream,
     especificadores_cadastrados, especificador_add_view, especificador_edit_view,
     gerente_forecast_view, admin_forecast_dashboard_view, get_orcamento_details, update_orcamento_details,
     update_forecast_status, facilitis_agenda_view, get_agendamentos_api, create_agendamento, facilitis_home_view,
     update_agendamento_status, facilitis_conveniencia_view, update_conveniencia_status, update_sala_limpa_status,
-    get_agendamento_details_api, update_agendamento_api, delete_agendamento_api, indicadores_agenda_view
+    get_agendamento_details_api, update_agendamento_api, delete_agendamento_api, indicadores_agenda_view,
+    salas_livres_api,
+    ocupacao_api,
+    agenda_sync_api,
+    agenda_stream,
+    materializar_ocorrencia_api,
+    producao_conveniencia_api,
+    omnisearch_api, import_job_status_api, import_job_report_view
 )
 
 urlpatterns = [
     path('notifications/', notifications_view, name='notifications'),
+    path('notifications/marcar-todas/', mark_all_notifications_read, name='notifications_mark_all'),
+    path('notifications/stream/', notifications_stream, name='notifications_stream'),
     path('register/', register_user_view, name='register'),
     path('home/', home_view, name='home'),
     path('lojas/', LojasView.as_view(), name='lojas'),
@@ -33,6 +42,8 @@ urlpatterns = [
     path('administrador/criar-orcamento/', administrador_criar_orcamento, name='administrador_criar_orcamento'),
     path('administrador/importar-orcamentos/', importar_orcamentos, name='importar_orcamentos'),
     path('administrador/importar-orcamentos/download-template/', download_template_view, name='download_template'),
+    path('administrador/importar-orcamentos/jobs/<int:pk>/status/', import_job_status_api, name='import_job_status'),
+    path('administrador/importar-orcamentos/jobs/<int:pk>/relatorio/', import_job_report_view, name='import_job_report'),
     path('gerente/dashboard/', gerente_dashboard, name='gerente_dashboard'),
     path('facilitis/home/', facilitis_home_view, name='facilitis_home'),
     path('facilitis/agenda/', facilitis_agenda_view, name='facilitis_agenda'),
@@ -54,6 +65,7 @@ urlpatterns = [
     path('add_especificador/', add_especificador, name='add_especificador'),
     path('search-clientes/', search_clientes, name='search_clientes'),
     path('search-especificadores/', search_especificadores, name='search_especificadores'),
+    path('search/', omnisearch_api, name='omnisearch'),
     path('orcamento/<int:pk>/edit/', edit_orcamento, name='edit_orcamento'),
     path('orcamento/<int:pk>/add-jornada-comment/', add_jornada_cliente_comment, name='add_jornada_cliente_comment'),
     path('clientes_cadastrados/', clientes_cadastrados, name='clientes_cadastrados'),
@@ -69,6 +81,12 @@ urlpatterns = [
     path('orcamento/<int:pk>/update/', update_orcamento_details, name='update_orcamento_details'),
     path('agendamentos/', get_agendamentos_api, name='get_agendamentos_api'),
     path('agendamentos/create/', create_agendamento, name='create_agendamento'),
+    path('agendamentos/salas-livres/', salas_livres_api, name='salas_livres_api'),
+    path('agendamentos/ocupacao/', ocupacao_api, name='ocupacao_api'),
+    path('agendamentos/sync/', agenda_sync_api, name='agenda_sync_api'),
+    path('agendamentos/stream/', agenda_stream, name='agenda_stream'),
+    path('agendamentos/series/<int:serie_id>/materializar/', materializar_ocorrencia_api, name='materializar_ocorrencia_api'),
+    path('facilitis/conveniencia/producao/', producao_conveniencia_api, name='producao_conveniencia_api'),
     path('agendamentos/update_status/<int:pk>/', update_agendamento_status, name='update_agendamento_status'),
     path('agendamentos/<int:pk>/details/', get_agendamento_details_api, name='get_agendamento_details_api'),
     path('agendamentos/update/<int:pk>/', update_agendamento_api, name='update_agendamento_api'),
@@ -1,24 +1,30 @@
+from django.conf import settings
 from django.contrib import messages
 from django.shortcuts import render, redirect
-from django.contrib.auth import login, authenticate, logout
+from django.contrib.auth import logout
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.forms import SetPasswordForm
 from django.views.generic import ListView
-from .models import Orcamento, Loja, User, Cliente, Especificador, JornadaClienteHistorico, Notification, Agendamento
+from .models import Orcamento, Loja, User, Cliente, Especificador, JornadaClienteHistorico, Notification, Agendamento, ImportJob, SerieAgendamento
 from django.shortcuts import get_object_or_404
 from django import forms
-import pandas as pd
-from django.http import JsonResponse, HttpResponse
-from django.db.models import Sum, Count, Case, When, Value, Q, F
-import io
+from django.http import JsonResponse, HttpResponse, FileResponse, StreamingHttpResponse
+from django.db.models import Sum, Count, Case, When, Value, Q
+import calendar
 from datetime import datetime, timedelta
-from itertools import groupby
 from collections import defaultdict
-from django.db import models
+from django.db import models, transaction
 from django.utils import timezone
 from django.views.decorators.http import require_POST
 import json
-from django.forms.models import model_to_dict
+from django.urls import reverse
+from . import search as omnisearch
+from . import importer, import_jobs
+from . import notifications as notification_service
+from . import realtime
+from . import agenda, availability, conveniencia, recurrence
+
+NOTIFICATIONS_PAGE_SIZE = 20
 
 class UserRegistrationForm(forms.ModelForm):
     """
@@ -174,17 +180,8 @@ class AgendamentoForm(forms.ModelForm):
         if not data:
             return None
         try:
-            parsed_data = json.loads(data)
-            # Normalize the old format from facilitis_home to the new one
-            if isinstance(parsed_data, dict):
-                flat_list = []
-                for category, items in parsed_data.items():
-                    if isinstance(items, list):
-                        for item in items:
-                            if isinstance(item, dict) and 'name' in item:
-                                flat_list.append({'item': item['name'], 'quantity': item.get('quantity', 1)})
-                return flat_list
-            return parsed_data
+            # Both historical shapes are stored as [{'item': ..., 'quantity': n}]
+            return conveniencia.normalize_pedido(json.loads(data))
         except (json.JSONDecodeError, TypeError):
             raise forms.ValidationError("Invalid JSON string for convenience order.")
 
@@ -1156,6 +1153,8 @@ def administrador_dashboard(request):
 def add_jornada_cliente_comment(request, pk):
     """
     Adiciona um novo comentário ao histórico de jornada de um orçamento específico.
+    O comentário e o evento de notificação são gravados na mesma transação; as
+    notificações são geradas depois, por core.notifications.
     """
     orcamento = get_object_or_404(Orcamento, pk=pk)
     if request.method == 'POST':
@@ -1164,7 +1163,8 @@ def add_jornada_cliente_comment(request, pk):
             historico = form.save(commit=False)
             historico.orcamento = orcamento
             historico.usuario = request.user
-            historico.save()
+            with transaction.atomic():
+                historico.save()
     
     return redirect(request.META.get('HTTP_REFERER', 'home'))
 
@@ -1294,34 +1294,23 @@ def especificador_edit_view(request, pk):
 def download_template_view(request):
     """
     Permite que administradores baixem um template de planilha Excel
-    para importação de orçamentos, pré-preenchido com usuários.
+    para importação de orçamentos, pré-preenchido com usuários e com listas
+    suspensas nas colunas de escolha. O arquivo vem do cache enquanto os
+    usuários não mudarem.
     """
     if request.user.role != 'administrador':
         return redirect('home')
 
-    required_columns = [
-        'usuario', 'data_solicitracao', 'especificador', 'categoria', 'nome_cliente',
-        'numero_orcamento', 'data_envio', 'valor_orcamento', 'termometro',
-        'data_previsao_fechamento', 'semana_previsao_fechamento', 'etapa', 'jornada_cliente'
-    ]
-    
-    users = User.objects.all().values_list('username', flat=True)
-    user_df = pd.DataFrame(users, columns=['usuario'])
-    
-    # Create a DataFrame with all required columns, but only the 'usuario' column filled
-    df = pd.DataFrame(columns=required_columns)
-    df['usuario'] = user_df['usuario']
-
-    output = io.BytesIO()
-    writer = pd.ExcelWriter(output, engine='openpyxl')
-    df.to_excel(writer, index=False, sheet_name='Sheet1')
-    writer.close()
-    output.seek(0)
-    
+    content, signature = importer.get_template()
+    etag = f'"{signature}"'
+    if request.headers.get('If-None-Match') == etag:
+        return HttpResponse(status=304)
+
     response = HttpResponse(
-        output,
+        content,
         content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
     )
+    response['ETag'] = etag
     response['Content-Disposition'] = 'attachment; filename="template_orcamentos.xlsx"'
     
     return response
@@ -1329,8 +1318,11 @@ def download_template_view(request):
 @login_required
 def importar_orcamentos(request):
     """
-    Permite que administradores importem orçamentos de um arquivo .xlsx.
-    Processa o arquivo, cria ou atualiza orçamentos, clientes e especificadores.
+    Permite que administradores importem orçamentos de um arquivo .xlsx, .csv ou .csv.gz.
+    O upload cria um ImportJob e retorna imediatamente; o arquivo é processado
+    em segundo plano por core.import_jobs e o progresso é exibido na página.
+    Um arquivo idêntico a outro já processado no mesmo modo é respondido com o
+    resultado anterior, salvo se "forcar" for enviado.
     """
     if request.user.role != 'administrador':
         return redirect('home')
@@ -1341,58 +1333,64 @@ def importar_orcamentos(request):
             return redirect('importar_orcamentos')
 
         file = request.FILES['file']
-        if not file.name.endswith('.xlsx'):
-            messages.error(request, 'Arquivo inválido. Por favor, selecione um arquivo .xlsx')
+        if not file.name.lower().endswith(('.xlsx', '.csv', '.csv.gz', '.gz')):
+            messages.error(request, 'Arquivo inválido. Por favor, selecione um arquivo .xlsx, .csv ou .csv.gz')
             return redirect('importar_orcamentos')
 
-        try:
-            df = pd.read_excel(file)
-            required_columns = [
-                'data_solicitracao', 'especificador', 'categoria', 'nome_cliente',
-                'numero_orcamento', 'data_envio', 'valor_orcamento', 'termometro',
-                'data_previsao_fechamento', 'semana_previsao_fechamento', 'etapa', 'usuario'
-            ]
-            if not all(col in df.columns for col in required_columns):
-                messages.error(request, f'A planilha deve conter as seguintes colunas: {required_columns}')
-                return redirect('importar_orcamentos')
-
-            for index, row in df.iterrows():
-                # Get or create related objects
-                especificador, _ = Especificador.objects.get_or_create(nome_completo=row['especificador'])
-                cliente, _ = Cliente.objects.get_or_create(nome_completo=row['nome_cliente'])
-                try:
-                    user = User.objects.get(username=row['usuario'])
-                except User.DoesNotExist:
-                    messages.error(request, f"Usuário '{row['usuario']}' não encontrado. O orçamento da linha {index + 2} não foi importado.")
-                    continue
-
-                # Check if orcamento already exists
-                if Orcamento.objects.filter(numero_orcamento=row['numero_orcamento']).exists():
-                    messages.warning(request, f"Orçamento com número '{row['numero_orcamento']}' já existe. Linha {index + 2} não foi importada.")
-                    continue
-
-                Orcamento.objects.create(
-                    data_solicitacao=row['data_solicitracao'],
-                    especificador=especificador,
-                    categoria=row['categoria'],
-                    nome_cliente=cliente,
-                    numero_orcamento=row['numero_orcamento'],
-                    data_envio=row.get('data_envio'),
-                    valor_orcamento=row['valor_orcamento'],
-                    termometro=row['termometro'],
-                    data_previsao_fechamento=row['data_previsao_fechamento'],
-                    semana_previsao_fechamento=row['semana_previsao_fechamento'],
-                    etapa=row['etapa'],
-                    usuario=user,
-                )
-            messages.success(request, 'Orçamentos importados com sucesso!')
+        modo = request.POST.get('modo', 'inserir')
+        if modo not in dict(ImportJob.MODO_CHOICES):
+            modo = 'inserir'
+        force = request.POST.get('forcar') == '1'
+        job, reused = import_jobs.enqueue_import(file, request.user, modo=modo, force=force)
+        if reused:
+            quando = timezone.localtime(job.criado_em).strftime('%d/%m/%Y %H:%M')
+            messages.warning(
+                request,
+                f'Este arquivo já foi enviado em {quando} ("{job.nome_arquivo}") e não foi reprocessado. '
+                f'Resultado: {job.mensagem or job.get_status_display()} '
+                'Marque "Reprocessar" para importá-lo novamente.'
+            )
+        elif modo == 'validar':
+            messages.info(request, f'Arquivo "{job.nome_arquivo}" recebido. A validação está sendo processada; nada será gravado.')
+        elif modo == 'upsert':
+            messages.info(request, f'Arquivo "{job.nome_arquivo}" recebido. A importação com atualização está sendo processada.')
+        else:
+            messages.info(request, f'Arquivo "{job.nome_arquivo}" recebido. A importação está sendo processada.')
+        return redirect(f"{reverse('importar_orcamentos')}?job={job.pk}")
+
+    jobs = ImportJob.objects.select_related('criado_por')[:10]
+    current_job = None
+    job_id = request.GET.get('job')
+    if job_id and job_id.isdigit():
+        current_job = ImportJob.objects.filter(pk=job_id).first()
+    context = {
+        'jobs': jobs,
+        'current_job': current_job,
+    }
+    return render(request, 'importar_orcamentos.html', context)
 
-        except Exception as e:
-            messages.error(request, f'Ocorreu um erro ao processar o arquivo: {e}')
+@login_required
+def import_job_status_api(request, pk):
+    """
+    Endpoint de polling com o status, progresso, contagens e erros de uma importação.
+    """
+    if request.user.role != 'administrador':
+        return JsonResponse({'status': 'error', 'message': 'Permission denied.'}, status=403)
+    job = get_object_or_404(ImportJob, pk=pk)
+    return JsonResponse(import_jobs.job_status(job))
 
+@login_required
+def import_job_report_view(request, pk):
+    """
+    Permite baixar o relatório .xlsx de erros gerado por uma validação (dry-run).
+    """
+    if request.user.role != 'administrador':
+        return redirect('home')
+    job = get_object_or_404(ImportJob, pk=pk)
+    if not job.relatorio:
+        messages.error(request, 'Esta importação não possui relatório de erros.')
         return redirect('importar_orcamentos')
-
-    return render(request, 'importar_orcamentos.html')
+    return FileResponse(job.relatorio.open('rb'), as_attachment=True, filename=f'erros_{job.nome_arquivo}')
 
 @login_required
 def orcamentos_fechados_view(request):
@@ -1481,15 +1479,111 @@ def search_especificadores(request):
     results = [{'id': esp.id, 'text': esp.nome_completo} for esp in especificadores]
     return JsonResponse({'results': results})
 
+@login_required
+def omnisearch_api(request):
+    """
+    Endpoint AJAX de busca global. Retorna resultados ranqueados e tipados
+    (orçamentos, comentários, clientes, especificadores e agendamentos),
+    restritos ao que o papel do usuário pode ver.
+    """
+    query = request.GET.get('q', '').strip()
+    try:
+        limit = min(int(request.GET.get('limit', omnisearch.DEFAULT_LIMIT)), 50)
+    except ValueError:
+        limit = omnisearch.DEFAULT_LIMIT
+    results = omnisearch.search(request.user, query, limit=limit)
+
+    role = request.user.role
+    jornada_url = {
+        'administrador': 'meus_clientes_administrador',
+        'gerente': 'meus_clientes_gerente',
+        'consultor': 'meus_clientes_consultor',
+    }.get(role)
+    comment_ids = [r['id'] for r in results if r['tipo'] == 'comentario']
+    comment_orcamentos = dict(
+        JornadaClienteHistorico.objects.filter(pk__in=comment_ids).values_list('id', 'orcamento_id')
+    ) if comment_ids else {}
+
+    for result in results:
+        url = None
+        if result['tipo'] in ('orcamento', 'comentario') and jornada_url:
+            orcamento_id = result['id'] if result['tipo'] == 'orcamento' else comment_orcamentos.get(result['id'])
+            url = f"{reverse(jornada_url)}#orcamento-{orcamento_id}"
+        elif result['tipo'] == 'cliente':
+            url = reverse('cliente_edit', args=[result['id']])
+        elif result['tipo'] == 'especificador':
+            url = reverse('especificador_edit', args=[result['id']])
+        elif result['tipo'] == 'agendamento' and role in ['facilitis', 'consultor', 'gerente']:
+            url = reverse('facilitis_agenda')
+        result['url'] = url
+
+    return JsonResponse({'query': query, 'results': results})
+
 @login_required
 def notifications_view(request):
     """
-    Exibe as notificações do usuário logado e as marca como lidas.
+    Exibe as notificações do usuário logado, paginadas por cursor (?antes=<id>),
+    e marca como lidas apenas as notificações exibidas na página.
     """
-    notifications = Notification.objects.filter(recipient=request.user)
-    # Mark notifications as read when the user views them
-    notifications.update(is_read=True)
-    return render(request, 'notifications.html', {'notifications': notifications})
+    notifications = (
+        Notification.objects.filter(recipient=request.user)
+        .select_related('comment__usuario', 'orcamento')
+        .order_by('-created_at', '-id')
+    )
+    cursor = request.GET.get('antes')
+    if cursor and cursor.isdigit():
+        last = Notification.objects.filter(recipient=request.user, pk=cursor).values('created_at', 'id').first()
+        if last:
+            notifications = notifications.filter(
+                Q(created_at__lt=last['created_at']) | Q(created_at=last['created_at'], id__lt=last['id'])
+            )
+    page = list(notifications[:NOTIFICATIONS_PAGE_SIZE + 1])
+    has_more = len(page) > NOTIFICATIONS_PAGE_SIZE
+    page = page[:NOTIFICATIONS_PAGE_SIZE]
+
+    # Mark only the displayed notifications as read; the objects keep is_read=False for highlighting
+    unread_ids = [n.pk for n in page if not n.is_read]
+    if unread_ids:
+        Notification.objects.filter(pk__in=unread_ids).update(is_read=True)
+        notification_service.reconcile_unread_counts([request.user.pk])
+
+    context = {
+        'notifications': page,
+        'next_cursor': page[-1].pk if has_more else None,
+        'is_first_page': not cursor,
+        'unread_remaining': notification_service.unread_count(request.user.pk),
+    }
+    return render(request, 'notifications.html', context)
+
+@login_required
+async def notifications_stream(request):
+    """
+    Fluxo Server-Sent Events com as notificações novas e a contagem de não lidas
+    do usuário logado. Deve ser servido pela aplicação ASGI (backend.asgi); com
+    REALTIME_SSE_ENABLED desligado responde 204, o que encerra o EventSource.
+    """
+    if not getattr(settings, 'REALTIME_SSE_ENABLED', False):
+        return HttpResponse(status=204)
+    user = await request.auser()
+    last_event_id = request.headers.get('Last-Event-ID')
+    last_event_id = int(last_event_id) if last_event_id and last_event_id.isdigit() else None
+    response = StreamingHttpResponse(
+        realtime.event_stream(user.pk, last_event_id), content_type='text/event-stream'
+    )
+    response['Cache-Control'] = 'no-cache'
+    # Disables proxy buffering (nginx) so events are flushed immediately
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+@login_required
+@require_POST
+def mark_all_notifications_read(request):
+    """
+    Marca todas as notificações não lidas do usuário como lidas.
+    """
+    Notification.objects.filter(recipient=request.user, is_read=False).update(is_read=True)
+    notification_service.reset_unread(request.user.pk)
+    return redirect('notifications')
 
 @login_required
 def gerente_forecast_view(request):
@@ -1828,6 +1922,8 @@ def facilitis_agenda_view(request):
         'form': form,
         'current_user_id': request.user.id,
         'current_user_role': request.user.role,
+        # Starting point for the sync polling fallback
+        'agenda_token': agenda.sync_token(),
     }
     return render(request, 'facilitis_agenda.html', context)
 
@@ -1860,37 +1956,19 @@ def get_agendamentos_api(request):
         agendamentos = Agendamento.objects.filter(
             horario_inicio__lt=end_date,
             horario_fim__gt=start_date
-        ).select_related('cliente', 'responsavel', 'especificador')
+        )
+        ocorrencias = agenda.series_events(start_date, end_date)
     else:
-        # Fallback para views que buscam apenas os eventos do dia sem parâmetros
-        today = timezone.now().date()
+        # Fallback para views que buscam apenas os eventos do dia sem parâmetros.
+        # A plain range on horario_inicio (not __date) can use the index.
+        day_start = timezone.make_aware(datetime.combine(timezone.localdate(), datetime.min.time()))
         agendamentos = Agendamento.objects.filter(
-            horario_inicio__date=today
-        ).select_related('cliente', 'responsavel', 'especificador')
+            horario_inicio__gte=day_start,
+            horario_inicio__lt=day_start + timedelta(days=1)
+        )
+        ocorrencias = agenda.series_events(day_start, day_start + timedelta(days=1))
 
-    events = []
-    for agendamento in agendamentos:
-        cliente_nome = agendamento.cliente.nome_completo if agendamento.cliente else 'N/A'
-        responsavel_nome = agendamento.responsavel.get_full_name() if agendamento.responsavel else 'N/A'
-        especificador_nome = agendamento.especificador.nome_completo if agendamento.especificador else 'N/A'
-        
-        events.append({
-            'title': f'{agendamento.motivo} - {cliente_nome}',
-            'start': agendamento.horario_inicio.isoformat(),
-            'end': agendamento.horario_fim.isoformat(),
-            'id': agendamento.id,
-            'sala': agendamento.sala,
-            'responsavel': responsavel_nome,
-            'responsavel_id': agendamento.responsavel.id if agendamento.responsavel else None,
-            'cliente': cliente_nome,
-            'especificador': especificador_nome,
-            'convidados': agendamento.quantidade_convidados,
-            'conveniencia': agendamento.conveniencia,
-            'motivo': agendamento.get_motivo_display(),
-            'status': agendamento.status,
-            'status_display': agendamento.get_status_display(),
-        })
-    return JsonResponse(events, safe=False)
+    return JsonResponse(agenda.events(agendamentos) + ocorrencias, safe=False)
 
 
 @login_required
@@ -1924,21 +2002,59 @@ def create_agendamento(request):
             horario_inicio = form.cleaned_data.get('horario_inicio')
             horario_fim = form.cleaned_data.get('horario_fim')
 
-            # --- Conflict Detection Logic ---
-            # Exclude the current agendamento if we are editing
-            conflicts = Agendamento.objects.filter(
-                sala=sala,
-                status__in=['agendado', 'realizado']
-            ).filter(
-                Q(horario_inicio__lt=horario_fim) & Q(horario_fim__gt=horario_inicio)
-            )
-
-            if conflicts.exists():
+            if data.get('repetir_ate'):
+                # Recurring booking: only the rule is stored, every occurrence is checked at once
+                try:
+                    repetir_ate = datetime.strptime(data['repetir_ate'], '%Y-%m-%d').date()
+                    intervalo = int(data.get('intervalo_semanas') or 1)
+                except ValueError:
+                    return JsonResponse({'status': 'error', 'errors': {'repetir_ate': ['Data inválida.']}}, status=400)
+                if intervalo not in recurrence.INTERVALOS_SEMANAS:
+                    return JsonResponse({'status': 'error', 'errors': {'intervalo_semanas': ['Intervalo inválido.']}}, status=400)
+                if repetir_ate < timezone.localtime(horario_inicio).date():
+                    return JsonResponse({'status': 'error', 'errors': {'repetir_ate': ['A repetição deve terminar depois do primeiro agendamento.']}}, status=400)
+                if form.cleaned_data.get('conveniencia'):
+                    return JsonResponse({'status': 'error', 'errors': {'__all__': ['Pedidos de conveniência são feitos em cada ocorrência, não na série.']}}, status=400)
+                total = recurrence.occurrence_count(horario_inicio, intervalo, repetir_ate)
+                if total > recurrence.MAX_OCORRENCIAS:
+                    limite = recurrence.last_allowed_date(horario_inicio, intervalo)
+                    return JsonResponse({'status': 'error', 'errors': {'repetir_ate': [
+                        f'A série teria {total} ocorrências; o máximo é {recurrence.MAX_OCORRENCIAS}. '
+                        f'Escolha uma data final até {limite:%d/%m/%Y}.'
+                    ]}}, status=400)
+
+                serie = SerieAgendamento(
+                    loja=form.cleaned_data['loja'],
+                    responsavel=form.cleaned_data.get('responsavel'),
+                    cliente=form.cleaned_data.get('cliente'),
+                    especificador=form.cleaned_data.get('especificador'),
+                    sala=sala,
+                    motivo=form.cleaned_data['motivo'],
+                    quantidade_convidados=form.cleaned_data.get('quantidade_convidados') or 1,
+                    inicio=horario_inicio,
+                    duracao_minutos=int((horario_fim - horario_inicio).total_seconds() // 60),
+                    intervalo_semanas=intervalo,
+                    repetir_ate=repetir_ate,
+                    criado_por=request.user,
+                )
+                ocorrencias = recurrence.series_occurrences(serie)
+                conflicts = availability.series_conflicts(sala, ocorrencias)
+                if conflicts:
+                    datas = ', '.join(f'{timezone.localtime(inicio):%d/%m %H:%M}' for inicio, _, _ in conflicts[:5])
+                    extra = f' e mais {len(conflicts) - 5}' if len(conflicts) > 5 else ''
+                    return JsonResponse({
+                        'status': 'error',
+                        'errors': {'__all__': [f'A sala {sala} já está ocupada nas ocorrências de {datas}{extra}.']}
+                    }, status=400)
+                serie.save()
+                return JsonResponse({'status': 'success', 'serie': serie.pk, 'ocorrencias': len(ocorrencias)})
+
+            conflicts = availability.find_conflicts(sala, horario_inicio, horario_fim)
+            if conflicts:
                 return JsonResponse({
                     'status': 'error',
-                    'errors': {'__all__': ['Conflito de horário! A sala já está reservada neste período.']}
+                    'errors': {'__all__': [availability.conflict_message(conflicts)]}
                 }, status=400)
-            # --- End of Conflict Detection ---
 
             agendamento = form.save(commit=False)
             agendamento.criado_por = request.user
@@ -1962,6 +2078,159 @@ def create_agendamento(request):
         return JsonResponse({'status': 'error', 'message': str(e)}, status=500)
 
 
+@login_required
+@require_POST
+def materializar_ocorrencia_api(request, serie_id):
+    """
+    Grava uma ocorrência calculada de uma série como agendamento próprio, para
+    que possa ser editada, movida ou cancelada. Recebe {'ocorrencia': início ISO}
+    e devolve o id do agendamento (o mesmo, se já estava gravada).
+    """
+    try:
+        serie = get_object_or_404(SerieAgendamento, pk=serie_id)
+        user = request.user
+        if user.role == 'consultor' and serie.responsavel_id != user.pk:
+            return JsonResponse({'status': 'error', 'message': 'Permission denied.'}, status=403)
+        if user.role == 'gerente' and (not user.loja or serie.loja_id != user.loja_id):
+            return JsonResponse({'status': 'error', 'message': 'Permission denied.'}, status=403)
+
+        ocorrencia = recurrence.parse_occurrence(serie, json.loads(request.body).get('ocorrencia'))
+        if ocorrencia is None:
+            return JsonResponse({'status': 'error', 'message': 'Ocorrência inválida para esta série.'}, status=400)
+        agendamento = recurrence.materialize(serie, *ocorrencia)
+        return JsonResponse({'status': 'success', 'id': agendamento.pk})
+    except Exception as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=500)
+
+
+@login_required
+def salas_livres_api(request):
+    """
+    API com os horários livres de cada sala para uma duração mínima.
+    Parâmetros: data (AAAA-MM-DD, padrão hoje), duracao (minutos, padrão 60),
+    periodo ('dia' ou 'semana', a partir de data) e sala (opcional, repetível).
+    """
+    try:
+        data_str = request.GET.get('data')
+        dia = datetime.strptime(data_str, '%Y-%m-%d').date() if data_str else timezone.localdate()
+        duracao = int(request.GET.get('duracao', 60))
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'Parâmetros inválidos.'}, status=400)
+    if duracao <= 0:
+        return JsonResponse({'status': 'error', 'message': 'A duração deve ser positiva.'}, status=400)
+
+    dias = 7 if request.GET.get('periodo') == 'semana' else 1
+    salas_validas = set(availability.salas())
+    salas = [sala for sala in request.GET.getlist('sala') if sala in salas_validas] or None
+
+    livres, sobrepostos = availability.free_slots(dia, dias, timedelta(minutes=duracao), salas)
+    return JsonResponse({
+        'status': 'success',
+        'data': dia.isoformat(),
+        'dias': dias,
+        'duracao': duracao,
+        'salas': [
+            {
+                'sala': sala,
+                'livres': [
+                    {'inicio': timezone.localtime(inicio).isoformat(), 'fim': timezone.localtime(fim).isoformat()}
+                    for inicio, fim in slots
+                ],
+            }
+            for sala, slots in livres.items()
+        ],
+        # Existing double bookings in the period, so reception can fix them
+        'sobreposicoes': [{'sala': sala, 'agendamentos': [a, b]} for sala, a, b in sobrepostos],
+    })
+
+
+@login_required
+async def agenda_stream(request):
+    """
+    Fluxo Server-Sent Events com as alterações da agenda (criação, edição,
+    exclusão, status, conveniência e sala limpa). Deve ser servido pela
+    aplicação ASGI (backend.asgi); com REALTIME_SSE_ENABLED desligado responde
+    204, o que encerra o EventSource.
+    """
+    if not getattr(settings, 'REALTIME_SSE_ENABLED', False):
+        return HttpResponse(status=204)
+    response = StreamingHttpResponse(
+        realtime.agenda_stream(request.headers.get('Last-Event-ID')), content_type='text/event-stream'
+    )
+    response['Cache-Control'] = 'no-cache'
+    # Disables proxy buffering (nginx) so events are flushed immediately
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@login_required
+def agenda_sync_api(request):
+    """
+    Sincronização incremental da agenda.
+    Parâmetros: inicio e fim (AAAA-MM-DD, inclusivos; padrão hoje) e desde (token
+    devolvido pela chamada anterior). Sem token, devolve todos os eventos da
+    janela; sem alterações depois do token, responde 304 sem corpo.
+    """
+    desde = request.GET.get('desde')
+    since = agenda.parse_token(desde) if desde else None
+    if since is not None and not agenda.changed_since(since):
+        return HttpResponse(status=304)
+    # Taken before the events so a change made meanwhile shows up in the next sync
+    token = agenda.sync_token()
+
+    try:
+        hoje = timezone.localdate()
+        inicio_str, fim_str = request.GET.get('inicio'), request.GET.get('fim')
+        inicio = datetime.strptime(inicio_str, '%Y-%m-%d').date() if inicio_str else hoje
+        fim = datetime.strptime(fim_str, '%Y-%m-%d').date() if fim_str else inicio
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'Parâmetros inválidos.'}, status=400)
+    tz = timezone.get_current_timezone()
+    start = timezone.make_aware(datetime.combine(inicio, datetime.min.time()), tz)
+    end = timezone.make_aware(datetime.combine(fim + timedelta(days=1), datetime.min.time()), tz)
+
+    if since is None:
+        payload = {'completo': True, 'eventos': agenda.snapshot(start, end), 'removidos': []}
+    else:
+        alterados, removidos = agenda.changes_since(since, start, end)
+        payload = {
+            'completo': False, 'eventos': alterados, 'removidos': removidos,
+            # Series occurrences are not sent one by one: the client reloads the window
+            'series_alteradas': agenda.series_changed_since(since),
+        }
+    return JsonResponse({'status': 'success', 'token': token, **payload})
+
+
+@login_required
+def ocupacao_api(request):
+    """
+    API com a grade de ocupação das salas (planta e visão mensal).
+    Parâmetros: inicio e fim (AAAA-MM-DD, inclusivos; padrão hoje), resolucao
+    (minutos por faixa, padrão 15) e formato ('rle' ou 'bitmap').
+    """
+    try:
+        hoje = timezone.localdate()
+        inicio_str, fim_str = request.GET.get('inicio'), request.GET.get('fim')
+        inicio = datetime.strptime(inicio_str, '%Y-%m-%d').date() if inicio_str else hoje
+        fim = datetime.strptime(fim_str, '%Y-%m-%d').date() if fim_str else inicio
+        resolucao = int(request.GET.get('resolucao', 15))
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'Parâmetros inválidos.'}, status=400)
+    dias = (fim - inicio).days + 1
+    if dias <= 0 or dias > availability.MAX_GRID_DAYS:
+        return JsonResponse({
+            'status': 'error', 'message': f'O período deve ter entre 1 e {availability.MAX_GRID_DAYS} dias.'
+        }, status=400)
+    if resolucao not in availability.GRID_RESOLUTIONS:
+        return JsonResponse({'status': 'error', 'message': 'Resolução inválida.'}, status=400)
+    formato = 'bitmap' if request.GET.get('formato') == 'bitmap' else 'rle'
+
+    # Taken before the grid so a change made meanwhile shows up in the next sync
+    token = agenda.sync_token()
+    grade = availability.occupancy_grid(inicio, dias, resolucao, formato)
+    return JsonResponse({'status': 'success', 'token': token, **grade})
+
+
 @login_required
 @require_POST
 def update_agendamento_status(request, pk):
@@ -1973,6 +2242,14 @@ def update_agendamento_status(request, pk):
         if new_status not in [choice[0] for choice in Agendamento.STATUS_CHOICES]:
             return JsonResponse({'status': 'error', 'message': 'Status inválido.'}, status=400)
 
+        # Reactivating a cancelled booking takes the room again
+        if new_status in availability.BLOCKING_STATUSES and agendamento.status not in availability.BLOCKING_STATUSES:
+            conflicts = availability.find_conflicts(
+                agendamento.sala, agendamento.horario_inicio, agendamento.horario_fim, exclude_id=agendamento.pk
+            )
+            if conflicts:
+                return JsonResponse({'status': 'error', 'message': availability.conflict_message(conflicts)}, status=400)
+
         agendamento.status = new_status
         agendamento.save()
         return JsonResponse({'status': 'success', 'message': 'Status atualizado com sucesso.'})
@@ -1991,11 +2268,13 @@ def facilitis_conveniencia_view(request):
     
     title = f"Pedidos de Hoje, {today.strftime('%d/%m/%Y')}"
     agendamentos = Agendamento.objects.none()
+    periodo = (today, today)
 
     if view_type == 'week':
         start_of_week = today - timedelta(days=today.weekday())
         end_of_week = start_of_week + timedelta(days=6)
         title = f"Pedidos da Semana ({start_of_week.strftime('%d/%m')} - {end_of_week.strftime('%d/%m')})"
+        periodo = (start_of_week, end_of_week)
         agendamentos = Agendamento.objects.filter(
             conveniencia=True,
             horario_inicio__date__range=[start_of_week, end_of_week]
@@ -2003,6 +2282,7 @@ def facilitis_conveniencia_view(request):
     
     elif view_type == 'month':
         title = f"Pedidos de {today.strftime('%B de %Y')}"
+        periodo = (today.replace(day=1), today.replace(day=calendar.monthrange(today.year, today.month)[1]))
         agendamentos = Agendamento.objects.filter(
             conveniencia=True,
             horario_inicio__year=today.year,
@@ -2015,14 +2295,65 @@ def facilitis_conveniencia_view(request):
             horario_inicio__date=today
         ).order_by('horario_inicio')
 
+    # Comandas come pre-rendered from the cache; the orders missing from it are read in one query
+    agendamentos = conveniencia.attach_comandas(list(
+        agendamentos.select_related('loja', 'cliente', 'especificador').defer('conveniencia_pedido')
+    ))
+
     context = {
         'agendamentos': agendamentos,
         'view_type': view_type,
         'title': title,
+        'periodo_inicio': periodo[0],
+        'periodo_fim': periodo[1],
+        'agenda_token': agenda.sync_token(),
     }
     return render(request, 'facilitis_conveniencia.html', context)
 
 
+@login_required
+def producao_conveniencia_api(request):
+    """
+    Resumo de produção da copa: quantidade de cada item por período.
+    Parâmetros: inicio e fim (AAAA-MM-DD, inclusivos; padrão hoje) e agrupar
+    ('dia', 'semana' ou 'horario').
+    """
+    if request.user.role not in ('facilitis', 'administrador'):
+        return JsonResponse({'status': 'error', 'message': 'Permission denied.'}, status=403)
+    try:
+        hoje = timezone.localdate()
+        inicio_str, fim_str = request.GET.get('inicio'), request.GET.get('fim')
+        inicio = datetime.strptime(inicio_str, '%Y-%m-%d').date() if inicio_str else hoje
+        fim = datetime.strptime(fim_str, '%Y-%m-%d').date() if fim_str else inicio
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'Parâmetros inválidos.'}, status=400)
+    agrupar = request.GET.get('agrupar', 'dia')
+    if agrupar not in conveniencia.AGRUPAMENTOS or fim < inicio:
+        return JsonResponse({'status': 'error', 'message': 'Parâmetros inválidos.'}, status=400)
+
+    tz = timezone.get_current_timezone()
+    start = timezone.make_aware(datetime.combine(inicio, datetime.min.time()), tz)
+    end = timezone.make_aware(datetime.combine(fim + timedelta(days=1), datetime.min.time()), tz)
+    rows = conveniencia.production_summary(start, end, agrupar)
+
+    periodos = {}
+    totais = defaultdict(int)
+    for row in rows:
+        periodo = row['periodo'].isoformat()
+        periodos.setdefault(periodo, []).append(
+            {'item': row['item'], 'quantidade': row['quantidade'], 'pedidos': row['pedidos']}
+        )
+        totais[row['item']] += row['quantidade']
+    return JsonResponse({
+        'status': 'success',
+        'inicio': inicio.isoformat(),
+        'fim': fim.isoformat(),
+        'agrupamento': agrupar,
+        'periodos': [{'periodo': periodo, 'itens': itens} for periodo, itens in periodos.items()],
+        'totais': [{'item': item, 'quantidade': quantidade} for item, quantidade in sorted(totais.items())],
+    })
+
+
 @login_required
 @require_POST
 def update_conveniencia_status(request, pk):
@@ -2047,12 +2378,16 @@ def get_agendamento_details_api(request, pk):
         'responsavel': agendamento.responsavel.id if agendamento.responsavel else '',
         'cliente': agendamento.cliente.id if agendamento.cliente else '',
         'especificador': agendamento.especificador.id if agendamento.especificador else '',
+        'cliente_nome': agendamento.cliente.nome_completo if agendamento.cliente else 'N/A',
+        'responsavel_nome': agendamento.responsavel.get_full_name() if agendamento.responsavel else 'N/A',
         'sala': agendamento.sala,
         'horario_inicio': agendamento.horario_inicio,
         'horario_fim': agendamento.horario_fim,
         'quantidade_convidados': agendamento.quantidade_convidados,
         'motivo': agendamento.motivo,
+        'motivo_display': agendamento.get_motivo_display(),
         'status': agendamento.status,
+        'status_display': agendamento.get_status_display(),
         'conveniencia': agendamento.conveniencia,
         'conveniencia_pedido': agendamento.conveniencia_pedido,
     }
@@ -2087,6 +2422,16 @@ def update_agendamento_api(request, pk):
         form = AgendamentoForm(data, instance=agendamento)
         
         if form.is_valid():
+            if agendamento.status in availability.BLOCKING_STATUSES:
+                conflicts = availability.find_conflicts(
+                    form.cleaned_data['sala'], form.cleaned_data['horario_inicio'], form.cleaned_data['horario_fim'],
+                    exclude_id=agendamento.pk,
+                )
+                if conflicts:
+                    return JsonResponse({
+                        'status': 'error',
+                        'errors': {'__all__': [availability.conflict_message(conflicts)]}
+                    }, status=400)
             agendamento = form.save()
             return JsonResponse({'status': 'success'})
         else:
@@ -2114,6 +2459,11 @@ def delete_agendamento_api(request, pk):
         if permission_denied:
             return JsonResponse({'status': 'error', 'message': 'Permission denied.'}, status=403)
             
+        if agendamento.serie_id:
+            # Deleting the exception would bring the computed occurrence back
+            agendamento.status = 'cancelado'
+            agendamento.save()
+            return JsonResponse({'status': 'success', 'message': 'Ocorrência cancelada.'})
         agendamento.delete()
         return JsonResponse({'status': 'success', 'message': 'Agendamento excluído com sucesso.'})
     except Exception as e: